@@ -0,0 +1,259 @@
+"""
+Micro-benchmarks of the functions in `data_preparation` and `model`.
+
+Each function is timed on synthetic data of the given sizes. The results can
+be saved as JSON and compared with the results of a previous run.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --sizes 10000 100000
+    python -m benchmarks.bench_pipeline --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import re
+import statistics
+import time
+from functools import cached_property
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from data_preparation import (
+    deduplicate_data_by_dgkod,
+    drop_id_from_data,
+    preprocess_data,
+)
+from data_preparation.preprocess_data import (
+    _fill_diagnoses_target_col,
+    date_to_year,
+    diagnosis_to_number,
+    fix_dgkod_target_col,
+    forward_fill_ids,
+    transform_dg_codes_to_num,
+    update_target_col,
+)
+from lib import DATA_COLUMNS as DC
+from lib import check_data_columns
+from lib.synthetic_data import generate_raw_data
+from model import predict, train
+from model.explain import DEFAULT_TOP_K, predict_proba_with_contributions
+from model.predict import predict_proba
+
+DEFAULT_SIZES = [10_000, 100_000]
+
+
+class Inputs:
+    """
+    Inputs of the benchmarked functions for data of the given size.
+    Each input is the output of the previous pipeline step, computed once.
+    """
+
+    def __init__(self, n_rows: int, seed: int):
+        self.n_rows = n_rows
+        self.seed = seed
+
+    @cached_property
+    def raw(self) -> pd.DataFrame:
+        return generate_raw_data(self.n_rows, self.seed)
+
+    @cached_property
+    def selected(self) -> pd.DataFrame:
+        return self.raw[list(DC.values())]
+
+    @cached_property
+    def filled(self) -> pd.DataFrame:
+        return forward_fill_ids(self.selected)
+
+    @cached_property
+    def with_year(self) -> pd.DataFrame:
+        return date_to_year(self.filled)
+
+    @cached_property
+    def fixed_target(self) -> pd.DataFrame:
+        return fix_dgkod_target_col(self.with_year)
+
+    @cached_property
+    def updated_target(self) -> pd.DataFrame:
+        return update_target_col(self.with_year)
+
+    @cached_property
+    def preprocessed(self) -> pd.DataFrame:
+        return preprocess_data(self.raw)
+
+    @cached_property
+    def training_data(self) -> pd.DataFrame:
+        return drop_id_from_data(self.preprocessed)[0]
+
+    @cached_property
+    def features(self) -> pd.DataFrame:
+        assert hasattr(DC, "target")
+        return self.training_data.drop(DC.target, axis=1)
+
+    @cached_property
+    def model(self):
+        return train(self.training_data)
+
+
+def _nor_diagnosis_to_number(inputs: Inputs) -> pd.Series:
+    assert hasattr(DC, "nor_diagnosis")
+    return diagnosis_to_number(inputs.updated_target[DC.nor_diagnosis])
+
+
+# Benchmarked functions by name, called with the inputs
+BENCHMARKS: dict[str, Callable[[Inputs], object]] = {
+    "lib.check_data_columns": lambda i: check_data_columns(i.raw),
+    "forward_fill_ids": lambda i: forward_fill_ids(i.selected),
+    "date_to_year": lambda i: date_to_year(i.filled),
+    "fix_dgkod_target_col": lambda i: fix_dgkod_target_col(i.with_year),
+    "_fill_diagnoses_target_col": lambda i: _fill_diagnoses_target_col(
+        i.fixed_target
+    ),
+    "update_target_col": lambda i: update_target_col(i.with_year),
+    "diagnosis_to_number": _nor_diagnosis_to_number,
+    "transform_dg_codes_to_num": lambda i: transform_dg_codes_to_num(
+        i.updated_target
+    ),
+    "preprocess_data": lambda i: preprocess_data(i.raw),
+    "deduplicate_data_by_dgkod": lambda i: deduplicate_data_by_dgkod(
+        i.preprocessed
+    ),
+    "drop_id_from_data": lambda i: drop_id_from_data(i.preprocessed),
+    "model.train": lambda i: train(i.training_data),
+    "model.predict": lambda i: predict(i.model, i.features),
+    # The overhead of the contributions is the difference of the two
+    "model.predict_proba": lambda i: predict_proba(i.model, i.features),
+    "model.predict_proba_explained": lambda i: (
+        predict_proba_with_contributions(i.model, i.features, DEFAULT_TOP_K)
+    ),
+}
+
+
+def time_function(
+    func: Callable[[Inputs], object], inputs: Inputs, repeat: int
+) -> list[float]:
+    """Time the function `repeat` times, its inputs are computed before"""
+    # Warm up and compute the inputs
+    func(inputs)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(inputs)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(
+    sizes: list[int], repeat: int, seed: int, pattern: str | None
+) -> list[dict]:
+    """
+    Run the benchmarks matching the pattern for each size.
+
+    Returns:
+        list[dict]
+            Result of each benchmark and size
+    """
+    results = []
+    for n_rows in sizes:
+        inputs = Inputs(n_rows, seed)
+        for name, func in BENCHMARKS.items():
+            if pattern is not None and not re.search(pattern, name):
+                continue
+
+            times = time_function(func, inputs, repeat)
+            result = {
+                "name": name,
+                "rows": n_rows,
+                "min_s": min(times),
+                "median_s": statistics.median(times),
+                "rows_per_s": n_rows / min(times),
+            }
+            results.append(result)
+            print(
+                f"{name:<30} {n_rows:>10} {result['min_s']:>10.4f}"
+                f" {result['median_s']:>10.4f} {result['rows_per_s']:>14,.0f}",
+                flush=True,
+            )
+
+    return results
+
+
+def compare(results: list[dict], baseline_path: Path) -> None:
+    """Print the speedup of the results against the baseline results"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (result["name"], result["rows"]): result
+            for result in json.load(f)["results"]
+        }
+
+    print(f"\nComparison with {baseline_path}:")
+    print(
+        f"{'Function':<30} {'Rows':>10} {'Before':>10}"
+        f" {'After':>10} {'Speedup':>8}"
+    )
+    for result in results:
+        before = baseline.get((result["name"], result["rows"]))
+        if before is None:
+            continue
+        print(
+            f"{result['name']:<30} {result['rows']:>10}"
+            f" {before['min_s']:>10.4f} {result['min_s']:>10.4f}"
+            f" {before['min_s'] / result['min_s']:>7.2f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help=f"Numbers of rows of the data (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "-k", "--pattern", help="Run only functions matching the regex"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Save the results to the JSON file"
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="Compare with results in the JSON file"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'Function':<30} {'Rows':>10} {'Min [s]':>10}"
+        f" {'Median [s]':>10} {'Rows/s':>14}"
+    )
+    results = run(args.sizes, args.repeat, args.seed, args.pattern)
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "machine": platform.machine(),
+                    "repeat": args.repeat,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Write a synthetic raw LPZ/NOR extract to a CSV file.
+
+Run from the repository root:
+    python -m benchmarks.generate_data 1000000 data/synthetic/raw_1M.csv
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from lib.synthetic_data import CHUNK_ROWS, write_raw_csv
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("rows", type=int, help="Number of rows to generate")
+    parser.add_argument("output", type=Path, help="Path to the CSV file")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help="Number of rows generated at once",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_raw_csv(args.output, args.rows, args.seed, args.chunk_rows)
+    print(
+        f"Generated {args.rows} rows to {args.output}"
+        f" in {time.perf_counter() - start:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Equivalence and speed of the Polars backend against the pandas backend.
+
+`preprocess_data` and `deduplicate_data_by_dgkod` are run with both
+backends on synthetic data and on edge cases. The results must be equal,
+the script fails otherwise. The run times of both backends are compared.
+
+Run from the repository root (needs Polars installed):
+    python -m benchmarks.polars_backend --sizes 10000 100000
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable
+
+import pandas as pd
+
+from data_preparation import deduplicate_data_by_dgkod, preprocess_data
+from data_preparation.polars_backend import check_backend
+from lib import DATA_COLUMNS as DC
+from lib.synthetic_data import generate_raw_data
+
+DEFAULT_SIZES = [10_000, 100_000]
+
+
+def edge_cases(seed: int) -> dict[str, pd.DataFrame]:
+    """Raw data with the cases the backends could differ in"""
+    assert hasattr(DC, "patient_id")
+    assert hasattr(DC, "date_of_diagnosis")
+    assert hasattr(DC, "target")
+
+    data = generate_raw_data(1000, seed)
+
+    datetime_dates = data.copy()
+    datetime_dates[DC.date_of_diagnosis] = pd.to_datetime(
+        datetime_dates[DC.date_of_diagnosis]
+    )
+
+    # Formats pandas infers from the first date, the others are invalid
+    dates = pd.to_datetime(data[DC.date_of_diagnosis], errors="coerce")
+    dotted_dates = data.copy()
+    dotted_dates[DC.date_of_diagnosis] = dates.dt.strftime("%d.%m.%Y")
+    slashed_dates = data.copy()
+    slashed_dates[DC.date_of_diagnosis] = dates.dt.strftime("%m/%d/%Y")
+    mixed_dates = data.copy()
+    mixed_dates[DC.date_of_diagnosis] = dotted_dates[
+        DC.date_of_diagnosis
+    ].where(data.index % 2 == 0, slashed_dates[DC.date_of_diagnosis])
+
+    float_ids = data.copy()
+    float_ids[DC.patient_id] = float_ids[DC.patient_id].astype(float)
+
+    string_ids = data.copy()
+    string_ids[DC.patient_id] = [
+        f"P{patient_id}" if pd.notna(patient_id) else None
+        for patient_id in data[DC.patient_id]
+    ]
+
+    no_targets = data.copy()
+    no_targets[DC.target] = None
+
+    return {
+        "synthetic": data,
+        "1 row": data.head(1),
+        # Codes used to be padded per column, which differed for 3 rows
+        "3 rows": data.head(3),
+        "datetime dates": datetime_dates,
+        "dd.mm.yyyy dates": dotted_dates,
+        "mm/dd/yyyy dates": slashed_dates,
+        "mixed date formats": mixed_dates,
+        "float IDs": float_ids,
+        "string IDs": string_ids,
+        "no targets": no_targets,
+        "not default index": data.set_axis(data.index * 2 + 7),
+    }
+
+
+def check_equal(name: str, data: pd.DataFrame) -> bool:
+    """Check both backends give the same results, print the difference"""
+    try:
+        expected = preprocess_data(data)
+        pd.testing.assert_frame_equal(
+            preprocess_data(data, backend="polars"), expected
+        )
+        pd.testing.assert_frame_equal(
+            deduplicate_data_by_dgkod(expected, backend="polars"),
+            deduplicate_data_by_dgkod(expected),
+        )
+    except AssertionError as e:
+        print(f"FAIL {name}:\n{e}")
+        return False
+
+    print(f"ok   {name}")
+    return True
+
+
+def time_backends(
+    func: Callable[[str], object], repeat: int
+) -> dict[str, float]:
+    """Return the minimum run time of the function with each backend"""
+    times = {}
+    for backend in ("pandas", "polars"):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(backend)
+            runs.append(time.perf_counter() - start)
+        times[backend] = min(runs)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help=f"Numbers of rows of the data (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    check_backend("polars")
+
+    print("Equivalence with the pandas backend:")
+    passed = [
+        check_equal(name, data)
+        for name, data in edge_cases(args.seed).items()
+    ]
+    passed += [
+        check_equal(
+            f"synthetic {n_rows} rows, seed {seed}",
+            generate_raw_data(n_rows, seed),
+        )
+        for n_rows in args.sizes
+        for seed in (args.seed, args.seed + 1)
+    ]
+    if not all(passed):
+        sys.exit(f"{passed.count(False)} of {len(passed)} cases differ")
+
+    print(
+        f"\n{'Function':<28} {'Rows':>10} {'pandas [s]':>11}"
+        f" {'polars [s]':>11} {'Speedup':>8}"
+    )
+    for n_rows in args.sizes:
+        raw = generate_raw_data(n_rows, args.seed)
+        preprocessed = preprocess_data(raw)
+        benchmarks = {
+            "preprocess_data": lambda backend: preprocess_data(
+                raw, backend=backend
+            ),
+            "deduplicate_data_by_dgkod": lambda backend: (
+                deduplicate_data_by_dgkod(preprocessed, backend=backend)
+            ),
+        }
+        for name, func in benchmarks.items():
+            times = time_backends(func, args.repeat)
+            print(
+                f"{name:<28} {n_rows:>10} {times['pandas']:>11.4f}"
+                f" {times['polars']:>11.4f}"
+                f" {times['pandas'] / times['polars']:>7.2f}x",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Startup-time benchmark for the `lpz` entry point.
+
+Measures the import time of `cli.main` with `python -X importtime` and the
+wall time of `lpz -h`, and fails if either exceeds its budget or if a heavy
+dependency is imported before a subcommand needs it.
+
+Run from the repository root:
+    python -m benchmarks.startup_time
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Entry point module of the `lpz` command
+ENTRY_MODULE = "cli.main"
+
+# Packages that must not be imported just to parse the command line
+HEAVY_MODULES = (
+    "gui",
+    "numpy",
+    "pandas",
+    "sklearn",
+    "tkinter",
+    "ttkbootstrap",
+    "xgboost",
+)
+
+# Default budgets in milliseconds
+IMPORT_BUDGET_MS = 50.0
+HELP_BUDGET_MS = 250.0
+
+
+def parse_importtime(stderr: str) -> dict[str, float]:
+    """
+    Parse the output of `python -X importtime`.
+
+    Parameters:
+        stderr: str
+            Standard error output of the interpreter
+
+    Returns:
+        dict[str, float]
+            Cumulative import time in milliseconds of each imported module
+    """
+    times: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+
+    return times
+
+
+def measure_import(module: str) -> dict[str, float]:
+    """
+    Import the module in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        dict[str, float]
+            Cumulative import time in milliseconds of each imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure_help(repeat: int) -> list[float]:
+    """
+    Measure the wall time in milliseconds of `lpz -h` in a fresh interpreter.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", ENTRY_MODULE, "-h"],
+            capture_output=True,
+            check=True,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=IMPORT_BUDGET_MS,
+        help="Budget for importing the entry point in ms",
+    )
+    parser.add_argument(
+        "--help-budget",
+        type=float,
+        default=HELP_BUDGET_MS,
+        help="Budget for the wall time of `lpz -h` in ms (median)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of `lpz -h` runs"
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest imports to show"
+    )
+    args = parser.parse_args()
+
+    failures = []
+
+    import_times = measure_import(ENTRY_MODULE)
+    import_ms = import_times.get(ENTRY_MODULE, 0.0)
+    print(f"import {ENTRY_MODULE}: {import_ms:.1f} ms")
+    for name, ms in sorted(
+        import_times.items(), key=lambda item: item[1], reverse=True
+    )[: args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if import_ms > args.import_budget:
+        failures.append(
+            f"import of {ENTRY_MODULE} took {import_ms:.1f} ms"
+            f" (budget {args.import_budget:.1f} ms)"
+        )
+
+    heavy = sorted(
+        {name.split(".")[0] for name in import_times} & set(HEAVY_MODULES)
+    )
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {heavy}")
+
+    help_ms = statistics.median(measure_help(args.repeat))
+    print(f"lpz -h: {help_ms:.1f} ms (median of {args.repeat})")
+    if help_ms > args.help_budget:
+        failures.append(
+            f"`lpz -h` took {help_ms:.1f} ms"
+            f" (budget {args.help_budget:.1f} ms)"
+        )
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Throughput of the streaming prediction against the sequential prediction.
+
+A synthetic extract (20M rows by default) is generated once, a model is
+trained on a small synthetic sample, and the extract is predicted by
+`predict_file` (read all, preprocess all, predict all, write all) and by
+`stream_predict`. Each mode runs in a new process, so the peak memory of
+each is measured separately (Unix only). The predictions must be equal,
+the script fails otherwise.
+
+Run from the repository root:
+    python -m benchmarks.streaming_predict --rows 20000000
+"""
+
+import argparse
+import filecmp
+import logging
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None  # type: ignore[assignment]
+
+from lib.synthetic_data import generate_raw_data, write_raw_csv
+
+DEFAULT_ROWS = 20_000_000
+DEFAULT_WORK_DIR = Path("data", "benchmarks", "streaming")
+TRAIN_ROWS = 100_000
+
+
+def _peak_rss_mb() -> dict[str, float]:
+    """Peak memory of this process and of its finished children in MB"""
+    if resource is None:
+        return {}
+    # Kilobytes on Linux, bytes on macOS
+    unit = 2**20 if sys.platform == "darwin" else 2**10
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / unit,
+        "workers_peak_rss_mb": resource.getrusage(
+            resource.RUSAGE_CHILDREN
+        ).ru_maxrss
+        / unit,
+    }
+
+
+def _run_mode(
+    mode: str,
+    model_path: Path,
+    data_path: Path,
+    save_path: Path,
+    workers: int | None,
+    results: multiprocessing.Queue,
+) -> None:
+    """Predict the extract in the given mode (in a new process)"""
+    logging.disable(logging.INFO)
+    from model.pipeline import predict_file
+    from model.predict import load_model
+    from model.streaming import stream_predict
+
+    model = load_model(model_path)
+    start = time.perf_counter()
+    if mode == "sequential":
+        rows = len(predict_file(model, data_path, save_path))
+    else:
+        rows = stream_predict(model, data_path, save_path, workers=workers)
+    seconds = time.perf_counter() - start
+    results.put({"seconds": seconds, "rows": rows} | _peak_rss_mb())
+
+
+def run_mode(
+    mode: str,
+    model_path: Path,
+    data_path: Path,
+    save_path: Path,
+    workers: int | None,
+) -> dict:
+    """Run `_run_mode` in a new process and return its measurements"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(
+        target=_run_mode,
+        args=(mode, model_path, data_path, save_path, workers, results),
+    )
+    process.start()
+    result: dict = results.get()
+    process.join()
+    if process.exitcode != 0:
+        sys.exit(f"{mode} prediction failed")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=DEFAULT_ROWS,
+        help="Number of rows of the extract (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=DEFAULT_WORK_DIR,
+        help="Directory of the extract, the model and the predictions"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Preprocessing processes of the streaming prediction",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    data_path = Path(args.work_dir, f"raw_{args.rows}.csv")
+    if not data_path.exists():
+        print(f"Generating {args.rows} rows to {data_path}", flush=True)
+        write_raw_csv(data_path, args.rows, args.seed)
+
+    model_path = Path(args.work_dir, "model.json")
+    if not model_path.exists():
+        from data_preparation import drop_id_from_data, preprocess_data
+        from model import save_model, train
+
+        logging.disable(logging.INFO)
+        data = preprocess_data(generate_raw_data(TRAIN_ROWS, args.seed + 1))
+        save_model(train(drop_id_from_data(data)[0]), model_path)
+
+    save_paths = {
+        mode: Path(args.work_dir, f"predictions_{mode}.csv")
+        for mode in ("sequential", "streaming")
+    }
+    print(
+        f"{'Mode':<12} {'Rows':>10} {'Seconds':>9} {'Rows/s':>12}"
+        f" {'Peak MB':>9} {'Workers MB':>11}"
+    )
+    for mode, save_path in save_paths.items():
+        result = run_mode(
+            mode, model_path, data_path, save_path, args.workers
+        )
+        print(
+            f"{mode:<12} {result['rows']:>10} {result['seconds']:>9.1f}"
+            f" {result['rows'] / result['seconds']:>12,.0f}"
+            f" {result.get('peak_rss_mb', float('nan')):>9.0f}"
+            f" {result.get('workers_peak_rss_mb', float('nan')):>11.0f}",
+            flush=True,
+        )
+
+    if not filecmp.cmp(
+        save_paths["sequential"], save_paths["streaming"], shallow=False
+    ):
+        sys.exit("The streaming predictions differ from the sequential ones")
+    print("Predictions are equal")
+
+
+if __name__ == "__main__":
+    main()
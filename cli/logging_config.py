@@ -0,0 +1,104 @@
+"""
+Non-blocking logging configuration.
+
+The root logger only puts records into a queue. A `QueueListener` running in
+a background thread writes them to the console and to a rotating log file
+in the JSON lines format, so logging does not block the caller's thread.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+from pathlib import Path
+
+LOG_FORMAT = "%(levelname)s:%(name)s:%(asctime)s:%(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_DIR = Path("logs")
+LOG_FILE_NAME = "lpz-nor.jsonl"
+# Rotate the log file after 10 MB, keep 5 old files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Attributes of every `logging.LogRecord`, the rest are passed by `extra`
+_RECORD_ATTRIBUTES = set(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as JSON objects, one per line.
+    Fields passed to the logger by `extra` are added to the object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging(
+    log_dir: Path = LOG_DIR, level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """
+    Configure the root logger to log through a queue to the console and
+    to a rotating JSON lines file. The log directory is created if it does
+    not exist. The listener is stopped, and the queue flushed, at exit.
+
+    Parameters:
+        log_dir: Path
+            Directory to store the log file in
+        level: int
+            Logging level of the root logger
+
+    Returns:
+        logging.handlers.QueueListener
+            Started listener writing the records in a background thread
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        Path(log_dir, LOG_FILE_NAME),
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
@@ -1,42 +1,543 @@
 import argparse
 import logging
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
 
-import gui
+from cli.logging_config import LOG_DIR, setup_logging
 
-LOG_FORMAT = "%(levelname)s:%(name)s:%(asctime)s:%(message)s"
-LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
-
-logging.basicConfig(
-    level=logging.INFO,
-    format=LOG_FORMAT,
-    datefmt=LOG_DATE_FORMAT,
-    handlers=[
-        # Log to file and console
-        logging.FileHandler("logs/lpz-nor.log", mode="a"),
-        logging.StreamHandler(),
-    ],
-)
+# NOTE: Do not import heavy packages (gui, pandas, xgboost, ...) at module
+# level. They are imported only by the subcommands that need them, so that
+# `lpz -h` and short scripted invocations start fast.
+# See `benchmarks/startup_time.py` for the startup-time budget.
 
 logger = logging.getLogger(__name__)
 
+PROFILE_DIR = Path(LOG_DIR, "profiles")
+
+
+def profile_context(args: argparse.Namespace):
+    """
+    Return the `lib.profiling.profile` context if `--profile` is given,
+    else a context doing nothing.
+    """
+    if not args.profile:
+        return nullcontext()
+
+    from lib.profiling import profile
+
+    stem = f"{args.command}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    return profile(
+        trace_path=Path(args.profile_dir, f"{stem}.json"),
+        cprofile_path=(
+            Path(args.profile_dir, f"{stem}.prof") if args.cprofile else None
+        ),
+        trace_memory=not args.no_tracemalloc,
+    )
+
+
+def setup_runtime(args: argparse.Namespace) -> None:
+    """
+    Resolve the runtime limits and set the thread limits before NumPy
+    is imported by the subcommand.
+    """
+    from lib.runtime_config import (
+        apply_thread_limits,
+        load_runtime_config,
+        log_runtime_config,
+        set_runtime_config,
+    )
+
+    config = load_runtime_config(
+        args.config,
+        {
+            "threads": args.threads,
+            "blas_threads": args.blas_threads,
+            "workers": args.workers,
+            "memory_budget_mb": args.memory_budget_mb,
+        },
+    )
+    set_runtime_config(config)
+    apply_thread_limits(config)
+    log_runtime_config(config)
+
+
+def run_gui(args: argparse.Namespace) -> None:
+    """Run the application GUI"""
+    import gui
+
+    gui.run()
+    logger.info("GUI ran successfully!")
+
+
+def run_train(args: argparse.Namespace) -> None:
+    """Train the model on the raw data and save it"""
+    from model.pipeline import train_and_save
+    from model.train_cache import TrainCache
+
+    train_and_save(
+        args.data,
+        args.model,
+        matrix_cache=args.matrix_cache,
+        train_cache=(
+            TrainCache(args.train_cache) if args.train_cache else None
+        ),
+    )
+
+
+def run_predict(args: argparse.Namespace) -> None:
+    """Predict the raw data with the model and save the predictions"""
+    chunked = args.stream or args.checkpoint or args.resume
+    if chunked and (args.cache or args.explain):
+        raise SystemExit(
+            "--stream, --checkpoint and --resume cannot be combined with"
+            " --cache or --explain"
+        )
+    if args.stream and (args.checkpoint or args.resume):
+        raise SystemExit(
+            "--stream cannot be combined with --checkpoint or --resume"
+        )
+
+    if args.stream:
+        from model.streaming import stream_predict_from_csv
+
+        stream_predict_from_csv(args.model, args.data, args.output)
+        return
+
+    if args.checkpoint or args.resume:
+        from model.checkpoint import predict_checkpointed_from_csv
+
+        predict_checkpointed_from_csv(
+            args.model, args.data, args.output, resume=args.resume
+        )
+        return
+
+    from model.pipeline import predict_from_csv
+
+    predict_from_csv(
+        args.model,
+        args.data,
+        args.output,
+        cache_path=args.cache,
+        explain_top_k=args.explain,
+    )
+
+
+def run_compact(args: argparse.Namespace) -> None:
+    """Search for the smallest model within the AUC tolerance and save it"""
+    from model.compact import compact_model
+
+    compact_model(
+        args.model,
+        args.train_data,
+        args.valid_data,
+        args.output,
+        tolerance=args.tolerance,
+        depths=args.depths,
+        gammas=args.gammas,
+    )
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    """Predict all the data files in parallel"""
+    from model.batch import find_data_files, predict_batch
+
+    data_paths = find_data_files(args.data)
+    summary = predict_batch(
+        args.model, data_paths, args.output_dir, workers=args.workers
+    )
+    if (summary["status"] != "ok").any():
+        raise SystemExit(1)
+
+
+def run_watch(args: argparse.Namespace) -> None:
+    """Predict new data files arriving to the inbox"""
+    from model.watch import InboxWatcher
+
+    watcher = InboxWatcher(args.model, args.inbox, args.outbox, args.failed)
+    if args.once:
+        watcher.scan(wait_for_writes=False)
+    else:
+        watcher.run(args.interval)
+
+
+def run_validate(args: argparse.Namespace) -> None:
+    """Validate the raw data and report all the issues"""
+    from data_preparation import validate_data
+    from model.pipeline import read_data
+
+    report = validate_data(read_data(args.data))
+    print(report.describe())
+    if args.report is not None:
+        report.to_csv(args.report)
+        print(f"All issues saved to {args.report}")
+    if not report.ok:
+        raise SystemExit(1)
+
+
+def run_drift(args: argparse.Namespace) -> None:
+    """Compare the raw data with the training data of the model"""
+    from data_preparation import DataSketch, compare_sketches, preprocess_data
+    from data_preparation.drift import describe_drift
+    from model.pipeline import get_sketch_path, load_sketch, read_data
+
+    reference = load_sketch(args.model)
+    if reference is None:
+        sketch_path = get_sketch_path(args.model)
+        raise SystemExit(
+            f"No sketch of the training data at {sketch_path},"
+            " train the model again to save it"
+        )
+    sketch = DataSketch()
+    preprocess_data(read_data(args.data), sketch=sketch)
+    report = compare_sketches(reference, sketch)
+    print(describe_drift(report))
+    if args.report is not None:
+        report.to_csv(args.report, index=False)
+        print(f"Drift report saved to {args.report}")
+    if report["drifted"].any():
+        raise SystemExit(1)
+
+
+def run_shadow(args: argparse.Namespace) -> None:
+    """Score the data with several models side by side"""
+    from model.shadow import shadow_score
+
+    shadow_score(args.models, args.data, args.output_dir)
+
+
+def run_ingest(args: argparse.Namespace) -> None:
+    """Load the raw extracts into the SQLite store"""
+    from data_preparation.ingest import ingest_file
+    from lib.record_store import RecordStore
+
+    with RecordStore(args.db) as store:
+        for path in args.files:
+            ingest_file(
+                store, path, year=args.year, preprocess=not args.raw_only
+            )
+
 
 def main():
     parser = argparse.ArgumentParser(
         description="CLI tool for LPZ-NOR Decision System"
     )
 
-    # Add subcommand `run`
+    # Options shared by the subcommands running the pipeline
+    common_parser = argparse.ArgumentParser(add_help=False)
+    resources_group = common_parser.add_argument_group(
+        "resources",
+        "Limits override the config file (lpz.json or $LPZ_CONFIG)"
+        " and the LPZ_* environment variables",
+    )
+    resources_group.add_argument(
+        "--config", type=Path, default=None, help="JSON file with the limits"
+    )
+    resources_group.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="XGBoost threads per process (default: number of CPUs)",
+    )
+    resources_group.add_argument(
+        "--blas-threads",
+        type=int,
+        default=None,
+        help="BLAS/OpenMP threads (default: number of CPUs)",
+    )
+    resources_group.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Size of the worker pools (default: number of CPUs)",
+    )
+    resources_group.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=None,
+        help="Soft memory budget the chunk sizes are derived from"
+        " (default: half of the physical memory)",
+    )
+
+    profile_group = common_parser.add_argument_group("profiling")
+    profile_group.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the pipeline stages and save the JSON trace",
+    )
+    profile_group.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=PROFILE_DIR,
+        help=f"Directory to save the profile to (default: {PROFILE_DIR})",
+    )
+    profile_group.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="Also save cProfile statistics of the whole run",
+    )
+    profile_group.add_argument(
+        "--no-tracemalloc",
+        action="store_true",
+        help="Do not trace the peak memory of the stages (less overhead)",
+    )
+
+    # Add subcommands
     sub_parser = parser.add_subparsers(dest="command")
 
-    run_parser = sub_parser.add_parser("run", help="Run the application GUI")
+    run_parser = sub_parser.add_parser(
+        "run", help="Run the application GUI", parents=[common_parser]
+    )
+    run_parser.set_defaults(func=run_gui)
+
+    train_parser = sub_parser.add_parser(
+        "train",
+        help="Train the model and save it",
+        parents=[common_parser],
+    )
+    train_parser.add_argument("data", type=Path, help="Raw training data")
+    train_parser.add_argument(
+        "model", type=Path, help="Path to save the model to (JSON)"
+    )
+    train_parser.add_argument(
+        "--matrix-cache",
+        type=Path,
+        default=None,
+        help="Directory to cache the preprocessed feature matrix in;"
+        " retraining on the same data reuses it memory-mapped",
+    )
+    train_parser.add_argument(
+        "--train-cache",
+        type=Path,
+        default=None,
+        help="Directory of the trained models; training again on the same"
+        " data with the same settings copies the stored model",
+    )
+    train_parser.set_defaults(func=run_train)
+
+    predict_parser = sub_parser.add_parser(
+        "predict",
+        help="Predict data with the model",
+        parents=[common_parser],
+    )
+    predict_parser.add_argument("model", type=Path, help="Model (JSON)")
+    predict_parser.add_argument("data", type=Path, help="Raw data to predict")
+    predict_parser.add_argument(
+        "output", type=Path, help="Path to save the predictions to (CSV)"
+    )
+    predict_parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help="Prediction cache (SQLite); rows already predicted by the same"
+        " model are not predicted again",
+    )
+    predict_parser.add_argument(
+        "--explain",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Write the K features contributing the most (SHAP values)"
+        " next to each prediction; the cache is not used then",
+    )
+    predict_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read, preprocess, score and write large files in overlapped"
+        " chunks with bounded memory (writes only the predictions CSV)",
+    )
+    predict_parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Predict in numbered chunks, each saved when finished, so"
+        " a stopped run can be resumed (writes only the predictions CSV)",
+    )
+    predict_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a stopped --checkpoint run, skipping finished chunks",
+    )
+    predict_parser.set_defaults(func=run_predict)
+
+    batch_parser = sub_parser.add_parser(
+        "batch",
+        help="Predict all data files in a directory in parallel",
+        parents=[common_parser],
+    )
+    batch_parser.add_argument("model", type=Path, help="Model (JSON)")
+    batch_parser.add_argument(
+        "data",
+        help="Directory with CSV files or a quoted glob (e.g. 'data/*.csv')",
+    )
+    batch_parser.add_argument(
+        "output_dir",
+        type=Path,
+        help="Directory to save the predictions and the summary to",
+    )
+    batch_parser.set_defaults(func=run_batch)
+
+    # Defaults from `model.watch`, not imported here to start fast
+    watch_parser = sub_parser.add_parser(
+        "watch",
+        help="Predict new data files arriving to an inbox directory",
+        parents=[common_parser],
+    )
+    watch_parser.add_argument("model", type=Path, help="Model (JSON)")
+    watch_parser.add_argument(
+        "--inbox",
+        type=Path,
+        default=Path("data", "predict", "inbox"),
+        help="Directory to watch for CSV files (default: %(default)s)",
+    )
+    watch_parser.add_argument(
+        "--outbox",
+        type=Path,
+        default=Path("data", "predict", "outbox"),
+        help="Directory to save the predictions to (default: %(default)s)",
+    )
+    watch_parser.add_argument(
+        "--failed",
+        type=Path,
+        default=Path("data", "predict", "failed"),
+        help="Directory to save errors of failed files to"
+        " (default: %(default)s)",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Interval of scanning the inbox in seconds (default: %(default)s)",
+    )
+    watch_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Predict the files in the inbox once and exit",
+    )
+    watch_parser.set_defaults(func=run_watch)
+
+    validate_parser = sub_parser.add_parser(
+        "validate",
+        help="Check raw data and list every offending row",
+        parents=[common_parser],
+    )
+    validate_parser.add_argument("data", type=Path, help="Raw data (CSV)")
+    validate_parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Path to save all the issues to (CSV)",
+    )
+    validate_parser.set_defaults(func=run_validate)
+
+    drift_parser = sub_parser.add_parser(
+        "drift",
+        help="Check whether raw data look like the training data of a model",
+        parents=[common_parser],
+    )
+    drift_parser.add_argument("model", type=Path, help="Model (JSON)")
+    drift_parser.add_argument("data", type=Path, help="Raw data (CSV)")
+    drift_parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Path to save the drift report to (CSV)",
+    )
+    drift_parser.set_defaults(func=run_drift)
+
+    shadow_parser = sub_parser.add_parser(
+        "shadow",
+        help="Score data with several models on one preprocessed matrix",
+        parents=[common_parser],
+    )
+    shadow_parser.add_argument("data", type=Path, help="Raw data to predict")
+    shadow_parser.add_argument(
+        "output_dir",
+        type=Path,
+        help="Directory to save the predictions and the summary to",
+    )
+    shadow_parser.add_argument(
+        "models",
+        type=Path,
+        nargs="+",
+        help="Models (JSON), the first one is the reference",
+    )
+    shadow_parser.set_defaults(func=run_shadow)
+
+    compact_parser = sub_parser.add_parser(
+        "compact",
+        help="Find the smallest model with the validation AUC within"
+        " a tolerance",
+        parents=[common_parser],
+    )
+    compact_parser.add_argument(
+        "model", type=Path, help="Trained model (JSON)"
+    )
+    compact_parser.add_argument(
+        "train_data", type=Path, help="Raw training data (CSV)"
+    )
+    compact_parser.add_argument(
+        "valid_data", type=Path, help="Raw validation data (CSV)"
+    )
+    compact_parser.add_argument(
+        "output", type=Path, help="Path to save the compact model to (JSON)"
+    )
+    compact_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.005,
+        help="Maximum decrease of the validation AUC (default: %(default)s)",
+    )
+    compact_parser.add_argument(
+        "--depths",
+        type=int,
+        nargs="+",
+        default=[2, 3, 4, 5, 6],
+        help="Searched tree depths (default: %(default)s)",
+    )
+    compact_parser.add_argument(
+        "--gammas",
+        type=float,
+        nargs="+",
+        default=[0.0, 0.5, 1.0, 2.0, 5.0],
+        help="Searched pruning strengths, the minimum loss reduction of"
+        " a split (default: %(default)s)",
+    )
+    compact_parser.set_defaults(func=run_compact)
+
+    ingest_parser = sub_parser.add_parser(
+        "ingest",
+        help="Load raw extracts into the local SQLite store",
+        parents=[common_parser],
+    )
+    ingest_parser.add_argument(
+        "db", type=Path, help="SQLite store, created if it does not exist"
+    )
+    ingest_parser.add_argument(
+        "files", type=Path, nargs="+", help="Raw extracts (CSV or Excel)"
+    )
+    ingest_parser.add_argument(
+        "--year",
+        type=int,
+        default=None,
+        help="Year of the extracts (default: taken from data/<year>/)",
+    )
+    ingest_parser.add_argument(
+        "--raw-only",
+        action="store_true",
+        help="Do not store the preprocessed records",
+    )
+    ingest_parser.set_defaults(func=run_ingest)
 
     args = parser.parse_args()
 
-    if args.command == "run":
-        gui.run()
-        logger.info("GUI ran successfully!")
-    else:
+    if args.command is None:
         parser.print_help()
+        return
+
+    setup_logging()
+    setup_runtime(args)
+    with profile_context(args):
+        args.func(args)
 
 
 if __name__ == "__main__":
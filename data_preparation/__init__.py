@@ -1,9 +1,19 @@
+from data_preparation.compact_dtypes import compact_dtypes
+from data_preparation.dedup_index import DedupIndex
 from data_preparation.deduplicate_data import deduplicate_data_by_dgkod
+from data_preparation.drift import DataSketch, compare_sketches
 from data_preparation.drop_id import drop_id_from_data
 from data_preparation.preprocess_data import preprocess_data
+from data_preparation.validate_data import DataValidationError, validate_data
 
 __all__ = [
+    "compact_dtypes",
+    "compare_sketches",
+    "DataSketch",
+    "DataValidationError",
+    "DedupIndex",
     "deduplicate_data_by_dgkod",
     "drop_id_from_data",
     "preprocess_data",
+    "validate_data",
 ]
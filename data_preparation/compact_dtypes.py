@@ -0,0 +1,115 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from lib.column_names import DATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+assert hasattr(DATA_COLUMNS, "year")
+assert hasattr(DATA_COLUMNS, "target")
+
+# Dtypes of the preprocessed columns. The dtypes are fixed rather than
+# downcast per extract, so all extracts have the same schema.
+# Diagnosis codes are -1 to 1999 (see `diagnosis_to_number`)
+COMPACT_DTYPES: dict[str, np.dtype] = {
+    DATA_COLUMNS.lpz_diagnosis: np.dtype(np.int16),
+    DATA_COLUMNS.nor_diagnosis: np.dtype(np.int16),
+    DATA_COLUMNS.year: np.dtype(np.int16),
+    DATA_COLUMNS.target: np.dtype(np.int8),
+}
+# Dtype of the patient IDs, not downcast to fit the IDs of an extract
+ID_DTYPE = np.dtype(np.int64)
+
+
+def _fits(values: pd.Series, dtype: np.dtype) -> bool:
+    """Check the integer values can be cast to the dtype without overflow"""
+    if not pd.api.types.is_integer_dtype(values):
+        return False
+    info = np.iinfo(dtype)
+    return len(values) == 0 or (
+        values.min() >= info.min and values.max() <= info.max
+    )
+
+
+def compact_ids(ids: pd.Series) -> pd.Series:
+    """
+    Store the patient IDs with a fixed dtype, the same in every extract and
+    chunk: whole numbers (also read as floats) as `ID_DTYPE`. Other IDs
+    (e.g., strings or missing IDs) are left as they are.
+    """
+    if (
+        pd.api.types.is_numeric_dtype(ids)
+        and ids.notna().all()
+        and (ids % 1 == 0).all()
+    ):
+        return ids.astype(ID_DTYPE)
+    return ids
+
+
+def compact_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast the preprocessed columns to the narrowest safe dtypes:
+    int16 diagnosis codes and year, int8 target and int64 patient IDs.
+    Columns whose values do not fit the compact dtype are left as they are.
+
+    Parameters:
+        data: pd.DataFrame
+            Preprocessed data
+
+    Returns:
+        pd.DataFrame
+            Data with compact dtypes
+    """
+    assert hasattr(DATA_COLUMNS, "patient_id")
+
+    data = data.copy()
+    for col, dtype in COMPACT_DTYPES.items():
+        if col not in data.columns:
+            continue
+        if _fits(data[col], dtype):
+            data[col] = data[col].astype(dtype)
+        else:
+            logger.warning(
+                f"Values of column {col} do not fit {dtype},"
+                f" keeping {data[col].dtype}"
+            )
+
+    if DATA_COLUMNS.patient_id in data.columns:
+        data[DATA_COLUMNS.patient_id] = compact_ids(
+            data[DATA_COLUMNS.patient_id]
+        )
+
+    return data
+
+
+def memory_usage_report(before: pd.DataFrame, after: pd.DataFrame) -> str:
+    """
+    Return a report of the memory usage of each column before and after
+    changing the dtypes.
+    """
+    before_usage = before.memory_usage(deep=True, index=False)
+    after_usage = after.memory_usage(deep=True, index=False)
+
+    lines = [
+        f"{'Column':<12} {'Before':>10} {'After':>10}"
+        f" {'Before [MB]':>12} {'After [MB]':>12}"
+    ]
+    for col in after.columns:
+        lines.append(
+            f"{col:<12} {str(before[col].dtype):>10} {str(after[col].dtype):>10}"
+            f" {before_usage[col] / 1024**2:>12.2f}"
+            f" {after_usage[col] / 1024**2:>12.2f}"
+        )
+
+    total_before = before_usage.sum()
+    total_after = after_usage.sum()
+    lines.append(
+        f"{'Total':<12} {'':>10} {'':>10} {total_before / 1024**2:>12.2f}"
+        f" {total_after / 1024**2:>12.2f}"
+        f" ({total_before / max(total_after, 1):.1f}x smaller)"
+    )
+    return "\n".join(lines)
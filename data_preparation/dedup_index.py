@@ -0,0 +1,158 @@
+import logging
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from lib.column_names import DATA_COLUMNS
+from lib.record_store import insert_chunk_rows, to_sql_values
+from lib.timing import log_stage
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = "dedup_index"
+
+
+class DedupIndex:
+    """
+    Persistent index of the records kept by `deduplicate_data_by_dgkod`.
+
+    For each patient and NOR diagnosis, the index stores the target and the
+    year of the winning record of all the extracts seen so far. A new
+    extract is deduplicated against the index and the index is updated in
+    place, so the cost depends on the size of the new extract only.
+    The index is a table in a SQLite database, it can be kept in the
+    record store of `lpz ingest`.
+
+    Parameters:
+        db_path: Path
+            Path to the SQLite database, created if it does not exist
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+                " patient_id NOT NULL, diagnosis INTEGER NOT NULL,"
+                " year INTEGER NOT NULL, target INTEGER NOT NULL,"
+                " PRIMARY KEY (patient_id, diagnosis)) WITHOUT ROWID"
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "DedupIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return int(
+            self.connection.execute(
+                f"SELECT COUNT(*) FROM {INDEX_TABLE}"
+            ).fetchone()[0]
+        )
+
+    def update(
+        self, data: pd.DataFrame, id_col: str, year_col: str
+    ) -> pd.DataFrame:
+        """
+        Deduplicate the data against the index and update the index.
+
+        A record wins over the indexed one if it has a higher target, or the
+        same target and a later year, as in `deduplicate_data_by_dgkod`.
+        On a tie the indexed record is kept. Large extracts can be passed
+        in chunks, the index always holds the winners of all the chunks.
+
+        Parameters:
+            data: pd.DataFrame
+                Preprocessed data
+            id_col: str
+                Column with the patient IDs
+            year_col: str
+                Column with the year
+
+        Returns:
+            pd.DataFrame
+                Records of the data that are new winners, in the order
+                of the data
+
+        Raises:
+            ValueError: If a record has a missing ID, diagnosis, year or
+                target, the index is left unchanged
+        """
+        assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+        assert hasattr(DATA_COLUMNS, "target")
+
+        key_cols = [id_col, DATA_COLUMNS.nor_diagnosis]
+        # The index columns are NOT NULL, check before changing the index
+        missing = data[key_cols + [year_col, DATA_COLUMNS.target]].isna()
+        if missing.any(axis=None):
+            counts = missing.sum()
+            raise ValueError(
+                "Cannot deduplicate records with missing values against the"
+                " index, missing values per column: "
+                + ", ".join(f"{col}: {n}" for col, n in counts.items() if n)
+            )
+
+        # Winner of each key within the data, indexed by its position
+        candidates = data.reset_index(drop=True).sort_values(
+            [DATA_COLUMNS.target, year_col], ascending=False, kind="stable"
+        ).drop_duplicates(key_cols)
+
+        values = to_sql_values(
+            candidates[key_cols + [year_col, DATA_COLUMNS.target]]
+        )
+        with log_stage("dedup_index", rows=len(data)), self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS incoming"
+                " (pos INTEGER PRIMARY KEY, patient_id, diagnosis INTEGER,"
+                " year INTEGER, target INTEGER)"
+            )
+            self.connection.execute("DELETE FROM incoming")
+            chunk_rows = insert_chunk_rows()
+            for start in range(0, len(values), chunk_rows):
+                chunk = values.iloc[start : start + chunk_rows]
+                self.connection.executemany(
+                    "INSERT INTO incoming VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (start + i, *row)
+                        for i, row in enumerate(chunk.itertuples(index=False))
+                    ),
+                )
+
+            rows = self.connection.execute(
+                "SELECT i.pos, d.patient_id IS NULL FROM incoming AS i"
+                f" LEFT JOIN {INDEX_TABLE} AS d"
+                " ON d.patient_id = i.patient_id"
+                " AND d.diagnosis = i.diagnosis"
+                " WHERE d.patient_id IS NULL"
+                " OR (i.target, i.year) > (d.target, d.year)"
+            ).fetchall()
+
+            # `WHERE true` is needed by SQLite to parse the upsert
+            self.connection.execute(
+                f"INSERT INTO {INDEX_TABLE}"
+                " SELECT patient_id, diagnosis, year, target FROM incoming"
+                " WHERE true"
+                " ON CONFLICT (patient_id, diagnosis) DO UPDATE"
+                " SET year = excluded.year, target = excluded.target"
+                " WHERE (excluded.target, excluded.year) > (target, year)"
+            )
+            self.connection.execute("DELETE FROM incoming")
+
+        n_new = sum(is_new for _, is_new in rows)
+        logger.info(
+            f"Deduplicated {len(data)} records against the index:"
+            f" {n_new} new keys, {len(rows) - n_new} superseded,"
+            f" {len(candidates) - len(rows)} kept from the index"
+        )
+
+        winners = candidates.index[[pos for pos, _ in rows]]
+        return data.iloc[sorted(winners)]
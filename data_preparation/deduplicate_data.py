@@ -1,5 +1,6 @@
 import pandas as pd
 
+from data_preparation.dedup_index import DedupIndex
 from lib.column_names import DATA_COLUMNS
 
 
@@ -7,6 +8,8 @@ def deduplicate_data_by_dgkod(
     data: pd.DataFrame,
     id_col: str | None = None,
     year_col: str | None = None,
+    index: DedupIndex | None = None,
+    backend: str = "pandas",
 ) -> pd.DataFrame:
     """
     Deduplicate the data by the `DATA_COLUMNS.patient_id` and `DATA_COLUMNS.nor_diagnosis` columns.
@@ -15,6 +18,13 @@ def deduplicate_data_by_dgkod(
       - For each group, the record with the highest value in the `year_col` column is kept.
       - The rest of the records are removed. If the other records have different value in `TARGET_COL`,
         then the ones with the highest value in `TARGET_COL` are kept.
+
+    If the persistent `index` is given, the records are deduplicated also
+    against the records of the previous extracts and only the records that
+    win over them are returned, see `DedupIndex.update`.
+
+    With `backend="polars"` the same records are selected by a lazy Polars
+    query (needs Polars installed).
     """
     if id_col is None:
         # Add assert for mypy check
@@ -27,9 +37,25 @@ def deduplicate_data_by_dgkod(
     assert hasattr(DATA_COLUMNS, "target")
     assert hasattr(DATA_COLUMNS, "nor_diagnosis")
 
+    if index is not None:
+        return index.update(data, id_col, year_col)
+
+    if backend != "pandas":
+        # Imported only when used, Polars is an optional dependency
+        from data_preparation.polars_backend import (
+            check_backend,
+            deduplicate_polars,
+        )
+
+        check_backend(backend)
+        return deduplicate_polars(data, id_col, year_col)
+
     new_data: list[pd.DataFrame] = []
 
-    for _, group in data.groupby([id_col, DATA_COLUMNS.nor_diagnosis]):
+    # Observed only, IDs may be categorical
+    for _, group in data.groupby(
+        [id_col, DATA_COLUMNS.nor_diagnosis], observed=True
+    ):
         if len(group) == 1:
             new_data.append(group)
             continue
@@ -0,0 +1,311 @@
+"""
+Mergeable summaries (sketches) of the data for detecting data drift.
+
+A sketch is updated by `preprocess_data` with each preprocessed batch or
+chunk, so it costs no extra pass over the data, only the dates are parsed
+again to count the invalid ones. Sketches of chunks are
+merged by adding them. The sketch of the training data is saved with the
+model and compared with the sketch of the predicted data.
+
+The diagnosis codes of `diagnosis_to_number` are -1 to 1999, so the code
+frequencies are counted exactly in fixed-size histograms, which are smaller
+than a count-min sketch of the same accuracy.
+"""
+
+import json
+import logging
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_preparation.preprocess_data import number_to_diagnosis
+from lib.column_names import DATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+assert hasattr(DATA_COLUMNS, "patient_id")
+assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+assert hasattr(DATA_COLUMNS, "year")
+
+CODE_COLUMNS = [DATA_COLUMNS.nor_diagnosis, DATA_COLUMNS.lpz_diagnosis]
+# Codes -1 (missing) to 1999, counted at `code + 1`
+N_CODES = 2001
+# Patients with more rows are counted in the last bin
+MAX_ROWS_PER_PATIENT = 50
+
+# Population stability index above which a distribution has drifted
+PSI_DRIFT = 0.2
+# Rows of the new data below which the code histograms are not compared,
+# the stability index of ~2000 sparse bins is noise on smaller samples
+MIN_CODE_ROWS = 1000
+# Change of the missing date rate above which it has drifted
+MISSING_DATE_RATE_DRIFT = 0.05
+# Share of an empty bin in the stability index, to avoid log(0)
+_PSI_EPSILON = 1e-4
+REPORT_COLUMNS = ["metric", "reference", "current", "score", "drifted"]
+
+
+class DataSketch:
+    """
+    Counts of the data: rows, missing dates, years, diagnosis codes and rows
+    per patient. Patients split between two chunks are counted as two.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.missing_dates = 0
+        self.years: Counter = Counter()
+        self.codes = {col: np.zeros(N_CODES, np.int64) for col in CODE_COLUMNS}
+        # Number of patients by their number of rows
+        self.rows_per_patient = np.zeros(MAX_ROWS_PER_PATIENT + 1, np.int64)
+
+    def update(
+        self, data: pd.DataFrame, raw: pd.DataFrame | None = None
+    ) -> None:
+        """
+        Add the counts of the preprocessed data.
+
+        Parameters:
+            data: pd.DataFrame
+                Preprocessed data, the ID column is optional
+            raw: pd.DataFrame | None
+                Raw data the missing dates are counted in, if available.
+                Dates are counted as missing after the coercion of
+                `date_to_year`, so the invalid dates filled by the fill
+                year are counted too.
+        """
+        assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+        assert hasattr(DATA_COLUMNS, "year")
+        assert hasattr(DATA_COLUMNS, "patient_id")
+
+        self.rows += len(data)
+        if raw is not None:
+            dates = pd.to_datetime(
+                raw[DATA_COLUMNS.date_of_diagnosis], errors="coerce"
+            )
+            self.missing_dates += int(dates.isna().sum())
+        self.years.update(
+            {
+                int(year): int(count)
+                for year, count in data[DATA_COLUMNS.year]
+                .value_counts(sort=False)
+                .items()
+            }
+        )
+        for col in CODE_COLUMNS:
+            values = data[col].to_numpy().astype(np.int64) + 1
+            values = values[(values >= 0) & (values < N_CODES)]
+            self.codes[col] += np.bincount(values, minlength=N_CODES)
+        if DATA_COLUMNS.patient_id in data.columns:
+            sizes = data[DATA_COLUMNS.patient_id].value_counts(sort=False)
+            self.rows_per_patient += np.bincount(
+                np.minimum(sizes.to_numpy(), MAX_ROWS_PER_PATIENT),
+                minlength=MAX_ROWS_PER_PATIENT + 1,
+            )
+
+    def merge(self, other: "DataSketch") -> "DataSketch":
+        """Add the counts of the other sketch, return self"""
+        self.rows += other.rows
+        self.missing_dates += other.missing_dates
+        self.years.update(other.years)
+        for col in CODE_COLUMNS:
+            self.codes[col] += other.codes[col]
+        self.rows_per_patient += other.rows_per_patient
+        return self
+
+    @property
+    def patients(self) -> int:
+        return int(self.rows_per_patient.sum())
+
+    @property
+    def missing_date_rate(self) -> float:
+        return self.missing_dates / self.rows if self.rows else 0.0
+
+    def to_dict(self) -> dict:
+        """Return the sketch as a JSON-serializable dict, codes sparse"""
+        return {
+            "rows": self.rows,
+            "missing_dates": self.missing_dates,
+            "years": {str(year): count for year, count in self.years.items()},
+            "codes": {
+                col: {
+                    str(code - 1): int(counts[code])
+                    for code in np.flatnonzero(counts)
+                }
+                for col, counts in self.codes.items()
+            },
+            "rows_per_patient": self.rows_per_patient.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "DataSketch":
+        sketch = cls()
+        sketch.rows = values["rows"]
+        sketch.missing_dates = values["missing_dates"]
+        sketch.years = Counter(
+            {int(year): count for year, count in values["years"].items()}
+        )
+        for col, counts in values["codes"].items():
+            for code, count in counts.items():
+                sketch.codes[col][int(code) + 1] = count
+        sketch.rows_per_patient = np.array(
+            values["rows_per_patient"], np.int64
+        )
+        return sketch
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: Path) -> "DataSketch":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def population_stability_index(
+    reference: np.ndarray, current: np.ndarray
+) -> float:
+    """
+    Return the population stability index of two histograms with the same
+    bins, NaN if one of them is empty
+    """
+    if reference.sum() == 0 or current.sum() == 0:
+        return float("nan")
+    p = np.maximum(reference / reference.sum(), _PSI_EPSILON)
+    q = np.maximum(current / current.sum(), _PSI_EPSILON)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def _top_code(counts: np.ndarray) -> str:
+    """The most frequent code and its share"""
+    if counts.sum() == 0:
+        return "-"
+    code = int(np.argmax(counts))
+    return (
+        f"{number_to_diagnosis(code - 1) or 'missing'}"
+        f" {counts[code] / counts.sum():.1%}"
+    )
+
+
+def _year_range(sketch: DataSketch) -> str:
+    if not sketch.years:
+        return "-"
+    return f"{min(sketch.years)}-{max(sketch.years)}"
+
+
+def _mean_rows_per_patient(sketch: DataSketch) -> str:
+    if sketch.patients == 0:
+        return "-"
+    rows = np.dot(np.arange(MAX_ROWS_PER_PATIENT + 1), sketch.rows_per_patient)
+    return f"mean {rows / sketch.patients:.2f}"
+
+
+def compare_sketches(
+    reference: DataSketch, current: DataSketch
+) -> pd.DataFrame:
+    """
+    Compare the sketch of new data with the sketch of the training data.
+    The distributions are compared by the population stability index
+    (drifted above `PSI_DRIFT`), the missing date rate by its change.
+    The code histograms of new data with fewer than `MIN_CODE_ROWS` rows
+    are not compared, their score is NaN (inconclusive).
+
+    Parameters:
+        reference: DataSketch
+            Sketch of the training data
+        current: DataSketch
+            Sketch of the new data
+
+    Returns:
+        pd.DataFrame
+            Drift report with the columns `REPORT_COLUMNS`, one row per
+            metric
+    """
+    assert hasattr(DATA_COLUMNS, "year")
+
+    rows = []
+
+    years = sorted(set(reference.years) | set(current.years))
+    year_psi = population_stability_index(
+        np.array([reference.years[year] for year in years]),
+        np.array([current.years[year] for year in years]),
+    )
+    rows.append(
+        {
+            "metric": f"{DATA_COLUMNS.year} distribution",
+            "reference": _year_range(reference),
+            "current": _year_range(current),
+            "score": year_psi,
+        }
+    )
+
+    for col in CODE_COLUMNS:
+        if current.rows < MIN_CODE_ROWS:
+            current_codes = (
+                f"{_top_code(current.codes[col])}"
+                f" (inconclusive, {current.rows} rows)"
+            )
+            score = float("nan")
+        else:
+            current_codes = _top_code(current.codes[col])
+            score = population_stability_index(
+                reference.codes[col], current.codes[col]
+            )
+        rows.append(
+            {
+                "metric": f"{col} codes",
+                "reference": _top_code(reference.codes[col]),
+                "current": current_codes,
+                "score": score,
+            }
+        )
+
+    rows.append(
+        {
+            "metric": "rows per patient",
+            "reference": _mean_rows_per_patient(reference),
+            "current": _mean_rows_per_patient(current),
+            "score": population_stability_index(
+                reference.rows_per_patient, current.rows_per_patient
+            ),
+        }
+    )
+
+    report = pd.DataFrame(rows)
+    # NaN (an empty distribution or too few rows) is not a drift
+    report["drifted"] = report["score"] > PSI_DRIFT
+
+    missing_change = abs(
+        current.missing_date_rate - reference.missing_date_rate
+    )
+    missing = pd.DataFrame(
+        [
+            {
+                "metric": "missing date rate",
+                "reference": f"{reference.missing_date_rate:.2%}",
+                "current": f"{current.missing_date_rate:.2%}",
+                "score": missing_change,
+                "drifted": missing_change > MISSING_DATE_RATE_DRIFT,
+            }
+        ]
+    )
+    return pd.concat([report, missing], ignore_index=True)[REPORT_COLUMNS]
+
+
+def describe_drift(report: pd.DataFrame) -> str:
+    """Return the drift report as a compact text table"""
+    drifted = report.loc[report["drifted"], "metric"].tolist()
+    header = (
+        f"Data drift in: {', '.join(drifted)}"
+        if drifted
+        else "No data drift found"
+    )
+    return header + "\n" + str(
+        report.to_string(index=False, float_format="%.3f")
+    )
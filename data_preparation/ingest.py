@@ -0,0 +1,100 @@
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from data_preparation.compact_dtypes import compact_ids
+from data_preparation.preprocess_data import forward_fill_ids, preprocess_data
+from lib.column_names import DATA_COLUMNS
+from lib.record_store import RAW_TABLE, TABLE_COLUMNS, RecordStore
+from lib.timing import log_stage
+from lib.utils import file_hash
+
+logger = logging.getLogger(__name__)
+
+
+def read_extract(path: Path) -> pd.DataFrame:
+    """Read the raw extract from a CSV or an Excel file"""
+    with log_stage("read_extract") as stage:
+        if path.suffix in (".xlsx", ".xls"):
+            data = pd.read_excel(path)
+        else:
+            data = pd.read_csv(path)
+        stage.rows = len(data)
+    return data
+
+
+def _year_from_path(path: Path) -> int | None:
+    """Return the year of the extract in `data/<year>/`, if any"""
+    return int(path.parent.name) if path.parent.name.isdigit() else None
+
+
+def prepare_raw_records(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepare the raw data to be stored:
+      - The patient ID and the LPZ diagnosis are forward filled, so each
+        record is complete even when read without the previous rows.
+      - The year is taken from the date of diagnosis if it is missing.
+    """
+    assert hasattr(DATA_COLUMNS, "patient_id")
+    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+    assert hasattr(DATA_COLUMNS, "year")
+
+    data = forward_fill_ids(data)
+    data[DATA_COLUMNS.patient_id] = compact_ids(data[DATA_COLUMNS.patient_id])
+
+    date_year = pd.to_datetime(
+        data[DATA_COLUMNS.date_of_diagnosis], errors="coerce"
+    ).dt.year
+    if DATA_COLUMNS.year in data.columns:
+        data[DATA_COLUMNS.year] = data[DATA_COLUMNS.year].fillna(date_year)
+    else:
+        data[DATA_COLUMNS.year] = date_year
+    data[DATA_COLUMNS.year] = data[DATA_COLUMNS.year].astype("Int64")
+
+    return data[list(TABLE_COLUMNS[RAW_TABLE])]
+
+
+def ingest_file(
+    store: RecordStore,
+    path: Path,
+    year: int | None = None,
+    preprocess: bool = True,
+) -> bool:
+    """
+    Load the raw extract, and its preprocessed records, into the store.
+    Files with an already ingested content are skipped.
+
+    Parameters:
+        store: RecordStore
+            Store to load the records to
+        path: Path
+            Raw extract (CSV or Excel)
+        year: int | None
+            Year of the extract, taken from `data/<year>/` if None
+        preprocess: bool
+            Store also the preprocessed records
+
+    Returns:
+        bool
+            True if the file was ingested, False if skipped
+    """
+    digest = file_hash(path)
+    if store.find_source(digest) is not None:
+        logger.info(f"Skipping {path}, its content is already ingested")
+        return False
+
+    raw = prepare_raw_records(read_extract(path))
+    # The raw records have all the columns needed by the preprocessing
+    preprocessed = preprocess_data(raw) if preprocess else None
+
+    with log_stage("ingest", rows=len(raw)):
+        store.add_source(
+            path,
+            digest,
+            raw,
+            preprocessed,
+            year=year if year is not None else _year_from_path(path),
+        )
+    logger.info(f"Ingested {len(raw)} records of {path} to {store.db_path}")
+    return True
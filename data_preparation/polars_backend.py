@@ -0,0 +1,201 @@
+"""
+Polars backend of `preprocess_data` and `deduplicate_data_by_dgkod`.
+
+The steps run as one lazy Polars query, which is optimized and executed
+multithreaded. Data are passed in and returned as pandas, the results are
+the same as of the pandas implementation. Polars is an optional dependency,
+with PyArrow to convert the data from pandas:
+    pip install polars pyarrow
+"""
+
+import importlib.util
+
+import pandas as pd
+
+from data_preparation.preprocess_data import ICD_PATTERN_REGEX
+from lib.column_names import DATA_COLUMNS
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None  # type: ignore[assignment]
+
+BACKENDS = ("pandas", "polars")
+# Column with the positions of the rows in the input data
+_ROW_COL = "__row"
+
+
+def check_backend(backend: str) -> None:
+    """Raise an error if the backend is unknown or not installed"""
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown backend {backend}, expected one of {BACKENDS}"
+        )
+    if backend == "polars" and (
+        pl is None or importlib.util.find_spec("pyarrow") is None
+    ):
+        raise ImportError(
+            "The polars backend needs Polars and PyArrow, install them by"
+            " `pip install polars pyarrow`"
+        )
+
+
+def _pad_diagnoses(code: "pl.Expr") -> "pl.Expr":
+    """The same as `preprocess_data.pad_diagnoses`"""
+    return (
+        pl.when(code.str.len_chars() == 3)
+        .then(pl.concat_str([code, pl.lit("0")]))
+        .otherwise(code)
+    )
+
+
+def _diagnosis_to_number(col: str) -> "pl.Expr":
+    """The same as `preprocess_data.diagnosis_to_number`"""
+    code = _pad_diagnoses(pl.col(col).cast(pl.Utf8))
+    number = code.str.slice(1).cast(pl.Int64) + pl.when(
+        code.str.starts_with("D")
+    ).then(1000).otherwise(0)
+    return (
+        pl.when(pl.col(col).is_null() | (code == "-1"))
+        .then(-1)
+        .otherwise(number)
+        .alias(col)
+    )
+
+
+def preprocess_polars(
+    data: pd.DataFrame, fill_year: int | None = None
+) -> pd.DataFrame:
+    """
+    Run the steps of `preprocess_data` on Polars, without the validation
+    before and the compact dtypes after, which are shared by the backends.
+
+    Parameters:
+        data: pd.DataFrame
+            Raw data with the columns of `DATA_COLUMNS`
+        fill_year: int | None
+            Year of the missing dates, see `preprocess_data`
+
+    Returns:
+        pd.DataFrame
+            Preprocessed data, with the index of the raw data
+    """
+    assert hasattr(DATA_COLUMNS, "patient_id")
+    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+    assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+    assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+    assert hasattr(DATA_COLUMNS, "target")
+    assert hasattr(DATA_COLUMNS, "year")
+
+    columns = list(DATA_COLUMNS.values())
+    # Dates are parsed by pandas as in `date_to_year`, Polars infers other
+    # formats and would give other years of the dates pandas rejects
+    raw = data[columns].assign(
+        **{
+            DATA_COLUMNS.date_of_diagnosis: pd.to_datetime(
+                data[DATA_COLUMNS.date_of_diagnosis], errors="coerce"
+            )
+        }
+    )
+    target = pl.col(DATA_COLUMNS.target)
+    fill = (
+        pl.col(DATA_COLUMNS.year).min() - 10
+        if fill_year is None
+        else pl.lit(fill_year)
+    )
+    nor_diagnosis = pl.col(DATA_COLUMNS.nor_diagnosis)
+
+    query = (
+        pl.from_pandas(raw)
+        .lazy()
+        # `forward_fill_ids`
+        .with_columns(
+            pl.col(DATA_COLUMNS.patient_id).forward_fill(),
+            pl.col(DATA_COLUMNS.lpz_diagnosis).forward_fill(),
+        )
+        # `date_to_year`
+        .with_columns(
+            pl.col(DATA_COLUMNS.date_of_diagnosis)
+            .dt.year()
+            .alias(DATA_COLUMNS.year)
+        )
+        .with_columns(
+            pl.col(DATA_COLUMNS.year)
+            .fill_null(fill)
+            .cast(pl.Int64)
+        )
+        .drop(DATA_COLUMNS.date_of_diagnosis)
+        # `fix_dgkod_target_col`: the padded diagnosis in the target,
+        # or "0"
+        .with_columns(
+            _pad_diagnoses(
+                target.cast(pl.Utf8)
+                .str.strip_chars()
+                .str.extract(ICD_PATTERN_REGEX, 1)
+                .fill_null("0")
+            ),
+            _pad_diagnoses(nor_diagnosis.cast(pl.Utf8)),
+        )
+        # `update_target_col`
+        .with_columns(
+            (target == nor_diagnosis.cast(pl.Utf8))
+            .fill_null(False)
+            .cast(pl.Int64)
+        )
+        # `transform_dg_codes_to_num`
+        .with_columns(
+            _diagnosis_to_number(DATA_COLUMNS.nor_diagnosis),
+            _diagnosis_to_number(DATA_COLUMNS.lpz_diagnosis),
+        )
+        # Target column at the end
+        .select(
+            [col for col in columns if col != DATA_COLUMNS.date_of_diagnosis]
+        )
+        .select(pl.exclude(DATA_COLUMNS.target), target)
+    )
+
+    result = query.collect().to_pandas()
+    result.index = data.index
+    return result
+
+
+def deduplicate_polars(
+    data: pd.DataFrame, id_col: str, year_col: str
+) -> pd.DataFrame:
+    """
+    Run `deduplicate_data_by_dgkod` on Polars. Only the keys, the target
+    and the year are passed to Polars, the kept rows are selected from
+    the pandas data, so they keep their dtypes and index.
+    """
+    assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+    assert hasattr(DATA_COLUMNS, "target")
+
+    key_cols = [id_col, DATA_COLUMNS.nor_diagnosis]
+    columns = {
+        col: (
+            # Codes sort in the order of the categories, as in pandas
+            data[col].cat.codes.where(data[col].notna())
+            if isinstance(data[col].dtype, pd.CategoricalDtype)
+            else data[col]
+        )
+        for col in key_cols + [DATA_COLUMNS.target, year_col]
+    }
+
+    kept = (
+        pl.from_pandas(pd.DataFrame(columns).reset_index(drop=True))
+        .lazy()
+        .with_row_index(_ROW_COL)
+        # pandas `groupby` drops the missing keys
+        .drop_nulls(key_cols)
+        .sort(
+            [DATA_COLUMNS.target, year_col],
+            descending=True,
+            maintain_order=True,
+        )
+        .unique(key_cols, keep="first", maintain_order=True)
+        # The groups of pandas `groupby` are sorted by the keys
+        .sort(key_cols, maintain_order=True)
+        .select(_ROW_COL)
+        .collect()
+    )
+    return data.iloc[kept[_ROW_COL].to_numpy()]
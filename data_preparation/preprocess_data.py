@@ -1,68 +1,162 @@
+import logging
+from typing import TYPE_CHECKING
+
 import pandas as pd
 
+from data_preparation.compact_dtypes import compact_dtypes, memory_usage_report
+from data_preparation.validate_data import validate_data
 from lib import check_data_columns
 from lib.column_names import DATA_COLUMNS
+from lib.timing import log_stage
+
+if TYPE_CHECKING:
+    from data_preparation.drift import DataSketch
+
+logger = logging.getLogger(__name__)
 
 # Pattern for ICD-10 code
 ICD_PATTERN_REGEX = r"([DC]\d{2,3})"
 
 
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+def preprocess_data(
+    data: pd.DataFrame,
+    backend: str = "pandas",
+    fill_year: int | None = None,
+    sketch: "DataSketch | None" = None,
+) -> pd.DataFrame:
     """
     Preprocess data for the analysis
 
     Parameters:
         data: pd.DataFrame
             Raw data to be preprocessed
+        backend: str
+            "pandas", or "polars" to run the steps as a lazy Polars query
+            with the same results (needs Polars installed)
+        fill_year: int | None
+            Year of the missing or invalid dates, 10 years before the
+            minimum year of the data if None. Set when the data are a chunk
+            of a larger extract, see `date_to_year`.
+        sketch: DataSketch | None
+            Updated with the counts of the data, see `data_preparation.drift`
 
     Returns:
         pd.DataFrame
-            Preprocessed data
+            Preprocessed data with compact dtypes, see `compact_dtypes`
+
+    Raises:
+        DataValidationError: If the data have errors, with all the offending
+            rows, see `validate_data`
     """
     check_data_columns(data)
+    raw = data
+
+    # Fail before the heavy work with all the problems of the data
+    with log_stage("validate", rows=len(data)):
+        validate_data(data).raise_if_errors()
+
+    if backend != "pandas":
+        # Imported only when used, Polars is an optional dependency
+        from data_preparation.polars_backend import (
+            check_backend,
+            preprocess_polars,
+        )
+
+        check_backend(backend)
+        with log_stage("preprocess_polars", rows=len(data)):
+            data = preprocess_polars(data, fill_year)
+    else:
+        data = _preprocess_pandas(data, fill_year)
+
+    # Narrowest safe dtypes, e.g., int16 codes instead of int64
+    compact_data = compact_dtypes(data)
+
+    if sketch is not None:
+        with log_stage("sketch", rows=len(data)):
+            sketch.update(compact_data, raw)
+    # The deep memory scan runs for every batch and chunk, only when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Memory usage of the preprocessed data:\n"
+            + memory_usage_report(data, compact_data)
+        )
 
+    return compact_data
+
+
+def _preprocess_pandas(
+    data: pd.DataFrame, fill_year: int | None = None
+) -> pd.DataFrame:
+    """Preprocessing steps of `preprocess_data` on pandas"""
     assert hasattr(DATA_COLUMNS, "target")
-    assert hasattr(DATA_COLUMNS, "patient_id")
-    assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
-    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
 
     # Copy data to not modify original data
     data = data.copy()[DATA_COLUMNS.values()]
 
-    # Forward fill patient ID and new diagnosis
-    # Rows are expected to be grouped by Patient ID, so missing values
-    # are filled with the previous value
-    ffill_cols = [DATA_COLUMNS.patient_id, DATA_COLUMNS.lpz_diagnosis]
-    data[ffill_cols] = data[ffill_cols].ffill()
-
-    # Date to year
-    # Transform to date
-    data[DATA_COLUMNS.date_of_diagnosis] = pd.to_datetime(
-        data[DATA_COLUMNS.date_of_diagnosis], errors="coerce"
-    )
-    # Extract year
-    data["Rok"] = data[DATA_COLUMNS.date_of_diagnosis].dt.year
-    # Drop Date column
-    data = data.drop(DATA_COLUMNS.date_of_diagnosis, axis=1)
-
-    # Fill missing year with 10 years before the minimum year
-    fill_year = data["Rok"].min() - 10
-    data["Rok"] = data["Rok"].fillna(fill_year).astype(int)
+    data = forward_fill_ids(data)
+    data = date_to_year(data, fill_year)
 
     # Set categorical columns
     # data[["Chyb_DG", "DgKod"]] = data[["Chyb_DG", "DgKod"]].astype("category")
 
-    data = update_target_col(data)
+    with log_stage("update_target_col", rows=len(data)):
+        data = update_target_col(data)
 
     # Transform diagnosis codes to numbers
-    data = transform_dg_codes_to_num(data)
+    with log_stage("transform_dg_codes_to_num", rows=len(data)):
+        data = transform_dg_codes_to_num(data)
 
     # Move target column to the end
     data = data[
         [col for col in data.columns if col != DATA_COLUMNS.target]
         + [DATA_COLUMNS.target]
     ]
+    return data
+
+
+def forward_fill_ids(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Forward fill patient ID and new diagnosis.
+    Rows are expected to be grouped by Patient ID, so missing values
+    are filled with the previous value.
+    """
+    assert hasattr(DATA_COLUMNS, "patient_id")
+    assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
 
+    data = data.copy()
+    ffill_cols = [DATA_COLUMNS.patient_id, DATA_COLUMNS.lpz_diagnosis]
+    data[ffill_cols] = data[ffill_cols].ffill()
+    return data
+
+
+def date_to_year(
+    data: pd.DataFrame, fill_year: int | None = None
+) -> pd.DataFrame:
+    """
+    Replace the date of diagnosis by the year of diagnosis.
+    Missing or invalid dates are filled with 10 years before the minimum year,
+    or with `fill_year` if given (e.g., the fill year of the whole extract
+    when the data are a chunk of it).
+    """
+    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+    assert hasattr(DATA_COLUMNS, "year")
+
+    data = data.copy()
+    # Transform to date
+    data[DATA_COLUMNS.date_of_diagnosis] = pd.to_datetime(
+        data[DATA_COLUMNS.date_of_diagnosis], errors="coerce"
+    )
+    # Extract year
+    data[DATA_COLUMNS.year] = data[DATA_COLUMNS.date_of_diagnosis].dt.year
+    # Drop Date column
+    data = data.drop(DATA_COLUMNS.date_of_diagnosis, axis=1)
+
+    # Fill missing year with 10 years before the minimum year
+    if fill_year is None:
+        fill_year = data[DATA_COLUMNS.year].min() - 10
+    data[DATA_COLUMNS.year] = (
+        data[DATA_COLUMNS.year].fillna(fill_year).astype(int)
+    )
     return data
 
 
@@ -75,9 +169,10 @@ def transform_dg_codes_to_num(data: pd.DataFrame) -> pd.DataFrame:
 
     data = data.copy()
     # Transform NOR diagnosis to number
-    data[DATA_COLUMNS.nor_diagnosis] = diagnosis_to_number(
-        data[DATA_COLUMNS.nor_diagnosis]
-    )
+    with log_stage("diagnosis_to_number", rows=len(data)):
+        data[DATA_COLUMNS.nor_diagnosis] = diagnosis_to_number(
+            data[DATA_COLUMNS.nor_diagnosis]
+        )
 
     # Check there are no missing values in new diagnosis
     if data[DATA_COLUMNS.lpz_diagnosis].isnull().sum() > 0:
@@ -85,9 +180,10 @@ def transform_dg_codes_to_num(data: pd.DataFrame) -> pd.DataFrame:
             f"There are missing values in {DATA_COLUMNS.lpz_diagnosis}"
         )
 
-    data[DATA_COLUMNS.lpz_diagnosis] = diagnosis_to_number(
-        data[DATA_COLUMNS.lpz_diagnosis]
-    )
+    with log_stage("diagnosis_to_number", rows=len(data)):
+        data[DATA_COLUMNS.lpz_diagnosis] = diagnosis_to_number(
+            data[DATA_COLUMNS.lpz_diagnosis]
+        )
     return data
 
 
@@ -128,6 +224,28 @@ def diagnosis_to_number(data: pd.Series) -> pd.Series:
     return data.apply(transform)
 
 
+def number_to_diagnosis(number: int) -> str | None:
+    """
+    Transform a number created by `diagnosis_to_number` back to the diagnosis.
+    Diagnoses are returned with 3 digits (e.g., 640 -> C640), missing
+    values (-1) are returned as None.
+    """
+    if number < 0:
+        return None
+    if number >= 1000:
+        return f"D{number - 1000:03d}"
+    return f"C{number:03d}"
+
+
+def pad_diagnoses(codes: pd.Series) -> pd.Series:
+    """
+    Add zero to each diagnosis of length 3 (e.g., C64 -> C640).
+    Other values, also missing and non-text ones, are left as they are.
+    """
+    is_short = codes.map(lambda x: isinstance(x, str) and len(x) == 3)
+    return codes.where(~is_short, codes.astype(str) + "0")
+
+
 def fix_dgkod_target_col(data: pd.DataFrame) -> pd.DataFrame:
     assert hasattr(DATA_COLUMNS, "target")
     data = data.copy()
@@ -141,13 +259,12 @@ def fix_dgkod_target_col(data: pd.DataFrame) -> pd.DataFrame:
         data[DATA_COLUMNS.target].str.extract(ICD_PATTERN_REGEX).fillna("0")
     )
 
-    # Add zero to diagnosis if the length is 3 (e.g., C64 -> C640)
-    update_cols = ["DgKod", DATA_COLUMNS.target]
-    data[update_cols] = data[update_cols].apply(
-        lambda x: x + "0" if len(x) == 3 else x
-    )
+    # Add zero to each diagnosis of length 3 (e.g., C64 -> C640)
+    for col in ["DgKod", DATA_COLUMNS.target]:
+        data[col] = pad_diagnoses(data[col])
 
-    data = _fill_diagnoses_target_col(data)
+    with log_stage("_fill_diagnoses_target_col", rows=len(data)):
+        data = _fill_diagnoses_target_col(data)
 
     return data
 
@@ -0,0 +1,262 @@
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib.column_names import DATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Whole diagnosis code accepted by `diagnosis_to_number`
+ICD_CODE_REGEX = r"[DC]\d{2,3}"
+# Something looking like a diagnosis code in the target, e.g., "c18" or "C 18"
+TARGET_CODE_LIKE_REGEX = r"(?i)(?:^|[^a-z])[cd]\s*\d"
+# Same as `preprocess_data.ICD_PATTERN_REGEX`
+TARGET_CODE_REGEX = r"[DC]\d{2,3}"
+
+# Errors make the preprocessing fail, warnings are only reported
+ERROR = "error"
+WARNING = "warning"
+REPORT_COLUMNS = ["row", "column", "rule", "severity", "value"]
+# Number of issues listed in the error message
+MAX_LISTED_ISSUES = 20
+
+
+class ValidationReport:
+    """
+    Issues found by `validate_data`, one row per offending row and rule.
+
+    Parameters:
+        issues: pd.DataFrame
+            Issues with the columns `REPORT_COLUMNS`, `row` is the position
+            of the row in the data (the first data row is 0)
+        n_rows: int
+            Number of validated rows
+    """
+
+    def __init__(self, issues: pd.DataFrame, n_rows: int):
+        self.issues = issues
+        self.n_rows = n_rows
+
+    @property
+    def errors(self) -> pd.DataFrame:
+        return self.issues[self.issues["severity"] == ERROR]
+
+    @property
+    def warnings(self) -> pd.DataFrame:
+        return self.issues[self.issues["severity"] == WARNING]
+
+    @property
+    def ok(self) -> bool:
+        """True if there are no errors"""
+        return len(self.errors) == 0
+
+    def summary(self) -> pd.DataFrame:
+        """Return the number of offending rows of each rule"""
+        return (
+            self.issues.groupby(["severity", "rule", "column"])
+            .size()
+            .rename("rows")
+            .reset_index()
+        )
+
+    def describe(self, max_issues: int = MAX_LISTED_ISSUES) -> str:
+        """Return the summary and the first issues as text"""
+        if len(self.issues) == 0:
+            return f"No issues found in {self.n_rows} rows"
+
+        lines = [
+            f"{len(self.errors)} errors and {len(self.warnings)} warnings"
+            f" in {self.n_rows} rows:",
+            self.summary().to_string(index=False),
+        ]
+        listed = self.issues.sort_values(["severity", "row"]).head(max_issues)
+        lines.append(f"First {len(listed)} issues:")
+        lines.append(listed.to_string(index=False))
+        return "\n".join(lines)
+
+    def to_csv(self, path: Path) -> None:
+        """Save all the issues to a CSV file"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.issues.to_csv(path, index=False)
+
+    def raise_if_errors(self) -> None:
+        """Log the warnings and raise `DataValidationError` on errors"""
+        if not self.ok:
+            raise DataValidationError(self)
+        if len(self.warnings) > 0:
+            logger.warning(self.describe())
+
+
+class DataValidationError(ValueError):
+    """Raised when the data have errors, carries the whole report"""
+
+    def __init__(self, report: ValidationReport):
+        super().__init__(report.describe())
+        self.report = report
+
+
+def _issues(
+    mask: pd.Series, data: pd.DataFrame, column: str, rule: str, severity: str
+) -> pd.DataFrame:
+    """Return the issues of the rows where the mask is True"""
+    rows = np.flatnonzero(mask.to_numpy())
+    return pd.DataFrame(
+        {
+            "row": rows,
+            "column": column,
+            "rule": rule,
+            "severity": severity,
+            "value": data[column].iloc[rows].astype(str).to_numpy(),
+        },
+        columns=REPORT_COLUMNS,
+    )
+
+
+def _invalid_codes(values: pd.Series) -> pd.Series:
+    """Mask of the present values that are not diagnosis codes"""
+    # Not stripped, the preprocessing fails on or misreads codes with
+    # surrounding whitespace (e.g., " C18" or "C18 ")
+    codes = values.astype(str)
+    return (
+        values.notna()
+        & (codes != "-1")
+        & ~codes.str.fullmatch(ICD_CODE_REGEX)
+    )
+
+
+def validate_data(data: pd.DataFrame) -> ValidationReport:
+    """
+    Validate the raw data in one vectorized pass before the preprocessing.
+    All the offending rows of all the rules are reported:
+      - Errors (the preprocessing would fail):
+        - missing columns,
+        - NOR or LPZ diagnoses that are not ICD-10 codes (e.g., C18, D051),
+        - LPZ diagnosis missing after forward fill.
+      - Warnings:
+        - patient ID missing after forward fill,
+        - rows of a patient not grouped together,
+        - invalid dates (replaced by the fill year) and dates in the future,
+        - targets with something like a code that is not recognized.
+
+    Parameters:
+        data: pd.DataFrame
+            Raw data
+
+    Returns:
+        ValidationReport
+            Report of the found issues
+    """
+    assert hasattr(DATA_COLUMNS, "patient_id")
+    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+    assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+    assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+    assert hasattr(DATA_COLUMNS, "target")
+
+    missing_cols = [
+        col for col in DATA_COLUMNS.values() if col not in data.columns
+    ]
+    if missing_cols:
+        # The other rules need the columns
+        issues = pd.DataFrame(
+            {
+                "row": -1,
+                "column": missing_cols,
+                "rule": "missing_column",
+                "severity": ERROR,
+                "value": "",
+            },
+            columns=REPORT_COLUMNS,
+        )
+        return ValidationReport(issues, len(data))
+
+    found = []
+
+    # Forward filled as in `forward_fill_ids`
+    ids = data[DATA_COLUMNS.patient_id].ffill()
+    lpz_diagnoses = data[DATA_COLUMNS.lpz_diagnosis].ffill()
+
+    found.append(
+        _issues(
+            ids.isna(), data, DATA_COLUMNS.patient_id, "missing_id", WARNING
+        )
+    )
+    # A block of rows of a patient seen already in an earlier block
+    block_starts = ids.ne(ids.shift()) & ids.notna()
+    regrouped = block_starts & ids.where(block_starts).duplicated()
+    found.append(
+        _issues(
+            regrouped,
+            data,
+            DATA_COLUMNS.patient_id,
+            "id_not_grouped",
+            WARNING,
+        )
+    )
+
+    found.append(
+        _issues(
+            _invalid_codes(data[DATA_COLUMNS.nor_diagnosis]),
+            data,
+            DATA_COLUMNS.nor_diagnosis,
+            "invalid_code",
+            ERROR,
+        )
+    )
+    found.append(
+        _issues(
+            lpz_diagnoses.isna(),
+            data,
+            DATA_COLUMNS.lpz_diagnosis,
+            "missing_lpz_diagnosis",
+            ERROR,
+        )
+    )
+    found.append(
+        _issues(
+            _invalid_codes(data[DATA_COLUMNS.lpz_diagnosis]),
+            data,
+            DATA_COLUMNS.lpz_diagnosis,
+            "invalid_code",
+            ERROR,
+        )
+    )
+
+    raw_dates = data[DATA_COLUMNS.date_of_diagnosis]
+    dates = pd.to_datetime(raw_dates, errors="coerce")
+    found.append(
+        _issues(
+            raw_dates.notna() & dates.isna(),
+            data,
+            DATA_COLUMNS.date_of_diagnosis,
+            "invalid_date",
+            WARNING,
+        )
+    )
+    found.append(
+        _issues(
+            dates > pd.Timestamp(datetime.now()),
+            data,
+            DATA_COLUMNS.date_of_diagnosis,
+            "future_date",
+            WARNING,
+        )
+    )
+
+    targets = data[DATA_COLUMNS.target].astype(str)
+    found.append(
+        _issues(
+            data[DATA_COLUMNS.target].notna()
+            & targets.str.contains(TARGET_CODE_LIKE_REGEX)
+            & ~targets.str.contains(TARGET_CODE_REGEX),
+            data,
+            DATA_COLUMNS.target,
+            "unrecognized_target_code",
+            WARNING,
+        )
+    )
+
+    issues = pd.concat(found, ignore_index=True)
+    return ValidationReport(issues, len(data))
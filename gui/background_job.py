@@ -0,0 +1,258 @@
+"""
+Running long jobs in a background thread, so the window stays responsive.
+"""
+
+import logging
+import queue
+import threading
+from tkinter import DISABLED, NORMAL
+from typing import Any, Callable
+
+import ttkbootstrap as ttk
+from ttkbootstrap.constants import *
+from ttkbootstrap.tooltip import ToolTip
+
+logger = logging.getLogger(__name__)
+
+# Interval of checking the job progress in ms
+POLL_INTERVAL_MS = 100
+
+
+class JobCancelledError(Exception):
+    """Raised in the job thread when the job is cancelled"""
+
+
+class BackgroundJob:
+    """
+    Run `func(progress)` in a background thread.
+
+    The job reports its progress by calling `progress(message, fraction)`.
+    The reports are passed to the Tk main thread through a queue, which is
+    polled by `after()`, so the callbacks are called in the main thread.
+    Cancellation is cooperative, `progress` raises `JobCancelledError` in
+    the job thread once the job is cancelled, so a running stage (e.g.,
+    reading or fitting) is finished before the job stops. From the stage
+    `last_cancellable`, if given, the job is not cancelled any more, so
+    e.g. a fitted model is not thrown away.
+
+    Parameters:
+        widget: ttk.Widget
+            Widget whose `after()` is used for polling
+        func: Callable[[Callable[[str, float], None]], Any]
+            Job to run, called with the progress callback
+        on_progress: Callable[[str, float], None]
+            Called in the main thread with each progress report
+        on_finish: Callable[[BackgroundJob], None]
+            Called in the main thread when the job is finished
+        last_cancellable: str | None
+            Progress message of the last stage the job can be cancelled
+            before
+    """
+
+    def __init__(
+        self,
+        widget: ttk.Widget,
+        func: Callable[[Callable[[str, float], None]], Any],
+        on_progress: Callable[[str, float], None],
+        on_finish: Callable[["BackgroundJob"], None],
+        last_cancellable: str | None = None,
+    ):
+        self._widget = widget
+        self._func = func
+        self._on_progress = on_progress
+        self._on_finish = on_finish
+        self._last_cancellable = last_cancellable
+
+        self._cancel_event = threading.Event()
+        self._cancellable = True
+        self._progress_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._poll_id: str | None = None
+
+        self._result: Any = None
+        self._exception: BaseException | None = None
+        self.finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job stopped because it was cancelled"""
+        return isinstance(self._exception, JobCancelledError)
+
+    @property
+    def failed(self) -> bool:
+        """Whether the job raised an exception other than cancellation"""
+        return self._exception is not None and not self.cancelled
+
+    def start(self) -> None:
+        self._thread.start()
+        self._poll_id = self._widget.after(POLL_INTERVAL_MS, self._poll)
+
+    @property
+    def cancellable(self) -> bool:
+        """Whether the job can still be cancelled"""
+        return self._cancellable
+
+    def cancel(self) -> None:
+        """Request cancellation, the job stops at its next progress report"""
+        logger.info("Cancelling the job")
+        self._cancel_event.set()
+
+    def detach(self) -> None:
+        """Cancel the job and stop polling, e.g. when the widget is destroyed"""
+        self.cancel()
+        if self._poll_id is not None:
+            self._widget.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def result(self) -> Any:
+        """
+        Return the result of the finished job.
+        Raises the exception raised by the job, if any.
+        """
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _progress(self, message: str, fraction: float) -> None:
+        """Progress callback called in the job thread"""
+        if self._cancellable and self._cancel_event.is_set():
+            raise JobCancelledError("The job was cancelled")
+        if message == self._last_cancellable:
+            self._cancellable = False
+        self._progress_queue.put((message, fraction))
+
+    def _run(self) -> None:
+        try:
+            self._result = self._func(self._progress)
+        except BaseException as e:
+            self._exception = e
+
+    def _poll(self) -> None:
+        while True:
+            try:
+                message, fraction = self._progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._on_progress(message, fraction)
+
+        if self._thread.is_alive():
+            self._poll_id = self._widget.after(POLL_INTERVAL_MS, self._poll)
+            return
+
+        self._poll_id = None
+        self.finished = True
+        self._on_finish(self)
+
+
+class JobProgressFrame(ttk.Frame):
+    """
+    Frame with a progress bar, a status label and a cancel button
+    for running a `BackgroundJob`.
+    The given buttons are disabled while the job is running.
+    """
+
+    def __init__(self, master, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.status_var = ttk.StringVar(value="")
+        self.progress_var = ttk.DoubleVar(value=0)
+        self.job: BackgroundJob | None = None
+        self._disabled_widgets: list[ttk.Widget] = []
+
+        self.progress_bar = ttk.Progressbar(
+            self, variable=self.progress_var, maximum=1.0, mode=DETERMINATE
+        )
+        self.progress_bar.pack(side=LEFT, fill=X, expand=YES, padx=5)
+
+        ttk.Label(self, textvariable=self.status_var, width=30).pack(
+            side=LEFT, padx=5
+        )
+
+        self.cancel_button = ttk.Button(
+            self,
+            text="Cancel",
+            style="danger.TButton",
+            command=self._on_cancel,
+            state=DISABLED,
+        )
+        self.cancel_button.pack(side=LEFT, padx=5)
+        ToolTip(
+            self.cancel_button,
+            text="The job stops when the current step is finished",
+        )
+
+    @property
+    def running(self) -> bool:
+        return self.job is not None and not self.job.finished
+
+    def run(
+        self,
+        func: Callable[[Callable[[str, float], None]], Any],
+        on_done: Callable[[BackgroundJob], None],
+        disable: list[ttk.Widget],
+        last_cancellable: str | None = None,
+    ) -> None:
+        """
+        Run the job in the background.
+
+        Parameters:
+            func: Callable[[Callable[[str, float], None]], Any]
+                Job to run, called with the progress callback.
+                It must not access Tk widgets or variables.
+            on_done: Callable[[BackgroundJob], None]
+                Called in the main thread when the job finished or failed,
+                `job.result()` returns the result or raises the exception.
+                Not called when the job was cancelled.
+            disable: list[ttk.Widget]
+                Widgets to disable while the job is running
+            last_cancellable: str | None
+                Progress message of the last stage the job can be cancelled
+                before, the cancel button is disabled from it
+        """
+        if self.running:
+            raise RuntimeError("A job is already running")
+
+        self._disabled_widgets = disable
+        for widget in disable:
+            widget.configure(state=DISABLED)
+        self.cancel_button.configure(state=NORMAL)
+        self._on_progress("Starting", 0)
+
+        def on_finish(job: BackgroundJob) -> None:
+            for widget in self._disabled_widgets:
+                widget.configure(state=NORMAL)
+            self.cancel_button.configure(state=DISABLED)
+
+            if job.cancelled:
+                self._on_progress("Cancelled", 0)
+                return
+
+            if job.failed:
+                self._on_progress("Failed", 0)
+            else:
+                self._on_progress("Done", 1)
+            on_done(job)
+
+        self.job = BackgroundJob(
+            self, func, self._on_progress, on_finish, last_cancellable
+        )
+        self.job.start()
+
+    def _on_progress(self, message: str, fraction: float) -> None:
+        self.status_var.set(message)
+        self.progress_var.set(fraction)
+        if self.running and self.job is not None and not self.job.cancellable:
+            self.cancel_button.configure(state=DISABLED)
+
+    def _on_cancel(self) -> None:
+        if self.job is not None:
+            self.job.cancel()
+            # Checked only between the stages of the job
+            self.status_var.set("Cancelling after this step...")
+            self.cancel_button.configure(state=DISABLED)
+
+    def destroy(self) -> None:
+        # Stop the job when leaving the frame, e.g. back to the main menu
+        if self.running and self.job is not None:
+            self.job.detach()
+        super().destroy()
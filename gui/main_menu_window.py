@@ -9,7 +9,7 @@ class MainWindow(ttk.Window):
         super().__init__()
 
         # Set size of the window
-        self.geometry("800x400")
+        self.geometry("800x570")
 
         self.current_frame = None
         self.switch_frame(MainMenuFrame)
@@ -3,21 +3,22 @@ Frame for prediction of the model
 """
 
 import logging
-import tkinter
+import tkinter.filedialog
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
 import ttkbootstrap as ttk
-import xgboost as xgb
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
 
-from data_preparation import preprocess_data
-from data_preparation.drop_id import drop_id_from_data
+from gui.background_job import BackgroundJob, JobProgressFrame
 from gui.error_wrapper import on_event_error_wrapper
-from lib import DATA_COLUMNS as DC
-from model.hyperparams import get_xgbc_hyperparams
+from gui.results_window import ResultsWindow
+from model.batch import find_data_files, predict_batch
+from model.explain import DEFAULT_TOP_K
+from model.pipeline import predict_from_csv
+from model.prediction_cache import CACHE_FILE_NAME
+from model.results import get_results_dir
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,12 @@ class PredictFrame(ttk.Frame):
     - Title label
     - Choose model button
     - Choose data button
+    - Reuse cached predictions checkbox
+    - Explain predictions checkbox
     - Predict button
+    - Show results button
+    - Predict folder button
+    - Progress bar with cancel button
     """
 
     def __init__(self, master, *args, **kwargs):
@@ -60,6 +66,9 @@ class PredictFrame(ttk.Frame):
         self.save_data_path_var = ttk.StringVar(
             value=Path(self.default_path, "predict", "data.csv")
         )
+        self.use_cache_var = ttk.BooleanVar(value=False)
+        self.cache_path = Path(self.default_path, "predict", CACHE_FILE_NAME)
+        self.explain_var = ttk.BooleanVar(value=False)
 
         # header and labelframe option container
         option_text = "Select model and data"
@@ -70,6 +79,7 @@ class PredictFrame(ttk.Frame):
         self.create_data_path_row()
         self.create_data_save_path_row()
         self.create_predict_button()
+        self.create_progress_row()
 
     def create_model_path_row(self):
         """Add model path row to labelframe"""
@@ -137,61 +147,167 @@ class PredictFrame(ttk.Frame):
 
     def create_predict_button(self):
         """Add predict button to labelframe"""
-        predict_btn = ttk.Button(
+        ttk.Checkbutton(
             self.option_lf,
+            text="Reuse cached predictions of unchanged rows",
+            variable=self.use_cache_var,
+        ).pack(pady=(10, 0))
+        ttk.Checkbutton(
+            self.option_lf,
+            text=f"Write the {DEFAULT_TOP_K} most contributing features"
+            " next to each prediction",
+            variable=self.explain_var,
+        ).pack(pady=(10, 0))
+
+        # Predict and show its results in one row
+        predict_row = ttk.Frame(self.option_lf)
+        predict_row.pack(pady=10)
+
+        self.predict_button = ttk.Button(
+            predict_row,
             text="Predict",
             command=self.on_predict,
         )
-        predict_btn.pack(pady=10)
+        self.predict_button.pack(side=LEFT, padx=5)
+
+        self.show_results_button = ttk.Button(
+            predict_row,
+            text="Show results",
+            style="secondary.TButton",
+            command=self._on_show_results,
+        )
+        self.show_results_button.pack(side=LEFT, padx=5)
+
+        self.predict_folder_button = ttk.Button(
+            self.option_lf,
+            text="Predict folder",
+            style="secondary.TButton",
+            command=self.on_predict_folder,
+        )
+        self.predict_folder_button.pack(pady=(0, 10))
 
     @on_event_error_wrapper(logger=logger)
-    def on_predict(self) -> None:
+    def _on_show_results(self):
+        """Open the results of the prediction saved at the save path"""
+        results_dir = get_results_dir(Path(self.save_data_path_var.get()))
+        if not results_dir.exists():
+            raise FileNotFoundError(
+                f"No prediction results found at {results_dir}"
+            )
+        ResultsWindow(self, results_dir)
+
+    @on_event_error_wrapper(logger=logger)
+    def on_predict_folder(self) -> None:
         """
-        Predict new data using the model.
-        Save the predictions to the specified path.
+        Predict all CSV files in the chosen folder in parallel in the
+        background. The predictions and the summary are saved to the
+        chosen output folder.
         """
+        data_dir = tkinter.filedialog.askdirectory(
+            initialdir=self.default_path, title="Select folder with data"
+        )
+        if not data_dir:
+            return
+        output_dir = tkinter.filedialog.askdirectory(
+            initialdir=Path(self.default_path, "predict"),
+            title="Select folder to save the predictions to",
+        )
+        if not output_dir:
+            return
+
         model_path = Path(self.model_path_var.get())
-        data_path = Path(self.data_path_var.get())
+        data_paths = find_data_files(data_dir)
+        if not data_paths:
+            raise FileNotFoundError(f"No CSV files found in {data_dir}")
+
+        self.job_progress.run(
+            lambda progress: predict_batch(
+                model_path, data_paths, Path(output_dir), progress=progress
+            ),
+            on_done=self._on_predict_folder_done,
+            disable=self._job_disabled_buttons(),
+        )
 
-        # Load the model
-        logger.info(f"Predicting data using model: {model_path}")
-        model = xgb.XGBClassifier(**get_xgbc_hyperparams())
-        model.load_model(model_path)
-
-        # Load the data
-        logger.info(f"Loading data: {data_path}")
-        data = pd.read_csv(data_path)
-        # Preprocess the data
-        logger.info("Preprocessing data")
-        data = preprocess_data(data)
-        data, _ = drop_id_from_data(data)
-
-        assert hasattr(DC, "target")
-        if DC.target in data.columns:
-            logger.warning(
-                f"Data contains target column '{DC.target}', dropping it"
+    @on_event_error_wrapper(logger=logger)
+    def _on_predict_folder_done(self, job: BackgroundJob) -> None:
+        """Show the summary of the folder prediction job"""
+        # Raises the exception of the job, if any
+        summary = job.result()
+        failed = summary[summary["status"] != "ok"]
+
+        message = (
+            f"Predicted {len(summary) - len(failed)} of {len(summary)} files,"
+            f" {summary['rows'].sum()} rows."
+        )
+        if len(failed) > 0:
+            message += "\nFailed files:\n" + "\n".join(
+                f"{row.file}: {row.error}" for row in failed.itertuples()
             )
-            data.drop(DC.target, axis=1, inplace=True)
+            Messagebox.show_warning(
+                title="Predictions saved", message=message, alert=True
+            )
+            return
 
-        logger.info("Data preprocessed successfully")
+        Messagebox.show_info(
+            title="Predictions saved", message=message, alert=True
+        )
 
-        logger.info("Predicting data")
-        predictions = model.predict(data)
-        logger.info("Data predicted successfully")
+    def _job_disabled_buttons(self) -> list[ttk.Widget]:
+        """Buttons and path entries disabled while a job is running"""
+        return [
+            self.predict_button,
+            self.predict_folder_button,
+            self.choose_model_button,
+            self.choose_data_button,
+            self.choose_data_save_button,
+            self.show_results_button,
+            self.model_path_entry,
+            self.data_path_entry,
+            self.data_save_path_entry,
+        ]
+
+    def create_progress_row(self):
+        """Add progress bar with cancel button to labelframe"""
+        self.job_progress = JobProgressFrame(self.option_lf)
+        self.job_progress.pack(fill=X, expand=YES, pady=(0, 5))
 
-        # Save the predictions
+    @on_event_error_wrapper(logger=logger)
+    def on_predict(self) -> None:
+        """
+        Predict new data using the model in the background.
+        Save the predictions to the specified path.
+        """
+        model_path = Path(self.model_path_var.get())
+        data_path = Path(self.data_path_var.get())
         save_data_path = Path(self.save_data_path_var.get())
-        logger.info(f"Saving predictions to: {save_data_path}")
-        predictions_df = pd.DataFrame(predictions, columns=["prediction"])
-
-        save_data_path.parent.mkdir(parents=True, exist_ok=True)
-        predictions_df.to_csv(save_data_path, index=False)
+        cache_path = self.cache_path if self.use_cache_var.get() else None
+        explain_top_k = DEFAULT_TOP_K if self.explain_var.get() else 0
+
+        self.job_progress.run(
+            lambda progress: predict_from_csv(
+                model_path,
+                data_path,
+                save_data_path,
+                progress=progress,
+                cache_path=cache_path,
+                explain_top_k=explain_top_k,
+                save_results=True,
+            ),
+            on_done=self._on_predict_done,
+            disable=self._job_disabled_buttons(),
+        )
 
-        logger.info("Predictions saved successfully")
+    @on_event_error_wrapper(logger=logger)
+    def _on_predict_done(self, job: BackgroundJob) -> None:
+        """Show the result of the prediction job"""
+        # Raises the exception of the job, if any
+        job.result()
+        save_data_path = Path(self.save_data_path_var.get())
 
         Messagebox.show_info(
             title="Predictions saved",
-            message=f"Predictions saved to {save_data_path}",
+            message=f"Predictions saved to {save_data_path}\n"
+            "Click 'Show results' to view them with the patient IDs.",
             alert=True,
         )
 
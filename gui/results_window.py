@@ -0,0 +1,142 @@
+"""
+Window for viewing the prediction results
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+import ttkbootstrap as ttk
+from ttkbootstrap.constants import *
+
+from gui.error_wrapper import on_event_error_wrapper
+from model.results import RESULT_COLUMNS, ResultsStore
+
+logger = logging.getLogger(__name__)
+
+# Number of rows shown at once
+PAGE_ROWS = 20
+COLUMN_WIDTH = 120
+
+
+class ResultsWindow(ttk.Toplevel):
+    """
+    ResultsWindow class for viewing the predictions joined with the patient
+    IDs and the diagnoses.
+    Only the visible rows are inserted to the table and read from the
+    memory-mapped results, so the window stays fast for millions of rows.
+    Consists of the following widgets:
+    - Filter and sort options
+    - Results table with a scrollbar
+    """
+
+    def __init__(self, master, results_dir: Path):
+        super().__init__(title="Prediction results", master=master)
+
+        self.store = ResultsStore(results_dir)
+        # Indices of the rows to show and the index of the first visible row
+        self.indices: np.ndarray = self.store.select()
+        self.offset = 0
+
+        self.positive_only_var = ttk.BooleanVar(value=False)
+        self.sort_by_probability_var = ttk.BooleanVar(value=False)
+        self.count_var = ttk.StringVar(value="")
+
+        self.create_options_row()
+        self.create_table()
+
+        self._render()
+
+    def create_options_row(self):
+        """Add filter and sort options"""
+        options_row = ttk.Frame(self, padding=10)
+        options_row.pack(fill=X)
+
+        ttk.Checkbutton(
+            options_row,
+            text="Only positive",
+            variable=self.positive_only_var,
+            command=self._on_options_changed,
+        ).pack(side=LEFT, padx=5)
+
+        ttk.Checkbutton(
+            options_row,
+            text="Sort by probability",
+            variable=self.sort_by_probability_var,
+            command=self._on_options_changed,
+        ).pack(side=LEFT, padx=5)
+
+        ttk.Label(options_row, textvariable=self.count_var).pack(
+            side=RIGHT, padx=5
+        )
+
+    def create_table(self):
+        """Add results table with a scrollbar"""
+        table_row = ttk.Frame(self, padding=(10, 0, 10, 10))
+        table_row.pack(fill=BOTH, expand=YES)
+
+        self.table = ttk.Treeview(
+            table_row, columns=RESULT_COLUMNS, show="headings", height=PAGE_ROWS
+        )
+        for column in RESULT_COLUMNS:
+            self.table.heading(column, text=column)
+            self.table.column(column, width=COLUMN_WIDTH, anchor=CENTER)
+        self.table.pack(side=LEFT, fill=BOTH, expand=YES)
+
+        # The scrollbar moves over all the rows, not only the inserted ones
+        self.scrollbar = ttk.Scrollbar(
+            table_row, orient=VERTICAL, command=self._on_scroll
+        )
+        self.scrollbar.pack(side=LEFT, fill=Y)
+
+        for widget in (self.table, self.scrollbar):
+            widget.bind("<MouseWheel>", self._on_mouse_wheel)
+            # Linux
+            widget.bind("<Button-4>", lambda _: self._scroll_to(self.offset - 3))
+            widget.bind("<Button-5>", lambda _: self._scroll_to(self.offset + 3))
+        self.bind("<Prior>", lambda _: self._scroll_to(self.offset - PAGE_ROWS))
+        self.bind("<Next>", lambda _: self._scroll_to(self.offset + PAGE_ROWS))
+
+    @on_event_error_wrapper(logger=logger)
+    def _on_options_changed(self):
+        """Filter and sort the rows according to the options"""
+        self.indices = self.store.select(
+            positive_only=self.positive_only_var.get(),
+            sort_by_probability=self.sort_by_probability_var.get(),
+        )
+        self._scroll_to(0)
+
+    def _on_scroll(self, action: str, amount: str, unit: str | None = None):
+        """Handle the scrollbar commands `moveto` and `scroll`"""
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.indices)))
+        elif action == "scroll":
+            step = PAGE_ROWS if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+
+    def _on_mouse_wheel(self, event):
+        # Windows reports multiples of 120
+        self._scroll_to(self.offset - 3 * int(event.delta / 120))
+
+    def _scroll_to(self, offset: int):
+        max_offset = max(len(self.indices) - PAGE_ROWS, 0)
+        self.offset = min(max(offset, 0), max_offset)
+        self._render()
+
+    def _render(self):
+        """Show the visible rows only"""
+        visible = self.indices[self.offset : self.offset + PAGE_ROWS]
+
+        self.table.delete(*self.table.get_children())
+        for row in self.store.rows(visible):
+            self.table.insert("", END, values=row)
+
+        total = max(len(self.indices), 1)
+        self.scrollbar.set(
+            self.offset / total, (self.offset + len(visible)) / total
+        )
+        self.count_var.set(
+            f"Rows {self.offset + 1 if len(visible) else 0}"
+            f"-{self.offset + len(visible)} of {len(self.indices)}"
+            f" (total {len(self.store)})"
+        )
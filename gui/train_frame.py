@@ -7,17 +7,14 @@ import tkinter.filedialog
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
 import ttkbootstrap as ttk
-import xgboost as xgb
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
 
-from data_preparation import preprocess_data
-from data_preparation.drop_id import drop_id_from_data
+from gui.background_job import BackgroundJob, JobProgressFrame
 from gui.error_wrapper import on_event_error_wrapper
-from lib import DATA_COLUMNS as DC
-from model import train
+from model.pipeline import train_and_save
+from model.train_cache import DEFAULT_CACHE_DIR, TrainCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +25,9 @@ class TrainFrame(ttk.Frame):
     Consists of the following widgets:
     - Title label
     - Choose training data button
+    - Reuse trained model checkbox
     - Train and save model button
+    - Progress bar with cancel button
     """
 
     def __init__(self, master, *args, **kwargs):
@@ -53,6 +52,7 @@ class TrainFrame(ttk.Frame):
         self.save_model_path_var = ttk.StringVar(
             value=Path(model_today_dir, "model.json")
         )
+        self.use_train_cache_var = ttk.BooleanVar(value=True)
 
         # header and labelframe option container
         option_text = "Select training data"
@@ -62,6 +62,7 @@ class TrainFrame(ttk.Frame):
         self.create_path_row()
         self.create_save_model_row()
         self.create_train_button()
+        self.create_progress_row()
 
     def create_path_row(self):
         """Add path row to labelframe"""
@@ -71,18 +72,18 @@ class TrainFrame(ttk.Frame):
         path_lbl = ttk.Label(path_row, text="Take data from:", width=15)
         path_lbl.pack(side=LEFT, padx=(15, 0))
 
-        path_ent = ttk.Entry(
+        self.data_path_entry = ttk.Entry(
             path_row, textvariable=self.data_path_var, width=50
         )
-        path_ent.pack(side=LEFT, fill=X, expand=YES, padx=5)
+        self.data_path_entry.pack(side=LEFT, fill=X, expand=YES, padx=5)
 
-        browse_btn = ttk.Button(
+        self.browse_data_button = ttk.Button(
             master=path_row,
             text="Browse",
             command=self.on_browse_data,
             width=8,
         )
-        browse_btn.pack(side=LEFT, padx=5)
+        self.browse_data_button.pack(side=LEFT, padx=5)
 
     def create_save_model_row(self):
         """Add save model path row to labelframe"""
@@ -94,27 +95,40 @@ class TrainFrame(ttk.Frame):
         )
         save_model_lbl.pack(side=LEFT, padx=(15, 0))
 
-        save_model_ent = ttk.Entry(
+        self.save_model_path_entry = ttk.Entry(
             save_model_row, textvariable=self.save_model_path_var, width=50
         )
-        save_model_ent.pack(side=LEFT, fill=X, expand=YES, padx=5)
+        self.save_model_path_entry.pack(
+            side=LEFT, fill=X, expand=YES, padx=5
+        )
 
-        browse_btn = ttk.Button(
+        self.browse_save_model_button = ttk.Button(
             master=save_model_row,
             text="Browse",
             command=self.on_browse_save_model,
             width=8,
         )
-        browse_btn.pack(side=LEFT, padx=5)
+        self.browse_save_model_button.pack(side=LEFT, padx=5)
 
     def create_train_button(self):
         """Add train button to labelframe"""
-        train_btn = ttk.Button(
+        ttk.Checkbutton(
+            self.option_lf,
+            text="Reuse the model trained on the same data and settings",
+            variable=self.use_train_cache_var,
+        ).pack(pady=(10, 0))
+
+        self.train_button = ttk.Button(
             self.option_lf,
             text="Train and save model",
             command=self.on_train,
         )
-        train_btn.pack(pady=10)
+        self.train_button.pack(pady=10)
+
+    def create_progress_row(self):
+        """Add progress bar with cancel button to labelframe"""
+        self.job_progress = JobProgressFrame(self.option_lf)
+        self.job_progress.pack(fill=X, expand=YES, pady=(0, 5))
 
     def on_browse_data(self):
         """Open file dialog to select training data"""
@@ -145,40 +159,39 @@ class TrainFrame(ttk.Frame):
 
     @on_event_error_wrapper(logger=logger)
     def on_train(self):
-        """Train the model and save it"""
+        """Train the model and save it in the background"""
         save_path = Path(self.save_model_path_var.get())
         self._check_save_path_suffix(save_path)
 
-        data_path = self.data_path_var.get()
-
-        logger.info(f"Preprocessing data at {data_path}")
-        data = preprocess_data(pd.read_csv(data_path))
-        # Drop the ID column from the data
-        data, _ = drop_id_from_data(data)
-        logger.info("Data preprocessed successfully")
-
-        logger.info(f"Training model with preprocessed data")
-        model = train(data)
-        logger.info("Model trained successfully")
-
-        self.save_model(model, save_path)
-
-    def save_model(self, model: xgb.XGBClassifier, save_path: Path) -> None:
-        """
-        Save the model to the given path.
+        data_path = Path(self.data_path_var.get())
+        train_cache = (
+            TrainCache(Path(Path().absolute(), DEFAULT_CACHE_DIR))
+            if self.use_train_cache_var.get()
+            else None
+        )
 
-        Parameters:
-            model: xgb.XGBClassifier
-                Model to save
-            save_path: Path
-                Path to save the model to
-        """
+        self.job_progress.run(
+            lambda progress: train_and_save(
+                data_path, save_path, progress=progress, train_cache=train_cache
+            ),
+            on_done=self._on_train_done,
+            disable=[
+                self.train_button,
+                self.browse_data_button,
+                self.browse_save_model_button,
+                self.data_path_entry,
+                self.save_model_path_entry,
+            ],
+            # A fitted model is saved even if cancelled during the fit
+            last_cancellable="Training model",
+        )
 
-        logger.info(f"Saving model to {save_path}")
-        # Create parent directories if they do not exist
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        model.save_model(save_path)
-        logger.info("Model saved successfully")
+    @on_event_error_wrapper(logger=logger)
+    def _on_train_done(self, job: BackgroundJob) -> None:
+        """Show the result of the training job"""
+        # Raises the exception of the job, if any
+        job.result()
+        save_path = Path(self.save_model_path_var.get())
 
         # Show window with success message
         Messagebox.show_info(
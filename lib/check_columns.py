@@ -1,9 +1,14 @@
-import pandas as pd
+from typing import TYPE_CHECKING
 
 from lib.column_names import _REQUIRED_COLUMNS
 
+# pandas is not imported at runtime, so `lib` can be imported before it,
+# e.g., to set the thread limits in `lib.runtime_config`
+if TYPE_CHECKING:
+    import pandas as pd
 
-def check_data_columns(data: pd.DataFrame) -> None:
+
+def check_data_columns(data: "pd.DataFrame") -> None:
     """
     Check if all required columns are present in the data.
 
@@ -0,0 +1,247 @@
+"""
+Profiling of the pipeline stages.
+
+Stages are marked by `lib.timing.log_stage`. While a `profile` context is
+active, every stage additionally records its wall time, CPU time, peak
+memory and number of processed rows. When no profile is active, the only
+overhead of a stage is a single check of `get_active_profiler()`.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, cast
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE_PROFILER: "Profiler | None" = None
+
+
+def get_active_profiler() -> "Profiler | None":
+    """Return the profiler of the active `profile` context, if any"""
+    return _ACTIVE_PROFILER
+
+
+def _peak_rss_bytes() -> int | None:
+    """Peak resident set size of the process, if available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageProfile:
+    """
+    Measurements of a single pipeline stage.
+    """
+
+    def __init__(self, name: str, depth: int, rows: int | None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        # Peak memory allocated by Python during the stage (tracemalloc)
+        self.peak_traced_bytes: int | None = None
+        # Peak resident set size of the process at the end of the stage
+        self.peak_rss_bytes: int | None = None
+
+        self._start_wall = 0.0
+        self._start_cpu = 0.0
+        # Highest traced peak of the finished child stages
+        self._children_peak = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "rows": self.rows,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "peak_traced_bytes": self.peak_traced_bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+
+class Profiler:
+    """
+    Collect `StageProfile` records of the stages run while it is active.
+
+    Parameters:
+        trace_memory: bool
+            Trace Python allocations with `tracemalloc` to get the peak
+            memory of each stage. Tracing slows the allocations down.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.stages: list[StageProfile] = []
+        # Stages running in each thread, innermost last
+        self._local = threading.local()
+
+    @property
+    def _stack(self) -> list[StageProfile]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return cast(list[StageProfile], self._local.stack)
+
+    def start_stage(self, name: str, rows: int | None) -> StageProfile:
+        stage = StageProfile(name, len(self._stack), rows)
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            if self._stack:
+                # Keep the peak of the parent stage before resetting it
+                parent = self._stack[-1]
+                parent._children_peak = max(
+                    parent._children_peak, tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+
+        self.stages.append(stage)
+        self._stack.append(stage)
+        stage._start_wall = time.perf_counter()
+        stage._start_cpu = time.process_time()
+        return stage
+
+    def end_stage(self, stage: StageProfile, rows: int | None) -> None:
+        stage.wall_s = time.perf_counter() - stage._start_wall
+        stage.cpu_s = time.process_time() - stage._start_cpu
+        stage.rows = rows
+        stage.peak_rss_bytes = _peak_rss_bytes()
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            stage.peak_traced_bytes = max(
+                tracemalloc.get_traced_memory()[1], stage._children_peak
+            )
+
+        self._stack.pop()
+        if self._stack and stage.peak_traced_bytes is not None:
+            parent = self._stack[-1]
+            parent._children_peak = max(
+                parent._children_peak, stage.peak_traced_bytes
+            )
+
+    def summary(self) -> str:
+        """
+        Return the summary table of the recorded stages.
+        Nested stages are indented under their parent stage.
+        """
+
+        def mb(value: int | None) -> str:
+            return "-" if value is None else f"{value / 1024**2:.1f}"
+
+        header = (
+            f"{'Stage':<40} {'Wall [s]':>10} {'CPU [s]':>10}"
+            f" {'Peak [MB]':>10} {'RSS [MB]':>10} {'Rows':>12}"
+        )
+        lines = [header, "-" * len(header)]
+        for stage in self.stages:
+            name = "  " * stage.depth + stage.name
+            rows = "-" if stage.rows is None else str(stage.rows)
+            lines.append(
+                f"{name:<40} {stage.wall_s:>10.3f} {stage.cpu_s:>10.3f}"
+                f" {mb(stage.peak_traced_bytes):>10}"
+                f" {mb(stage.peak_rss_bytes):>10} {rows:>12}"
+            )
+
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "trace_memory": self.trace_memory,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def save_trace(self, path: Path) -> None:
+        """Save the recorded stages as a JSON trace"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+@contextmanager
+def profile(
+    trace_path: Path | None = None,
+    cprofile_path: Path | None = None,
+    trace_memory: bool = True,
+) -> Iterator[Profiler]:
+    """
+    Profile the pipeline stages run inside the context.
+    On exit, the summary table is logged and optionally the JSON trace
+    and the `cProfile` statistics are saved.
+
+    Example:
+        with profile(trace_path=Path("logs/profile.json")) as profiler:
+            predict_from_csv(model_path, data_path, save_path)
+        print(profiler.summary())
+
+    Parameters:
+        trace_path: Path | None
+            Path to save the JSON trace of the stages to
+        cprofile_path: Path | None
+            Path to save the `cProfile` statistics to, loadable by `pstats`
+        trace_memory: bool
+            Trace the peak memory of each stage with `tracemalloc`
+    """
+    global _ACTIVE_PROFILER
+
+    if _ACTIVE_PROFILER is not None:
+        raise RuntimeError("A profile is already active")
+
+    profiler = Profiler(trace_memory=trace_memory)
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    cprofiler = cProfile.Profile() if cprofile_path is not None else None
+
+    _ACTIVE_PROFILER = profiler
+    if cprofiler is not None:
+        cprofiler.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+        _ACTIVE_PROFILER = None
+        if started_tracing:
+            tracemalloc.stop()
+
+        logger.info(f"Profile of the pipeline stages:\n{profiler.summary()}")
+
+        if trace_path is not None:
+            profiler.save_trace(trace_path)
+            logger.info(f"Profile trace saved to {trace_path}")
+
+        if cprofiler is not None and cprofile_path is not None:
+            cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+            cprofiler.dump_stats(cprofile_path)
+            logger.info(
+                f"cProfile statistics saved to {cprofile_path}:\n"
+                + _top_functions(cprofiler)
+            )
+
+
+def _top_functions(cprofiler: cProfile.Profile, limit: int = 15) -> str:
+    """Format the functions with the highest cumulative time"""
+    stream = io.StringIO()
+    stats = pstats.Stats(cprofiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
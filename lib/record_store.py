@@ -0,0 +1,319 @@
+"""
+Local SQLite store of the registry records.
+
+The raw and the preprocessed records of the ingested extracts are kept in
+two tables indexed by the patient ID, the NOR diagnosis and the year, so
+subsets of the records can be read without reading the extract files.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from lib.column_names import DATA_COLUMNS
+from lib.runtime_config import get_runtime_config
+
+logger = logging.getLogger(__name__)
+
+assert hasattr(DATA_COLUMNS, "patient_id")
+assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+assert hasattr(DATA_COLUMNS, "target")
+assert hasattr(DATA_COLUMNS, "year")
+
+RAW_TABLE = "raw_records"
+PREPROCESSED_TABLE = "preprocessed_records"
+SOURCES_TABLE = "sources"
+
+# Columns of the record tables with their SQLite types. The raw values are
+# stored untyped, as they were read from the extract.
+TABLE_COLUMNS: dict[str, dict[str, str]] = {
+    RAW_TABLE: {
+        DATA_COLUMNS.patient_id: "",
+        DATA_COLUMNS.date_of_diagnosis: "",
+        DATA_COLUMNS.lpz_diagnosis: "",
+        DATA_COLUMNS.nor_diagnosis: "",
+        DATA_COLUMNS.target: "",
+        DATA_COLUMNS.year: "INTEGER",
+    },
+    PREPROCESSED_TABLE: {
+        DATA_COLUMNS.patient_id: "",
+        DATA_COLUMNS.lpz_diagnosis: "INTEGER",
+        DATA_COLUMNS.nor_diagnosis: "INTEGER",
+        DATA_COLUMNS.year: "INTEGER",
+        DATA_COLUMNS.target: "INTEGER",
+    },
+}
+INDEXED_COLUMNS = [
+    DATA_COLUMNS.patient_id,
+    DATA_COLUMNS.nor_diagnosis,
+    DATA_COLUMNS.year,
+]
+# Estimated memory of one row converted for `executemany`, the number of
+# rows inserted at once is derived from it and the memory budget
+INSERT_ROW_BYTES = 1024
+
+
+def _schema() -> list[str]:
+    """Return the statements creating the tables and the indexes"""
+    statements = [
+        f"""
+        CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} (
+            source_id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            hash TEXT NOT NULL UNIQUE,
+            year INTEGER,
+            raw_rows INTEGER NOT NULL,
+            preprocessed_rows INTEGER NOT NULL,
+            ingested TEXT NOT NULL
+        )
+        """
+    ]
+    for table, columns in TABLE_COLUMNS.items():
+        column_defs = ", ".join(
+            f'"{col}" {sql_type}'.rstrip() for col, sql_type in columns.items()
+        )
+        # The row ID keeps the order of the rows in the extract
+        statements.append(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f" row_id INTEGER PRIMARY KEY, source_id INTEGER NOT NULL,"
+            f" {column_defs})"
+        )
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_source_id"
+            f" ON {table} (source_id)"
+        )
+        for col in INDEXED_COLUMNS:
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_{col}"
+                f' ON {table} ("{col}")'
+            )
+    return statements
+
+
+def insert_chunk_rows() -> int:
+    """Return the number of rows inserted at once"""
+    return get_runtime_config().chunk_rows(INSERT_ROW_BYTES)
+
+
+def to_sql_values(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the values to types SQLite can store: missing values to None,
+    dates to ISO strings and NumPy scalars to Python scalars.
+    """
+    data = data.copy()
+    for col in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[col]):
+            data[col] = data[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+    data = data.astype(object)
+    return data.where(data.notna(), None)
+
+
+class RecordStore:
+    """
+    SQLite database with the raw and the preprocessed records.
+    The tables and the indexes are created when the database is opened.
+
+    Parameters:
+        db_path: Path
+            Path to the database file, created if it does not exist
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        # Faster bulk inserts, still safe against corruption
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for statement in _schema():
+                self.connection.execute(statement)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "RecordStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def find_source(self, digest: str) -> int | None:
+        """Return the ID of the source with the content hash, if ingested"""
+        row = self.connection.execute(
+            f"SELECT source_id FROM {SOURCES_TABLE} WHERE hash = ?", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _insert(self, table: str, source_id: int, data: pd.DataFrame) -> None:
+        """Insert the records in chunks, in the current transaction"""
+        columns = list(TABLE_COLUMNS[table])
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        column_names = ", ".join(f'"{col}"' for col in columns)
+        sql = (
+            f"INSERT INTO {table} (source_id, {column_names})"
+            f" VALUES ({placeholders})"
+        )
+        chunk_rows = insert_chunk_rows()
+        for start in range(0, len(data), chunk_rows):
+            chunk = to_sql_values(
+                data[columns].iloc[start : start + chunk_rows]
+            )
+            self.connection.executemany(
+                sql,
+                ((source_id, *row) for row in chunk.itertuples(index=False)),
+            )
+
+    def add_source(
+        self,
+        path: Path,
+        digest: str,
+        raw: pd.DataFrame,
+        preprocessed: pd.DataFrame | None = None,
+        year: int | None = None,
+    ) -> int:
+        """
+        Insert the records of the extract in one transaction. The records
+        of a previous version of the same file are replaced.
+
+        Parameters:
+            path: Path
+                Path to the extract
+            digest: str
+                Hash of the extract content
+            raw: pd.DataFrame
+                Raw records with the columns of `TABLE_COLUMNS[RAW_TABLE]`
+            preprocessed: pd.DataFrame | None
+                Preprocessed records, if any
+            year: int | None
+                Year of the extract
+
+        Returns:
+            int
+                ID of the source
+        """
+        with self.connection:
+            old_ids = [
+                row[0]
+                for row in self.connection.execute(
+                    f"SELECT source_id FROM {SOURCES_TABLE} WHERE path = ?",
+                    (str(path),),
+                )
+            ]
+            for old_id in old_ids:
+                logger.info(f"Replacing the records of the old {path}")
+                self._delete_source(old_id)
+
+            cursor = self.connection.execute(
+                f"INSERT INTO {SOURCES_TABLE}"
+                " (path, hash, year, raw_rows, preprocessed_rows, ingested)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(path),
+                    digest,
+                    year,
+                    len(raw),
+                    0 if preprocessed is None else len(preprocessed),
+                    datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+            source_id = cursor.lastrowid
+            assert source_id is not None
+
+            self._insert(RAW_TABLE, source_id, raw)
+            if preprocessed is not None:
+                self._insert(PREPROCESSED_TABLE, source_id, preprocessed)
+
+        return source_id
+
+    def _delete_source(self, source_id: int) -> None:
+        for table in (RAW_TABLE, PREPROCESSED_TABLE, SOURCES_TABLE):
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE source_id = ?", (source_id,)
+            )
+
+    def sources(self) -> pd.DataFrame:
+        """Return the ingested extracts"""
+        return pd.read_sql_query(
+            f"SELECT * FROM {SOURCES_TABLE} ORDER BY source_id",
+            self.connection,
+        )
+
+    def read(
+        self,
+        table: str,
+        first_year: int | None = None,
+        last_year: int | None = None,
+        patient_ids: Iterable | None = None,
+    ) -> pd.DataFrame:
+        """
+        Read the records of the patients in the year range, in the order
+        they were ingested. The filters use the indexes of the table.
+
+        Parameters:
+            table: str
+                `RAW_TABLE` or `PREPROCESSED_TABLE`
+            first_year: int | None
+                First year of the records (inclusive), not limited if None
+            last_year: int | None
+                Last year of the records (inclusive), not limited if None
+            patient_ids: Iterable | None
+                IDs of the patients, all patients if None
+
+        Returns:
+            pd.DataFrame
+                Records with the columns of `TABLE_COLUMNS[table]`
+        """
+        assert hasattr(DATA_COLUMNS, "patient_id")
+        assert hasattr(DATA_COLUMNS, "year")
+
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+
+        columns = ", ".join(f'r."{col}"' for col in TABLE_COLUMNS[table])
+        sql = f"SELECT {columns} FROM {table} AS r"
+        conditions = []
+        params: list = []
+
+        if patient_ids is not None:
+            # Join with a temporary table, the list may be longer than
+            # the limit of the parameters of one query. NumPy scalars are
+            # converted to Python scalars.
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS selected_ids"
+                    " (id PRIMARY KEY) WITHOUT ROWID"
+                )
+                self.connection.execute("DELETE FROM selected_ids")
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO selected_ids VALUES (?)",
+                    (
+                        (x.item() if hasattr(x, "item") else x,)
+                        for x in patient_ids
+                    ),
+                )
+            sql += (
+                f' JOIN selected_ids AS s ON r."{DATA_COLUMNS.patient_id}"'
+                " = s.id"
+            )
+        if first_year is not None:
+            conditions.append(f'r."{DATA_COLUMNS.year}" >= ?')
+            params.append(first_year)
+        if last_year is not None:
+            conditions.append(f'r."{DATA_COLUMNS.year}" <= ?')
+            params.append(last_year)
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY r.row_id"
+
+        data = pd.read_sql_query(sql, self.connection, params=params)
+        logger.info(f"Read {len(data)} records from {table}")
+        return data
+
@@ -0,0 +1,235 @@
+"""
+Runtime limits of the threads, the processes and the memory.
+
+The limits are resolved from, in increasing priority:
+  1. defaults derived from the machine,
+  2. the JSON config file (`lpz.json`, or the path in `LPZ_CONFIG`),
+  3. the environment variables `LPZ_THREADS`, `LPZ_BLAS_THREADS`,
+     `LPZ_WORKERS` and `LPZ_MEMORY_BUDGET_MB`,
+  4. the command line options of `lpz`.
+
+The thread limits of the BLAS/OpenMP libraries are set through environment
+variables, so `apply_thread_limits` has to be called before NumPy is
+imported. This module does not import NumPy nor pandas.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH_ENV = "LPZ_CONFIG"
+DEFAULT_CONFIG_PATH = Path("lpz.json")
+# Environment variable of each limit
+LIMIT_ENV_VARS = {
+    "threads": "LPZ_THREADS",
+    "blas_threads": "LPZ_BLAS_THREADS",
+    "workers": "LPZ_WORKERS",
+    "memory_budget_mb": "LPZ_MEMORY_BUDGET_MB",
+}
+# Thread limits read by the BLAS/OpenMP libraries when they are loaded
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+# Share of the physical memory used as the default budget
+DEFAULT_MEMORY_SHARE = 0.5
+# Memory budget if the physical memory is unknown
+FALLBACK_MEMORY_BUDGET_MB = 4096
+# Share of the budget one chunk of a chunked path may take, the rest is
+# left for the model, the other buffers and the copies made by pandas
+CHUNK_MEMORY_SHARE = 0.1
+MIN_CHUNK_ROWS = 10_000
+
+
+def _physical_memory_mb() -> int | None:
+    """Return the physical memory in MB, if it can be found"""
+    try:
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        return page_size * os.sysconf("SC_PHYS_PAGES") // 2**20
+    except (AttributeError, ValueError, OSError):
+        # E.g., on Windows
+        return None
+
+
+class RuntimeConfig:
+    """
+    Resolved runtime limits.
+
+    Attributes:
+        threads: int
+            Threads of XGBoost in one process
+        blas_threads: int
+            Threads of the BLAS/OpenMP libraries (NumPy, ...)
+        workers: int
+            Size of the process and thread pools
+        memory_budget_mb: int
+            Soft memory budget, the chunk sizes are derived from it
+        sources: dict[str, str]
+            Where each limit was taken from
+    """
+
+    def __init__(
+        self,
+        threads: int,
+        blas_threads: int,
+        workers: int,
+        memory_budget_mb: int,
+        sources: dict[str, str] | None = None,
+    ):
+        self.threads = threads
+        self.blas_threads = blas_threads
+        self.workers = workers
+        self.memory_budget_mb = memory_budget_mb
+        self.sources = sources or {}
+
+    @classmethod
+    def defaults(cls) -> "RuntimeConfig":
+        """Return the limits derived from the machine"""
+        cpu_count = os.cpu_count() or 1
+        memory_mb = _physical_memory_mb()
+        budget = (
+            int(memory_mb * DEFAULT_MEMORY_SHARE)
+            if memory_mb
+            else FALLBACK_MEMORY_BUDGET_MB
+        )
+        return cls(
+            threads=cpu_count,
+            blas_threads=cpu_count,
+            workers=cpu_count,
+            memory_budget_mb=budget,
+            sources={name: "default" for name in LIMIT_ENV_VARS},
+        )
+
+    def threads_per_worker(self, workers: int) -> int:
+        """Return the XGBoost threads of each of the parallel workers"""
+        return max(self.threads // max(workers, 1), 1)
+
+    def chunk_rows(self, row_bytes: int, workers: int = 1) -> int:
+        """
+        Return the number of rows of a chunk fitting the memory budget.
+
+        Parameters:
+            row_bytes: int
+                Estimated memory of one row in the chunked path
+            workers: int
+                Number of chunks processed at the same time
+        """
+        budget = self.memory_budget_mb * 2**20 * CHUNK_MEMORY_SHARE
+        rows = int(budget / (row_bytes * max(workers, 1)))
+        return max(rows, MIN_CHUNK_ROWS)
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{name}={getattr(self, name)} ({self.sources.get(name, '?')})"
+            for name in LIMIT_ENV_VARS
+        )
+
+
+def load_runtime_config(
+    config_path: Path | None = None, overrides: dict | None = None
+) -> RuntimeConfig:
+    """
+    Resolve the limits from the defaults, the config file, the environment
+    variables and the overrides (e.g., the command line options).
+
+    Parameters:
+        config_path: Path | None
+            JSON file with the limits, e.g., `{"threads": 4}`.
+            If None, `LPZ_CONFIG` or `lpz.json` is used if it exists.
+        overrides: dict | None
+            Limits overriding the others, None values are ignored
+
+    Returns:
+        RuntimeConfig
+            Resolved limits
+    """
+    config = RuntimeConfig.defaults()
+
+    if config_path is None and os.environ.get(CONFIG_PATH_ENV):
+        config_path = Path(os.environ[CONFIG_PATH_ENV])
+    if config_path is None and DEFAULT_CONFIG_PATH.exists():
+        config_path = DEFAULT_CONFIG_PATH
+
+    layers: list[tuple[str, dict]] = []
+    if config_path is not None:
+        with open(config_path, encoding="utf-8") as f:
+            layers.append((str(config_path), json.load(f)))
+    layers.append(
+        (
+            "environment",
+            {
+                name: os.environ[env_var]
+                for name, env_var in LIMIT_ENV_VARS.items()
+                if os.environ.get(env_var)
+            },
+        )
+    )
+    layers.append(("command line", overrides or {}))
+
+    for source, values in layers:
+        for name, value in values.items():
+            if name not in LIMIT_ENV_VARS:
+                raise ValueError(f"Unknown runtime limit {name} in {source}")
+            if value is None:
+                continue
+            value = int(value)
+            if value < 1:
+                raise ValueError(f"Runtime limit {name} must be positive")
+            setattr(config, name, value)
+            config.sources[name] = source
+
+    return config
+
+
+_CONFIG: RuntimeConfig | None = None
+
+
+def get_runtime_config() -> RuntimeConfig:
+    """
+    Return the limits set by `set_runtime_config`, or resolved from the
+    config file and the environment variables if none were set.
+    """
+    global _CONFIG
+    if _CONFIG is None:
+        _CONFIG = load_runtime_config()
+    return _CONFIG
+
+
+def set_runtime_config(config: RuntimeConfig) -> None:
+    """
+    Set the limits used by the whole process. The limits are also set as
+    the environment variables, so the child processes inherit them.
+    """
+    global _CONFIG
+    _CONFIG = config
+    for name, env_var in LIMIT_ENV_VARS.items():
+        os.environ[env_var] = str(getattr(config, name))
+
+
+def apply_thread_limits(config: RuntimeConfig) -> None:
+    """
+    Set the thread limits of the BLAS/OpenMP libraries.
+    Has to be called before NumPy is imported, otherwise only the child
+    processes are limited.
+    """
+    for env_var in BLAS_ENV_VARS:
+        os.environ[env_var] = str(config.blas_threads)
+
+
+def log_runtime_config(config: RuntimeConfig) -> None:
+    """Log the resolved limits"""
+    logger.info(
+        f"Runtime limits: {config.describe()}",
+        extra={
+            "runtime_limits": {
+                name: getattr(config, name) for name in LIMIT_ENV_VARS
+            }
+        },
+    )
@@ -0,0 +1,199 @@
+"""
+Generator of synthetic raw LPZ/NOR extracts.
+
+The real data cannot be shared, so the generated data imitate their shape:
+  - Rows are grouped by patient, the `IDLPZ` and `Chyb_DG` columns are
+    filled only in the first row of a group and have to be forward filled.
+  - Diagnoses are ICD-10 codes starting with "C" or "D" with 2 or 3 digits.
+  - `Stav` is a free text column. For some patients one row contains
+    the NOR diagnosis the LPZ diagnosis should be fixed by.
+  - Some dates of diagnosis and NOR diagnoses are missing.
+
+The data are generated in chunks of whole patients, so extracts of any size
+can be written to a CSV file with a bounded memory.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib.column_names import DATA_COLUMNS
+
+# Mean number of rows of a patient, and the maximum number
+MEAN_ROWS_PER_PATIENT = 3
+MAX_ROWS_PER_PATIENT = 20
+# Rate of patients with a diagnosis to fix (positive target)
+POSITIVE_RATE = 0.11
+# Rate of rows after the first one of a patient with a repeated `IDLPZ`
+ID_REPEAT_RATE = 0.05
+# Rate of missing dates of diagnosis and NOR diagnoses
+MISSING_DATE_RATE = 0.06
+MISSING_NOR_DIAGNOSIS_RATE = 0.03
+# Rate of "D" diagnoses, the rest are "C"
+D_DIAGNOSIS_RATE = 0.15
+
+FIRST_YEAR = 1995
+LAST_YEAR = 2023
+
+# Number of rows generated at once when writing a CSV file
+CHUNK_ROWS = 1_000_000
+
+# `Stav` values with a diagnosis, as (prefix, suffix) around the code
+_TARGET_TEMPLATES = [
+    ("", ""),
+    (" ", " "),
+    ("zmena na ", ""),
+    ("opravit dle NOR: ", ""),
+    ("", " - potvrzeno"),
+]
+# `Stav` values without a diagnosis
+_OTHER_STAV = ["ponechat", "ok", "bez zmeny", "?", " ", "nelze rozhodnout"]
+# Rate of rows without a diagnosis having a value in `Stav`
+_OTHER_STAV_RATE = 0.2
+
+
+def _random_codes(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Generate `n` ICD-10 codes like C18, C189 or D05"""
+    letters = pd.Series(np.where(rng.random(n) < D_DIAGNOSIS_RATE, "D", "C"))
+    numbers = pd.Series(rng.integers(0, 98, n)).astype(str).str.zfill(2)
+    third = pd.Series(rng.integers(0, 10, n)).astype(str)
+    third[rng.random(n) < 0.5] = ""
+    return np.asarray(letters + numbers + third, dtype=object)
+
+
+def _generate(
+    n_rows: int, rng: np.random.Generator, first_patient_id: int
+) -> tuple[pd.DataFrame, int]:
+    """
+    Generate `n_rows` rows of whole patients.
+
+    Returns:
+        tuple[pd.DataFrame, int]
+            Generated data and the number of generated patients
+    """
+    # Number of rows of each patient
+    sizes = np.minimum(
+        rng.geometric(1 / MEAN_ROWS_PER_PATIENT, size=n_rows),
+        MAX_ROWS_PER_PATIENT,
+    )
+    ends = np.cumsum(sizes)
+    n_patients = int(np.searchsorted(ends, n_rows)) + 1
+    sizes = sizes[:n_patients]
+    sizes[-1] -= ends[n_patients - 1] - n_rows
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    patient = np.repeat(np.arange(n_patients), sizes)
+    is_first = np.zeros(n_rows, dtype=bool)
+    is_first[starts] = True
+
+    # Patient ID only in the first row of the patient (mostly)
+    ids = pd.array(first_patient_id + patient, dtype="Int64")
+    ids[~is_first & (rng.random(n_rows) >= ID_REPEAT_RATE)] = pd.NA
+
+    # LPZ diagnosis only in the first row of the patient
+    lpz_diagnosis = np.full(n_rows, None, dtype=object)
+    lpz_diagnosis[starts] = _random_codes(rng, n_patients)
+
+    nor_diagnosis = _random_codes(rng, n_rows)
+    nor_diagnosis[rng.random(n_rows) < MISSING_NOR_DIAGNOSIS_RATE] = None
+
+    # Dates of diagnosis, some missing
+    days = (
+        np.datetime64(f"{LAST_YEAR + 1}-01-01")
+        - np.datetime64(f"{FIRST_YEAR}-01-01")
+    ).astype(int)
+    dates = (
+        np.datetime64(f"{FIRST_YEAR}-01-01")
+        + rng.integers(0, days, n_rows).astype("timedelta64[D]")
+    ).astype(str).astype(object)
+    dates[rng.random(n_rows) < MISSING_DATE_RATE] = None
+
+    # Year of the extract
+    years = rng.integers(FIRST_YEAR, LAST_YEAR + 1, n_patients)[patient]
+
+    # `Stav` with noise, and a diagnosis in one row of positive patients
+    stav = np.full(n_rows, None, dtype=object)
+    has_other = rng.random(n_rows) < _OTHER_STAV_RATE
+    stav[has_other] = rng.choice(_OTHER_STAV, int(has_other.sum()))
+
+    positive = rng.random(n_patients) < POSITIVE_RATE
+    rows = starts[positive] + rng.integers(0, sizes[positive])
+    missing = pd.isna(nor_diagnosis[rows])
+    nor_diagnosis[rows[missing]] = _random_codes(rng, int(missing.sum()))
+    templates = rng.integers(0, len(_TARGET_TEMPLATES), len(rows))
+    for i, (prefix, suffix) in enumerate(_TARGET_TEMPLATES):
+        template_rows = rows[templates == i]
+        stav[template_rows] = prefix + nor_diagnosis[template_rows] + suffix
+
+    assert hasattr(DATA_COLUMNS, "patient_id")
+    assert hasattr(DATA_COLUMNS, "date_of_diagnosis")
+    assert hasattr(DATA_COLUMNS, "lpz_diagnosis")
+    assert hasattr(DATA_COLUMNS, "nor_diagnosis")
+    assert hasattr(DATA_COLUMNS, "target")
+    assert hasattr(DATA_COLUMNS, "year")
+
+    data = pd.DataFrame(
+        {
+            DATA_COLUMNS.patient_id: ids,
+            DATA_COLUMNS.date_of_diagnosis: dates,
+            DATA_COLUMNS.lpz_diagnosis: lpz_diagnosis,
+            DATA_COLUMNS.nor_diagnosis: nor_diagnosis,
+            DATA_COLUMNS.target: stav,
+            DATA_COLUMNS.year: years,
+        }
+    )
+    return data, n_patients
+
+
+def generate_raw_data(
+    n_rows: int, seed: int = 0, first_patient_id: int = 1
+) -> pd.DataFrame:
+    """
+    Generate a synthetic raw extract.
+
+    Parameters:
+        n_rows: int
+            Number of rows to generate
+        seed: int
+            Seed of the random generator, the same seed gives the same data
+        first_patient_id: int
+            `IDLPZ` of the first patient, the following are increasing
+
+    Returns:
+        pd.DataFrame
+            Raw data with the columns of `DATA_COLUMNS`
+    """
+    data, _ = _generate(n_rows, np.random.default_rng(seed), first_patient_id)
+    return data
+
+
+def write_raw_csv(
+    path: Path, n_rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS
+) -> None:
+    """
+    Write a synthetic raw extract to the CSV file in chunks of whole patients.
+
+    Parameters:
+        path: Path
+            Path to the CSV file
+        n_rows: int
+            Number of rows to generate
+        seed: int
+            Seed of the random generator, the same seed gives the same file
+            for the same `chunk_rows`
+        chunk_rows: int
+            Number of rows generated at once
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    first_patient_id = 1
+    for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+        rng = np.random.default_rng([seed, chunk])
+        data, n_patients = _generate(
+            min(chunk_rows, n_rows - start), rng, first_patient_id
+        )
+        data.to_csv(
+            path, mode="w" if chunk == 0 else "a", header=chunk == 0, index=False
+        )
+        first_patient_id += n_patients
@@ -0,0 +1,65 @@
+"""
+Timing records for pipeline stages.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from lib.profiling import get_active_profiler
+
+logger = logging.getLogger(__name__)
+
+
+class StageTiming:
+    """
+    Timing of a pipeline stage.
+    The number of processed rows can be set while the stage is running.
+    """
+
+    def __init__(self, name: str, rows: int | None = None):
+        self.name = name
+        self.rows = rows
+        self.duration: float | None = None
+
+
+@contextmanager
+def log_stage(name: str, rows: int | None = None) -> Iterator[StageTiming]:
+    """
+    Time the stage and log a timing record with its duration and row count
+    when the stage finishes. The record carries the fields `stage`,
+    `duration_s` and `rows`, so it can be filtered from the JSON log.
+    If a `lib.profiling.profile` is active, the stage is also profiled.
+
+    Example:
+        with log_stage("read_csv") as stage:
+            data = pd.read_csv(path)
+            stage.rows = len(data)
+
+    Parameters:
+        name: str
+            Name of the stage
+        rows: int | None
+            Number of rows processed by the stage, if known in advance
+    """
+    timing = StageTiming(name, rows)
+    # Record the stage also in the profile, if profiling is active
+    profiler = get_active_profiler()
+    profile = profiler.start_stage(name, rows) if profiler else None
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.duration = time.perf_counter() - start
+        if profiler and profile:
+            profiler.end_stage(profile, timing.rows)
+        logger.info(
+            f"Stage {name} finished in {timing.duration:.3f} s"
+            + (f" ({timing.rows} rows)" if timing.rows is not None else ""),
+            extra={
+                "stage": name,
+                "duration_s": round(timing.duration, 6),
+                "rows": timing.rows,
+            },
+        )
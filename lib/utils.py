@@ -1,5 +1,11 @@
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
 import pandas as pd
 
+from lib.record_store import PREPROCESSED_TABLE, RAW_TABLE, RecordStore
+
 
 def get_dir_path(year: int) -> str:
     """
@@ -80,3 +86,82 @@ def read_preprocessed_dataset(year: int) -> pd.DataFrame:
     data = pd.read_csv(get_preprocessed_file_path(year))
 
     return data
+
+
+def file_hash(path: Path, block_size: int = 1024 * 1024) -> str:
+    """
+    Get the SHA-256 hash of the file content.
+
+    Parameters:
+        path: Path
+            Path to the file.
+        block_size: int
+            Number of bytes read at once.
+
+    Returns:
+        str
+            The hexadecimal hash.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_raw_records(
+    db_path: Path,
+    first_year: int | None = None,
+    last_year: int | None = None,
+    patient_ids: Iterable | None = None,
+) -> pd.DataFrame:
+    """
+    Read the raw records from the store created by `lpz ingest`,
+    e.g., to score the patients of given years.
+
+    Parameters:
+        db_path: Path
+            Path to the SQLite store.
+        first_year: int | None
+            First year of the records (inclusive), not limited if None.
+        last_year: int | None
+            Last year of the records (inclusive), not limited if None.
+        patient_ids: Iterable | None
+            IDs of the patients, all patients if None.
+
+    Returns:
+        pd.DataFrame
+            The raw records with forward filled patient IDs.
+    """
+    with RecordStore(db_path) as store:
+        return store.read(RAW_TABLE, first_year, last_year, patient_ids)
+
+
+def read_preprocessed_records(
+    db_path: Path,
+    first_year: int | None = None,
+    last_year: int | None = None,
+    patient_ids: Iterable | None = None,
+) -> pd.DataFrame:
+    """
+    Read the preprocessed records from the store created by `lpz ingest`,
+    e.g., to train on a range of years.
+
+    Parameters:
+        db_path: Path
+            Path to the SQLite store.
+        first_year: int | None
+            First year of the records (inclusive), not limited if None.
+        last_year: int | None
+            Last year of the records (inclusive), not limited if None.
+        patient_ids: Iterable | None
+            IDs of the patients, all patients if None.
+
+    Returns:
+        pd.DataFrame
+            The preprocessed records.
+    """
+    with RecordStore(db_path) as store:
+        return store.read(
+            PREPROCESSED_TABLE, first_year, last_year, patient_ids
+        )
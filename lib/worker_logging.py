@@ -0,0 +1,64 @@
+"""
+Logging of worker processes.
+
+A worker process does not share the logging of the parent process: under
+spawn its logging is not configured, under fork it inherits the queue
+handler of the parent without the listener thread, so its records are lost.
+The workers put their records into a process-safe queue instead, which is
+drained in a thread of the parent process to the parent's loggers.
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class _ForwardHandler(logging.Handler):
+    """Pass the records of the workers to the loggers of this process"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def _worker_level() -> int:
+    """Level of the root logger, raised by `logging.disable` if set"""
+    return max(
+        logging.getLogger().getEffectiveLevel(),
+        logging.root.manager.disable + 1,
+    )
+
+
+@contextmanager
+def worker_log_queue() -> Iterator[tuple[multiprocessing.Queue, int]]:
+    """
+    Forward the records logged by worker processes to this process while
+    the context is active. Pass the yielded queue and level to
+    `init_worker_logging` in the initializer of the workers.
+
+    Yields:
+        tuple[multiprocessing.Queue, int]
+            Queue of the records and the logging level of the workers
+    """
+    log_queue: multiprocessing.Queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    try:
+        yield log_queue, _worker_level()
+    finally:
+        listener.stop()
+        log_queue.close()
+        log_queue.join_thread()
+
+
+def init_worker_logging(log_queue: multiprocessing.Queue, level: int) -> None:
+    """
+    Log the records of the worker process to the queue of
+    `worker_log_queue`, replacing the handlers inherited from the parent.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
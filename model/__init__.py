@@ -1,5 +1,17 @@
+from model.pipeline import (
+    predict_from_csv,
+    save_model,
+    train_and_save,
+)
+from model.predict import load_model, predict, prepare_features
 from model.train import train
 
 __all__ = [
+    "load_model",
+    "predict",
+    "predict_from_csv",
+    "prepare_features",
+    "save_model",
     "train",
+    "train_and_save",
 ]
@@ -0,0 +1,217 @@
+"""
+Parallel prediction of many data files.
+
+Files are predicted in a process pool. Each worker process loads the model
+once and predicts the files assigned to it. A failing file is reported in
+the summary and does not stop the other files.
+"""
+
+import glob
+import logging
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pandas as pd
+import xgboost as xgb
+
+from lib.runtime_config import get_runtime_config
+from lib.worker_logging import init_worker_logging, worker_log_queue
+from model.pipeline import ProgressCallback, predict_file, report_progress
+from model.predict import load_model
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE_NAME = "summary.csv"
+PREDICTIONS_SUFFIX = "_predictions.csv"
+
+# Model loaded once in each worker process
+_WORKER_MODEL: xgb.XGBClassifier | None = None
+
+
+def find_data_files(source: str | Path) -> list[Path]:
+    """
+    Find the data files to predict.
+
+    Parameters:
+        source: str | Path
+            Directory with CSV files, or a glob pattern (e.g., "data/*.csv")
+
+    Returns:
+        list[Path]
+            Sorted paths of the found files
+    """
+    if Path(source).is_dir():
+        return sorted(Path(source).glob("*.csv"))
+    return sorted(Path(path) for path in glob.glob(str(source)))
+
+
+def get_output_path(data_path: Path, output_dir: Path) -> Path:
+    """Return the path of the predictions of the data file"""
+    return Path(output_dir, data_path.stem + PREDICTIONS_SUFFIX)
+
+
+def _init_worker(
+    model_path: Path,
+    n_threads: int,
+    log_queue: multiprocessing.Queue,
+    log_level: int,
+) -> None:
+    """Set up the logging and load the model in the worker process"""
+    global _WORKER_MODEL
+    init_worker_logging(log_queue, log_level)
+    _WORKER_MODEL = load_model(model_path)
+    # The files are predicted in parallel, limit the threads of each worker
+    _WORKER_MODEL.set_params(n_jobs=n_threads)
+
+
+def _failed_summary(data_path: Path, error: Exception, seconds: float) -> dict:
+    """Summary of the file whose prediction failed with the error"""
+    return {
+        "file": str(data_path),
+        "output": "",
+        "status": "failed",
+        "rows": 0,
+        "positive": 0,
+        "seconds": seconds,
+        "error": f"{error.__class__.__name__}: {error}",
+        "traceback": "".join(traceback.format_exception(error)),
+    }
+
+
+def _predict_worker(data_path: Path, output_dir: Path) -> dict:
+    """
+    Predict the file in the worker process.
+
+    Returns:
+        dict
+            Summary of the file, with the error if the prediction failed
+    """
+    assert _WORKER_MODEL is not None
+
+    output_path = get_output_path(data_path, output_dir)
+    start = time.perf_counter()
+    try:
+        predictions = predict_file(_WORKER_MODEL, data_path, output_path)
+    except Exception as e:
+        return _failed_summary(data_path, e, time.perf_counter() - start)
+
+    return {
+        "file": str(data_path),
+        "output": str(output_path),
+        "status": "ok",
+        "rows": len(predictions),
+        "positive": int(predictions.sum()),
+        "seconds": time.perf_counter() - start,
+        "error": "",
+        "traceback": "",
+    }
+
+
+def predict_batch(
+    model_path: Path,
+    data_paths: list[Path],
+    output_dir: Path,
+    workers: int | None = None,
+    progress: ProgressCallback | None = None,
+) -> pd.DataFrame:
+    """
+    Predict the data files in parallel and save the predictions of each file
+    to the output directory, together with the summary of all the files.
+
+    Parameters:
+        model_path: Path
+            Path to the model saved as a JSON file
+        data_paths: list[Path]
+            Raw data files to predict
+        output_dir: Path
+            Directory to save the predictions and the summary to
+        workers: int | None
+            Number of worker processes, defaults to the runtime config
+        progress: ProgressCallback | None
+            Called with the progress after each finished file
+
+    Returns:
+        pd.DataFrame
+            Summary with the status, rows and timing of each file
+    """
+    if not data_paths:
+        raise ValueError("No data files to predict")
+
+    config = get_runtime_config()
+    workers = min(workers or config.workers, len(data_paths))
+    n_threads = config.threads_per_worker(workers)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(
+        f"Predicting {len(data_paths)} files with {workers} workers"
+        f" using model: {model_path}"
+    )
+    report_progress(progress, f"Predicting {len(data_paths)} files", 0)
+
+    start = time.perf_counter()
+    summaries = []
+    with worker_log_queue() as (log_queue, log_level):
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(model_path, n_threads, log_queue, log_level),
+        )
+        try:
+            futures = {
+                executor.submit(
+                    _predict_worker, data_path, output_dir
+                ): data_path
+                for data_path in data_paths
+            }
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except BrokenProcessPool as e:
+                    # A worker crashed or could not load the model, the
+                    # files not predicted yet fail too
+                    summary = _failed_summary(futures[future], e, 0.0)
+                summaries.append(summary)
+
+                if summary["status"] == "ok":
+                    logger.info(
+                        f"Predicted {summary['file']}: {summary['rows']} rows"
+                        f" in {summary['seconds']:.2f} s"
+                        f" ({summary['rows'] / summary['seconds']:,.0f}"
+                        " rows/s)"
+                    )
+                else:
+                    logger.error(
+                        f"Failed to predict {summary['file']}:"
+                        f" {summary['error']}\n{summary['traceback']}"
+                    )
+                report_progress(
+                    progress,
+                    f"Predicted {len(summaries)}/{len(data_paths)} files",
+                    len(summaries) / len(data_paths),
+                )
+        except BaseException:
+            # E.g., cancelled, do not start the remaining files
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    summary_df = pd.DataFrame(summaries).drop(columns="traceback")
+    summary_df["rows_per_s"] = summary_df["rows"] / summary_df["seconds"]
+    summary_df = summary_df.sort_values("file")
+    summary_df.to_csv(Path(output_dir, SUMMARY_FILE_NAME), index=False)
+
+    failed = (summary_df["status"] != "ok").sum()
+    total_rows = summary_df["rows"].sum()
+    logger.info(
+        f"Predicted {len(summary_df) - failed}/{len(summary_df)} files,"
+        f" {total_rows} rows in {elapsed:.2f} s"
+        f" ({total_rows / elapsed:,.0f} rows/s), {failed} failed."
+        f" Summary saved to {Path(output_dir, SUMMARY_FILE_NAME)}"
+    )
+
+    return summary_df
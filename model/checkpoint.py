@@ -0,0 +1,326 @@
+"""
+Resumable checkpointed prediction of large CSV files.
+
+The file is predicted in numbered chunks (see `model.streaming.iter_chunks`).
+The predictions of each chunk are written atomically to a part file in the
+work directory next to the output, and the finished chunks are recorded in
+a small manifest. A run stopped by a crash or a reboot is continued with
+`resume=True`: the finished chunks are read but not predicted again. When
+all the chunks are finished, the parts are joined to the output file, which
+is byte-identical to the predictions CSV of `predict_file`.
+
+Every file is flushed to the disk before it is renamed, and a chunk is
+recorded as finished only when its part is on the disk. The size and the
+hash of each part are recorded, so a part damaged by a crash is predicted
+again on resume.
+
+Work directory of `predictions.csv`, `predictions.csv.chunks/`:
+    manifest.json               inputs of the run and the finished chunks
+                                with the size and hash of their parts
+    chunk_000000.csv            predictions of the chunk, the first with
+                                the header
+    chunk_000000.sketch.json    sketch of the chunk for the drift report
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+import xgboost as xgb
+
+from data_preparation.drift import DataSketch
+from lib.runtime_config import get_runtime_config
+from model.pipeline import load_sketch, report_drift
+from model.prediction_cache import model_fingerprint
+from model.predict import (
+    PREDICTION_THRESHOLD,
+    load_model,
+    predict_proba,
+    prepare_features,
+)
+from model.streaming import ROW_BYTES, iter_chunks, scan_fill_year
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "manifest.json"
+# Increase when the format of the work directory changes
+MANIFEST_VERSION = 3
+# Size of the copy buffer when joining the parts
+_COPY_BYTES = 2**20
+
+
+def get_work_dir(save_path: Path) -> Path:
+    """Return the work directory of the chunks of the output file"""
+    return save_path.with_name(save_path.name + ".chunks")
+
+
+def _part_path(work_dir: Path, index: int) -> Path:
+    return Path(work_dir, f"chunk_{index:06d}.csv")
+
+
+def _sketch_path(work_dir: Path, index: int) -> Path:
+    return Path(work_dir, f"chunk_{index:06d}.sketch.json")
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Flush the renames in the directory to the disk (not on Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_durably(path: Path, data: bytes) -> None:
+    """Write the file atomically and flush it to the disk"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+def _write_json(path: Path, values: dict) -> None:
+    """Write the JSON file atomically and durably"""
+    _write_durably(path, json.dumps(values, indent=2).encode("utf-8"))
+
+
+def _file_record(data: bytes) -> dict:
+    """Size and hash of a file of a chunk, checked before it is reused"""
+    return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def _file_is_intact(path: Path, record: dict) -> bool:
+    """Check the file on the disk matches its record in the manifest"""
+    if not path.exists() or path.stat().st_size != record["size"]:
+        return False
+    return bool(
+        hashlib.sha256(path.read_bytes()).hexdigest() == record["sha256"]
+    )
+
+
+def _run_inputs(
+    model: xgb.XGBClassifier, data_path: Path, chunk_rows: int
+) -> dict:
+    """Inputs the chunks depend on, a run is resumed only if they match"""
+    stat = data_path.stat()
+    return {
+        "version": MANIFEST_VERSION,
+        "data_path": str(data_path.resolve()),
+        "data_size": stat.st_size,
+        "data_mtime_ns": stat.st_mtime_ns,
+        "model": model_fingerprint(model),
+        "chunk_rows": chunk_rows,
+    }
+
+
+def _load_manifest(work_dir: Path, inputs: dict) -> dict | None:
+    """
+    Return the manifest of the stopped run in the work directory, None if
+    there is none. Raise an error if it was run with other inputs.
+    """
+    manifest_path = Path(work_dir, MANIFEST_FILE_NAME)
+    if not manifest_path.exists():
+        return None
+
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest: dict = json.load(f)
+
+    changed = [
+        name
+        for name, value in inputs.items()
+        if manifest["inputs"].get(name) != value
+    ]
+    if changed:
+        raise ValueError(
+            f"Cannot resume {work_dir}, it was run with other"
+            f" {', '.join(changed)}. Run without resume to start over."
+        )
+    # Finished chunks whose part or sketch is missing or damaged are
+    # predicted again
+    finished = {}
+    for index, chunk in manifest["finished"].items():
+        if _file_is_intact(
+            _part_path(work_dir, int(index)), chunk["part"]
+        ) and _file_is_intact(
+            _sketch_path(work_dir, int(index)), chunk["sketch"]
+        ):
+            finished[index] = chunk
+        else:
+            logger.warning(
+                f"Part of chunk {index} in {work_dir} is missing or"
+                " damaged, predicting it again"
+            )
+    manifest["finished"] = finished
+    return manifest
+
+
+def _join_parts(work_dir: Path, n_chunks: int, save_path: Path) -> None:
+    """Join the parts in order to the output file atomically"""
+    tmp_path = save_path.with_name(save_path.name + ".tmp")
+    with open(tmp_path, "wb") as out:
+        for index in range(n_chunks):
+            with open(_part_path(work_dir, index), "rb") as part:
+                shutil.copyfileobj(part, out, _COPY_BYTES)
+        # On the disk before the parts are removed
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, save_path)
+    _fsync_dir(save_path.parent)
+
+
+def predict_checkpointed(
+    model: xgb.XGBClassifier,
+    data_path: Path,
+    save_path: Path,
+    resume: bool = False,
+    chunk_rows: int | None = None,
+    reference_sketch: DataSketch | None = None,
+) -> int:
+    """
+    Predict the raw data in numbered chunks with a checkpoint after each
+    chunk and save the predictions as CSV, the same file as `predict_file`
+    saves. The work directory is removed when the output is saved.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        data_path: Path
+            Path to the raw data to predict
+        save_path: Path
+            Path to save the predictions to
+        resume: bool
+            Continue the stopped run in the work directory, if any.
+            Without resume, the work directory is cleared.
+        chunk_rows: int | None
+            Number of rows of a chunk. If None, sized from the memory budget
+            of `lib.runtime_config`, or taken from the resumed run.
+        reference_sketch: DataSketch | None
+            Sketch of the training data, the data are checked for drift
+            when all the chunks are predicted
+
+    Returns:
+        int
+            Number of predicted rows
+    """
+    work_dir = get_work_dir(save_path)
+    manifest_path = Path(work_dir, MANIFEST_FILE_NAME)
+
+    manifest = None
+    if resume and manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            resumed_rows = json.load(f)["inputs"]["chunk_rows"]
+        if chunk_rows not in (None, resumed_rows):
+            raise ValueError(
+                f"Cannot resume {work_dir} with {chunk_rows} rows per chunk,"
+                f" it was run with {resumed_rows}"
+            )
+        chunk_rows = resumed_rows
+    if chunk_rows is None:
+        chunk_rows = get_runtime_config().chunk_rows(ROW_BYTES)
+
+    inputs = _run_inputs(model, data_path, chunk_rows)
+    if resume:
+        manifest = _load_manifest(work_dir, inputs)
+    if manifest is None:
+        if resume:
+            logger.info(f"Nothing to resume in {work_dir}, starting over")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        manifest = {
+            "inputs": inputs,
+            "fill_year": scan_fill_year(data_path, chunk_rows),
+            "finished": {},
+        }
+        _write_json(manifest_path, manifest)
+    else:
+        logger.info(
+            f"Resuming {work_dir}: {len(manifest['finished'])} chunks"
+            " already finished"
+        )
+
+    start = time.perf_counter()
+    rows = 0
+    predicted = 0
+    n_chunks = 0
+    for index, chunk in enumerate(iter_chunks(data_path, chunk_rows)):
+        n_chunks += 1
+        if str(index) in manifest["finished"]:
+            rows += manifest["finished"][str(index)]["rows"]
+            continue
+
+        sketch = DataSketch()
+        features, _ = prepare_features(
+            chunk, fill_year=manifest["fill_year"], sketch=sketch
+        )
+        probabilities = predict_proba(model, features)
+        predictions = pd.DataFrame(
+            (probabilities > PREDICTION_THRESHOLD).astype(int),
+            columns=["prediction"],
+        )
+
+        # The part and its sketch are on the disk before the chunk is
+        # recorded as finished. The same line endings as `DataFrame.to_csv`
+        # to a path.
+        part = predictions.to_csv(
+            header=index == 0, index=False, lineterminator=os.linesep
+        ).encode("utf-8")
+        sketch_json = json.dumps(sketch.to_dict()).encode("utf-8")
+        _write_durably(_part_path(work_dir, index), part)
+        _write_durably(_sketch_path(work_dir, index), sketch_json)
+        manifest["finished"][str(index)] = {
+            "rows": len(predictions),
+            "part": _file_record(part),
+            "sketch": _file_record(sketch_json),
+        }
+        _write_json(manifest_path, manifest)
+
+        rows += len(predictions)
+        predicted += len(predictions)
+        logger.info(f"Chunk {index} finished: {len(predictions)} rows")
+
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    _join_parts(work_dir, n_chunks, save_path)
+
+    if reference_sketch is not None:
+        sketch = DataSketch()
+        for index in range(n_chunks):
+            sketch.merge(DataSketch.load(_sketch_path(work_dir, index)))
+        report_drift(reference_sketch, sketch, save_path)
+
+    shutil.rmtree(work_dir)
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"Predicted {predicted} of {rows} rows in {n_chunks} chunks to"
+        f" {save_path} in {seconds:.1f} s"
+    )
+    return rows
+
+
+def predict_checkpointed_from_csv(
+    model_path: Path,
+    data_path: Path,
+    save_path: Path,
+    resume: bool = False,
+    chunk_rows: int | None = None,
+) -> int:
+    """Load the model and run `predict_checkpointed`"""
+    logger.info(f"Predicting data using model: {model_path}")
+    model = load_model(model_path)
+    return predict_checkpointed(
+        model,
+        data_path,
+        save_path,
+        resume,
+        chunk_rows,
+        reference_sketch=load_sketch(model_path),
+    )
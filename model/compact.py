@@ -0,0 +1,320 @@
+"""
+Latency-budgeted compaction of a trained model.
+
+The trees of a trained model are searched for the smallest model whose
+validation AUC stays within a tolerance of the AUC of the trained model:
+  - tree count: the first trees of the model (no retraining),
+  - depth: the model retrained with a smaller `max_depth`,
+  - pruning: the splits with a loss reduction below `gamma` pruned away.
+The size of a model is the number of its nodes, which the prediction
+latency grows with.
+"""
+
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+
+from data_preparation import drop_id_from_data, preprocess_data
+from lib import DATA_COLUMNS as DC
+from lib.runtime_config import get_runtime_config
+from lib.timing import log_stage
+from model.hyperparams import get_xgbc_hyperparams
+from model.pipeline import ProgressCallback, read_data, report_progress
+from model.predict import load_model
+
+logger = logging.getLogger(__name__)
+
+# Maximum decrease of the validation AUC
+DEFAULT_AUC_TOLERANCE = 0.005
+DEFAULT_DEPTHS = [2, 3, 4, 5, 6]
+DEFAULT_GAMMAS = [0.0, 0.5, 1.0, 2.0, 5.0]
+# Step of the searched tree counts
+TREE_COUNT_STEP = 10
+# Number of single-row predictions the latency is measured on
+LATENCY_SINGLE_ROWS = 200
+CANDIDATE_COLUMNS = ["max_depth", "gamma", "trees", "nodes", "auc"]
+
+
+def _read_features(data_path: Path) -> tuple[pd.DataFrame, pd.Series]:
+    """Read and preprocess the raw data, return the features and target"""
+    assert hasattr(DC, "target")
+
+    data = read_data(data_path)
+    with log_stage("preprocess", rows=len(data)):
+        data, _ = drop_id_from_data(preprocess_data(data))
+    return data.drop(DC.target, axis=1), data[DC.target]
+
+
+def tree_nodes(booster: xgb.Booster) -> np.ndarray:
+    """Return the number of nodes of each tree of the booster"""
+    return np.array([len(tree.splitlines()) for tree in booster.get_dump()])
+
+
+def prune_booster(
+    booster: xgb.Booster, dtrain: xgb.DMatrix, gamma: float
+) -> xgb.Booster:
+    """
+    Return a copy of the booster with the splits of a loss reduction
+    below `gamma` on the training data pruned away
+    """
+    params = {
+        "process_type": "update",
+        "updater": "prune",
+        "gamma": gamma,
+        "nthread": get_runtime_config().threads,
+    }
+    return xgb.train(
+        params,
+        dtrain,
+        num_boost_round=booster.num_boosted_rounds(),
+        xgb_model=booster.copy(),
+    )
+
+
+def search_candidates(
+    model: xgb.XGBClassifier,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_valid: pd.DataFrame,
+    y_valid: pd.Series,
+    depths: list[int] = DEFAULT_DEPTHS,
+    gammas: list[float] = DEFAULT_GAMMAS,
+    progress: ProgressCallback | None = None,
+) -> tuple[pd.DataFrame, dict[tuple[int, float], xgb.Booster]]:
+    """
+    Evaluate the validation AUC and the size of each combination of the
+    depth, the pruning and the tree count.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        X_train, y_train:
+            Features and target of the training data, the smaller depths
+            are retrained and the pruning is done on them
+        X_valid, y_valid:
+            Features and target of the validation data
+        depths: list[int]
+            Searched depths, the ones above the depth of the model are
+            skipped. The depth of the model uses the model itself.
+        gammas: list[float]
+            Searched minimum loss reductions of a split, 0 is unpruned
+
+    Returns:
+        tuple[pd.DataFrame, dict[tuple[int, float], xgb.Booster]]
+            Candidates with the columns `CANDIDATE_COLUMNS`, and the
+            whole booster of each depth and gamma
+    """
+    model_depth = model.get_params()["max_depth"]
+    n_trees = model.get_booster().num_boosted_rounds()
+    tree_counts = sorted(
+        set(range(TREE_COUNT_STEP, n_trees, TREE_COUNT_STEP)) | {n_trees}
+    )
+    depths = sorted({depth for depth in depths if depth < model_depth})
+    depths.append(model_depth)
+    gammas = sorted(set(gammas) | {0.0})
+
+    dtrain = xgb.DMatrix(X_train, y_train, enable_categorical=True)
+    dvalid = xgb.DMatrix(X_valid, enable_categorical=True)
+
+    candidates = []
+    boosters: dict[tuple[int, float], xgb.Booster] = {}
+    n_steps = len(depths) * len(gammas)
+    for depth in depths:
+        if depth == model_depth:
+            depth_booster = model.get_booster()
+        else:
+            retrained = xgb.XGBClassifier(
+                **get_xgbc_hyperparams()
+                | {"max_depth": depth, "n_estimators": n_trees}
+            )
+            with log_stage("fit", rows=len(X_train)):
+                retrained.fit(X_train, y_train)
+            depth_booster = retrained.get_booster()
+
+        for gamma in gammas:
+            report_progress(
+                progress,
+                f"Evaluating depth {depth}, gamma {gamma}",
+                0.1 + 0.8 * len(boosters) / n_steps,
+            )
+            booster = (
+                prune_booster(depth_booster, dtrain, gamma)
+                if gamma > 0
+                else depth_booster
+            )
+            boosters[(depth, gamma)] = booster
+
+            nodes = np.cumsum(tree_nodes(booster))
+            for trees in tree_counts:
+                probabilities = booster.predict(
+                    dvalid, iteration_range=(0, trees)
+                )
+                candidates.append(
+                    {
+                        "max_depth": depth,
+                        "gamma": gamma,
+                        "trees": trees,
+                        "nodes": int(nodes[trees - 1]),
+                        "auc": roc_auc_score(y_valid, probabilities),
+                    }
+                )
+
+    return pd.DataFrame(candidates, columns=CANDIDATE_COLUMNS), boosters
+
+
+def measure_latency(
+    booster: xgb.Booster,
+    features: pd.DataFrame,
+    single_rows: int = LATENCY_SINGLE_ROWS,
+) -> dict[str, float]:
+    """
+    Measure the prediction latency of the booster.
+
+    Returns:
+        dict[str, float]
+            Microseconds per row of the batch prediction of the features,
+            and the median milliseconds of predicting a single row
+    """
+    # Warm up
+    booster.inplace_predict(features.iloc[:1])
+
+    start = time.perf_counter()
+    booster.inplace_predict(features)
+    batch_s = time.perf_counter() - start
+
+    single_s = []
+    for i in range(min(single_rows, len(features))):
+        row = features.iloc[i : i + 1]
+        start = time.perf_counter()
+        booster.inplace_predict(row)
+        single_s.append(time.perf_counter() - start)
+
+    return {
+        "batch_us_per_row": batch_s / max(len(features), 1) * 1e6,
+        "single_row_ms": float(np.median(single_s)) * 1e3,
+    }
+
+
+def _describe(
+    name: str, booster: xgb.Booster, auc: float, latency: dict
+) -> dict:
+    """Row of the comparison of the trained and the compact model"""
+    return {
+        "model": name,
+        "trees": booster.num_boosted_rounds(),
+        "nodes": int(tree_nodes(booster).sum()),
+        "size_kb": len(booster.save_raw("json")) / 1024,
+        "auc": auc,
+    } | latency
+
+
+def compact_model(
+    model_path: Path,
+    train_path: Path,
+    valid_path: Path,
+    save_path: Path,
+    tolerance: float = DEFAULT_AUC_TOLERANCE,
+    depths: list[int] = DEFAULT_DEPTHS,
+    gammas: list[float] = DEFAULT_GAMMAS,
+    progress: ProgressCallback | None = None,
+) -> pd.DataFrame:
+    """
+    Find the smallest model with the validation AUC within the tolerance
+    of the trained model and save it. The searched candidates are saved
+    next to it (`<save_path>.candidates.csv`).
+
+    Parameters:
+        model_path: Path
+            Path to the trained model saved as a JSON file
+        train_path: Path
+            Path to the raw training data
+        valid_path: Path
+            Path to the raw validation data, with the target
+        save_path: Path
+            Path to save the compact model to (JSON)
+        tolerance: float
+            Maximum decrease of the validation AUC
+        depths: list[int]
+            Searched tree depths
+        gammas: list[float]
+            Searched pruning strengths (minimum loss reduction of a split)
+        progress: ProgressCallback | None
+            Called with the progress before each stage
+
+    Returns:
+        pd.DataFrame
+            Trees, nodes, size, validation AUC and latency of the trained
+            and of the compact model
+    """
+    if save_path.suffix != ".json":
+        raise ValueError(
+            f"Model must be saved as a JSON file, got {save_path.name}"
+        )
+
+    report_progress(progress, "Loading model and data", 0)
+    model = load_model(model_path)
+    X_train, y_train = _read_features(train_path)
+    X_valid, y_valid = _read_features(valid_path)
+    if y_valid.nunique() < 2:
+        raise ValueError(
+            "Validation data must have both positive and negative targets"
+        )
+
+    candidates, boosters = search_candidates(
+        model, X_train, y_train, X_valid, y_valid, depths, gammas, progress
+    )
+
+    # The trained model itself is the last candidate of its depth
+    baseline = candidates[
+        (candidates["max_depth"] == model.get_params()["max_depth"])
+        & (candidates["gamma"] == 0)
+    ].iloc[-1]
+    candidates["within_tolerance"] = candidates["auc"] >= (
+        baseline["auc"] - tolerance
+    )
+    best = (
+        candidates[candidates["within_tolerance"]]
+        .sort_values(["nodes", "trees", "max_depth", "gamma"], kind="stable")
+        .iloc[0]
+    )
+    compact = boosters[(int(best["max_depth"]), float(best["gamma"]))][
+        : int(best["trees"])
+    ]
+
+    report_progress(progress, "Measuring latency", 0.9)
+    trained = model.get_booster()
+    summary = pd.DataFrame(
+        [
+            _describe(
+                "trained",
+                trained,
+                baseline["auc"],
+                measure_latency(trained, X_valid),
+            ),
+            _describe(
+                "compact",
+                compact,
+                best["auc"],
+                measure_latency(compact, X_valid),
+            ),
+        ]
+    )
+
+    logger.info(f"Saving compact model to {save_path}")
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    compact.save_model(save_path)
+    candidates.to_csv(save_path.with_suffix(".candidates.csv"), index=False)
+
+    logger.info(
+        f"Compact model: depth {int(best['max_depth'])}, gamma"
+        f" {best['gamma']}, {int(best['trees'])} trees (AUC tolerance"
+        f" {tolerance}):\n" + summary.to_string(index=False)
+    )
+    report_progress(progress, "Done", 1)
+
+    return summary
@@ -0,0 +1,126 @@
+"""
+Feature contributions (SHAP values) of the predictions.
+
+The contributions are computed by XGBoost (`pred_contribs`) in one
+chunked scoring pass: the probabilities are derived from the contributions,
+whose sum is the margin (log-odds) of the row, bias included. Only the
+top-k features of each row are kept, so the memory is bounded by the chunk
+size.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from lib.runtime_config import get_runtime_config
+from lib.timing import log_stage
+
+logger = logging.getLogger(__name__)
+
+# Number of features with the highest contribution written per row
+DEFAULT_TOP_K = 3
+# Estimated bytes per feature of a row: float32 contributions, their
+# absolute values and the copy of the features in the DMatrix
+CONTRIBUTION_BYTES_PER_FEATURE = 12
+
+
+def contribution_columns(top_k: int) -> list[str]:
+    """Return the names of the columns written by `top_contributions`"""
+    return [
+        col
+        for i in range(1, top_k + 1)
+        for col in (f"top{i}_feature", f"top{i}_contribution")
+    ]
+
+
+def top_contributions(
+    contributions: np.ndarray, feature_names: list[str], top_k: int
+) -> pd.DataFrame:
+    """
+    Return the features with the highest absolute contribution of each row.
+
+    Parameters:
+        contributions: np.ndarray
+            Output of `pred_contribs`, one column per feature and the bias
+        feature_names: list[str]
+            Names of the features
+        top_k: int
+            Number of features of each row, at most the number of features
+
+    Returns:
+        pd.DataFrame
+            Names and contributions (in log-odds) of the top features,
+            the highest first, see `contribution_columns`
+    """
+    # The last column is the bias
+    values = contributions[:, :-1]
+    top_k = min(top_k, values.shape[1])
+
+    top = np.argpartition(-np.abs(values), top_k - 1, axis=1)[:, :top_k]
+    top_values = np.take_along_axis(values, top, axis=1)
+    order = np.argsort(-np.abs(top_values), axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_values = np.take_along_axis(top_values, order, axis=1)
+
+    names = np.asarray(feature_names, dtype=object)[top]
+    columns = {}
+    for i in range(top_k):
+        columns[f"top{i + 1}_feature"] = names[:, i]
+        columns[f"top{i + 1}_contribution"] = top_values[:, i]
+    return pd.DataFrame(columns)
+
+
+def predict_proba_with_contributions(
+    model: xgb.XGBClassifier,
+    features: pd.DataFrame,
+    top_k: int = DEFAULT_TOP_K,
+    chunk_rows: int | None = None,
+) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Predict the probabilities and the top-k contributing features of each
+    row in chunks, with one DMatrix and one booster call per chunk.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        features: pd.DataFrame
+            Features returned by `prepare_features`
+        top_k: int
+            Number of features of each row
+        chunk_rows: int | None
+            Number of rows of a chunk, derived from the memory budget
+            of `lib.runtime_config` if None
+
+    Returns:
+        tuple[np.ndarray, pd.DataFrame]
+            Probability of the positive class of each row, and the top
+            features of each row (see `top_contributions`)
+    """
+    if chunk_rows is None:
+        chunk_rows = get_runtime_config().chunk_rows(
+            (len(features.columns) + 1) * CONTRIBUTION_BYTES_PER_FEATURE
+        )
+
+    booster = model.get_booster()
+    probabilities = np.empty(len(features))
+    parts = [pd.DataFrame(columns=contribution_columns(top_k))]
+
+    with log_stage("predict_with_contributions", rows=len(features)):
+        for start in range(0, len(features), chunk_rows):
+            chunk = features.iloc[start : start + chunk_rows]
+            contributions = booster.predict(
+                xgb.DMatrix(chunk, enable_categorical=True),
+                pred_contribs=True,
+            )
+            # The contributions sum to the margin, the bias included
+            margin = contributions.sum(axis=1, dtype=np.float64)
+            probabilities[start : start + len(chunk)] = 1 / (
+                1 + np.exp(-margin)
+            )
+            parts.append(
+                top_contributions(contributions, list(features.columns), top_k)
+            )
+
+    return probabilities, pd.concat(parts[1:] or parts, ignore_index=True)
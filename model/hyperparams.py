@@ -1,5 +1,7 @@
 import pandas as pd
 
+from lib.runtime_config import get_runtime_config
+
 # Number of positive and negative samples in the training data
 _NEG_N: int = 3633
 _POS_N: int = 466
@@ -9,6 +11,7 @@ _XGBC_HYPERPARAMS: dict = {
     "n_estimators": 100,
     "max_depth": 6,
     "learning_rate": 0.1,
+    # Set from `lib.runtime_config` by `get_xgbc_hyperparams`
     "n_jobs": -1,
     "random_state": 42,
     # "eval_metric": "logloss",
@@ -19,5 +22,8 @@ _XGBC_HYPERPARAMS: dict = {
 
 
 def get_xgbc_hyperparams() -> dict:
-    """Return hyperparameters for XGBoostClassifier"""
-    return _XGBC_HYPERPARAMS
+    """
+    Return hyperparameters for XGBoostClassifier.
+    The number of threads is limited by the runtime config.
+    """
+    return _XGBC_HYPERPARAMS | {"n_jobs": get_runtime_config().threads}
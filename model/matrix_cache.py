@@ -0,0 +1,197 @@
+"""
+Cache of the feature matrix and the labels of the preprocessed data.
+
+The features and the labels are saved as aligned `.npy` files with a small
+JSON header (feature names, dtypes and the hash of the source data). The
+files are opened memory-mapped, so retraining on the same data skips reading
+and preprocessing, and processes using the same cache share the same pages.
+"""
+
+import gc
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib import DATA_COLUMNS as DC
+from lib.timing import log_stage
+
+logger = logging.getLogger(__name__)
+
+X_FILE_NAME = "X.npy"
+Y_FILE_NAME = "y.npy"
+META_FILE_NAME = "meta.json"
+# Increase when the format of the cache or the preprocessing changes
+CACHE_VERSION = 2
+
+
+class FeatureMatrix:
+    """
+    Memory-mapped features and labels loaded from the cache.
+
+    Attributes:
+        X: np.ndarray
+            Read-only memory-mapped features, one column per feature
+        y: np.ndarray | None
+            Read-only memory-mapped labels, if the data had the target
+        meta: dict
+            Header of the cache
+    """
+
+    def __init__(self, X: np.ndarray, y: np.ndarray | None, meta: dict):
+        self.X = X
+        self.y = y
+        self.meta = meta
+
+    @property
+    def feature_names(self) -> list[str]:
+        return list(self.meta["feature_names"])
+
+    def features(self) -> pd.DataFrame:
+        """
+        Return the features as a DataFrame with the feature names.
+        The DataFrame is a view of the memory-mapped matrix, not a copy.
+        """
+        return pd.DataFrame(self.X, columns=self.feature_names, copy=False)
+
+    def labels(self) -> pd.Series:
+        """Return the labels as a Series (a view of the memory-mapped file)"""
+        if self.y is None:
+            raise ValueError("The cached data have no labels")
+        assert hasattr(DC, "target")
+        return pd.Series(self.y, name=DC.target, copy=False)
+
+
+def save_feature_matrix(
+    cache_dir: Path,
+    data: pd.DataFrame,
+    source_hash: str,
+    sketch: dict | None = None,
+) -> None:
+    """
+    Save the features and the labels of the data to the cache directory.
+    The cache is written to a temporary directory first and then renamed,
+    so a cache is never read half-written. If the old cache cannot be
+    removed (e.g., it is still memory-mapped by another process on
+    Windows), the error is logged and the old cache is kept.
+
+    Parameters:
+        cache_dir: Path
+            Directory to save the cache to
+        data: pd.DataFrame
+            Preprocessed data without the ID column (`drop_id_from_data`)
+        source_hash: str
+            Hash of the source data, used to check the cache is valid
+        sketch: dict | None
+            Sketch of the data (`DataSketch.to_dict`) saved in the header
+    """
+    assert hasattr(DC, "target")
+
+    has_target = DC.target in data.columns
+    features = data.drop(DC.target, axis=1) if has_target else data
+    # One dtype for the whole matrix, the narrowest holding all the features
+    dtype = np.result_type(*features.dtypes)
+
+    tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with log_stage("save_feature_matrix", rows=len(data)):
+        np.save(
+            Path(tmp_dir, X_FILE_NAME),
+            np.ascontiguousarray(features.to_numpy(dtype=dtype)),
+        )
+        if has_target:
+            np.save(Path(tmp_dir, Y_FILE_NAME), data[DC.target].to_numpy())
+
+        meta = {
+            "version": CACHE_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "source_hash": source_hash,
+            "rows": len(data),
+            "feature_names": list(features.columns),
+            "feature_dtypes": [str(dtype) for dtype in features.dtypes],
+            "matrix_dtype": str(dtype),
+            "has_labels": has_target,
+            "sketch": sketch,
+        }
+        with open(Path(tmp_dir, META_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    # Release the memory maps of the old cache left in this process (e.g.,
+    # by a previous training), Windows cannot remove mapped files
+    gc.collect()
+    try:
+        if cache_dir.exists():
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+    except OSError as e:
+        logger.error(
+            f"Cannot replace the feature matrix cache {cache_dir}, it may be"
+            f" open in another process: {e}"
+        )
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    logger.info(f"Feature matrix cached to {cache_dir}")
+
+
+def load_feature_matrix(
+    cache_dir: Path, source_hash: str | None = None
+) -> FeatureMatrix | None:
+    """
+    Open the cached features and labels memory-mapped.
+
+    Parameters:
+        cache_dir: Path
+            Directory with the cache
+        source_hash: str | None
+            Expected hash of the source data, not checked if None
+
+    Returns:
+        FeatureMatrix | None
+            The cached matrix, or None if there is no valid cache
+    """
+    meta_path = Path(cache_dir, META_FILE_NAME)
+    if not meta_path.exists():
+        return None
+
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Feature matrix cache {cache_dir} is damaged: {e}")
+        return None
+
+    if meta.get("version") != CACHE_VERSION:
+        logger.info(f"Feature matrix cache {cache_dir} has an old version")
+        return None
+    if source_hash is not None and meta["source_hash"] != source_hash:
+        logger.info(f"Feature matrix cache {cache_dir} is for other data")
+        return None
+
+    # The header may be left of a partly removed cache, check the files
+    try:
+        X = np.load(Path(cache_dir, X_FILE_NAME), mmap_mode="r")
+        y = (
+            np.load(Path(cache_dir, Y_FILE_NAME), mmap_mode="r")
+            if meta["has_labels"]
+            else None
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f"Feature matrix cache {cache_dir} is damaged: {e}")
+        return None
+    if X.shape != (meta["rows"], len(meta["feature_names"])) or (
+        y is not None and y.shape != (meta["rows"],)
+    ):
+        logger.warning(
+            f"Feature matrix cache {cache_dir} does not match its header"
+        )
+        return None
+
+    logger.info(f"Feature matrix loaded from cache {cache_dir}")
+    return FeatureMatrix(X, y, meta)
@@ -0,0 +1,376 @@
+"""
+End-to-end training and prediction pipelines on CSV files.
+"""
+
+import logging
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from data_preparation import drop_id_from_data, preprocess_data
+from data_preparation.drift import DataSketch, compare_sketches, describe_drift
+from lib import DATA_COLUMNS as DC
+from lib.timing import log_stage
+from lib.utils import file_hash
+from model.explain import predict_proba_with_contributions
+from model.matrix_cache import load_feature_matrix, save_feature_matrix
+from model.prediction_cache import PredictionCache, model_fingerprint
+from model.predict import (
+    PREDICTION_THRESHOLD,
+    load_model,
+    predict_proba,
+    prepare_features,
+)
+from model.results import get_results_dir, write_results
+from model.train import fit_model
+from model.train_cache import TrainCache, training_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Called with a message and the fraction of the finished work (0 to 1)
+ProgressCallback = Callable[[str, float], None]
+
+
+def report_progress(
+    progress: ProgressCallback | None, message: str, fraction: float
+) -> None:
+    """Call the progress callback, if given"""
+    if progress is not None:
+        progress(message, fraction)
+
+
+def read_data(data_path: Path) -> pd.DataFrame:
+    """Read raw data from the CSV file"""
+    logger.info(f"Loading data: {data_path}")
+    with log_stage("read_csv") as stage:
+        data = pd.read_csv(data_path)
+        stage.rows = len(data)
+    return data
+
+
+def load_training_data(
+    data_path: Path,
+    progress: ProgressCallback | None = None,
+    matrix_cache: Path | None = None,
+    sketch: DataSketch | None = None,
+) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Read and preprocess the raw training data.
+
+    Parameters:
+        data_path: Path
+            Path to the raw training data
+        progress: ProgressCallback | None
+            Called with the progress before each stage
+        matrix_cache: Path | None
+            Directory of the feature matrix cache, see `model.matrix_cache`.
+            If the cache holds the same data, reading and preprocessing
+            are skipped, else the preprocessed data are cached there.
+        sketch: DataSketch | None
+            Updated with the counts of the data, see `data_preparation.drift`
+
+    Returns:
+        tuple[pd.DataFrame, pd.Series]
+            Features and target of the preprocessed data
+    """
+    source_hash = None
+    if matrix_cache is not None:
+        report_progress(progress, "Checking feature matrix cache", 0)
+        with log_stage("hash_data"):
+            source_hash = file_hash(data_path)
+        matrix = load_feature_matrix(matrix_cache, source_hash)
+        if matrix is not None:
+            logger.info("Using cached feature matrix")
+            if sketch is not None and matrix.meta["sketch"] is not None:
+                sketch.merge(DataSketch.from_dict(matrix.meta["sketch"]))
+            return matrix.features(), matrix.labels()
+
+    report_progress(progress, "Reading data", 0)
+    data = read_data(data_path)
+
+    report_progress(progress, "Preprocessing data", 0.2)
+    logger.info(f"Preprocessing data at {data_path}")
+    with log_stage("preprocess", rows=len(data)):
+        data = preprocess_data(data, sketch=sketch)
+        # Drop the ID column from the data
+        data, _ = drop_id_from_data(data)
+    logger.info("Data preprocessed successfully")
+
+    if matrix_cache is not None:
+        assert source_hash is not None
+        save_feature_matrix(
+            matrix_cache,
+            data,
+            source_hash,
+            sketch.to_dict() if sketch is not None else None,
+        )
+
+    assert hasattr(DC, "target")
+    return data.drop(DC.target, axis=1), data[DC.target]
+
+
+def train_and_save(
+    data_path: Path,
+    save_path: Path,
+    progress: ProgressCallback | None = None,
+    matrix_cache: Path | None = None,
+    train_cache: TrainCache | None = None,
+) -> None:
+    """
+    Train the model on the raw training data and save it.
+
+    Parameters:
+        data_path: Path
+            Path to the raw training data
+        save_path: Path
+            Path to save the model to (JSON)
+        progress: ProgressCallback | None
+            Called with the progress before each stage
+        matrix_cache: Path | None
+            Directory of the feature matrix cache, see `load_training_data`
+        train_cache: TrainCache | None
+            Cache of the trained models, see `model.train_cache`.
+            If a model was trained on the same preprocessed data with the
+            same settings, it is copied to the save path without fitting.
+
+    The sketch of the training data is saved next to the model, see
+    `get_sketch_path`.
+    """
+    if save_path.suffix != ".json":
+        raise ValueError(
+            f"Model must be saved as a JSON file, got {save_path.name}"
+        )
+
+    sketch = DataSketch()
+    X, y = load_training_data(data_path, progress, matrix_cache, sketch)
+
+    fingerprint = None
+    if train_cache is not None:
+        with log_stage("fingerprint", rows=len(X)):
+            fingerprint = training_fingerprint(X, y)
+        if train_cache.get(fingerprint, save_path):
+            save_sketch(sketch, save_path)
+            report_progress(progress, "Done", 1)
+            return
+
+    report_progress(progress, "Training model", 0.5)
+    logger.info("Training model with preprocessed data")
+    model = fit_model(X, y)
+    logger.info("Model trained successfully")
+
+    report_progress(progress, "Saving model", 0.9)
+    save_model(model, save_path)
+    save_sketch(sketch, save_path)
+
+    if train_cache is not None:
+        assert fingerprint is not None
+        train_cache.put(fingerprint, save_path)
+
+
+def save_model(model: xgb.XGBClassifier, save_path: Path) -> None:
+    """
+    Save the model to the given path as a JSON file.
+    Parent directories are created if they do not exist.
+    """
+    if save_path.suffix != ".json":
+        raise ValueError(
+            f"Model must be saved as a JSON file, got {save_path.name}"
+        )
+
+    logger.info(f"Saving model to {save_path}")
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_stage("save_model"):
+        model.save_model(save_path)
+    logger.info("Model saved successfully")
+
+
+def get_sketch_path(model_path: Path) -> Path:
+    """Return the path of the sketch of the training data of the model"""
+    return model_path.with_suffix(".sketch.json")
+
+
+def get_drift_report_path(save_path: Path) -> Path:
+    """Return the path of the drift report next to the predictions CSV"""
+    return save_path.with_suffix(".drift.csv")
+
+
+def save_sketch(sketch: DataSketch, model_path: Path) -> None:
+    """Save the sketch of the training data next to the model"""
+    if sketch.rows == 0:
+        # E.g., a feature matrix cached without the sketch
+        logger.warning("No sketch of the training data to save")
+        return
+    sketch.save(get_sketch_path(model_path))
+
+
+def load_sketch(model_path: Path) -> DataSketch | None:
+    """Load the sketch of the training data of the model, if saved"""
+    path = get_sketch_path(model_path)
+    if not path.exists():
+        logger.info(f"No sketch of the training data at {path}")
+        return None
+    return DataSketch.load(path)
+
+
+def report_drift(
+    reference: DataSketch, current: DataSketch, save_path: Path
+) -> pd.DataFrame:
+    """
+    Compare the sketch of the predicted data with the sketch of the
+    training data, log the drift report and save it next to the predictions.
+    """
+    report = compare_sketches(reference, current)
+    if report["drifted"].any():
+        logger.warning(describe_drift(report))
+    else:
+        logger.info(describe_drift(report))
+
+    report_path = get_drift_report_path(save_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report.to_csv(report_path, index=False)
+    return report
+
+
+def predict_from_csv(
+    model_path: Path,
+    data_path: Path,
+    save_path: Path,
+    progress: ProgressCallback | None = None,
+    cache_path: Path | None = None,
+    explain_top_k: int = 0,
+    save_results: bool = False,
+) -> None:
+    """
+    Predict the raw data with the model and save the predictions as CSV.
+
+    Parameters:
+        model_path: Path
+            Path to the model saved as a JSON file
+        data_path: Path
+            Path to the raw data to predict
+        save_path: Path
+            Path to save the predictions to
+        progress: ProgressCallback | None
+            Called with the progress before each stage
+        cache_path: Path | None
+            Prediction cache, see `model.prediction_cache`.
+            Only the rows missing from the cache are predicted.
+        explain_top_k: int
+            Number of the most contributing features written next to
+            each prediction, see `model.explain`. None if 0.
+        save_results: bool
+            Also save the predictions joined with the patient IDs and the
+            diagnoses to the results directory next to the predictions,
+            for the results viewer, see `model.results`
+
+    If the sketch of the training data is saved next to the model, the
+    data are compared with it and the drift report is saved next to the
+    predictions, see `report_drift`.
+    """
+    report_progress(progress, "Loading model", 0)
+    logger.info(f"Predicting data using model: {model_path}")
+    model = load_model(model_path)
+    reference_sketch = load_sketch(model_path)
+
+    if cache_path is None:
+        predict_file(
+            model,
+            data_path,
+            save_path,
+            progress,
+            explain_top_k=explain_top_k,
+            reference_sketch=reference_sketch,
+            save_results=save_results,
+        )
+        return
+
+    with PredictionCache(cache_path, model_fingerprint(model)) as cache:
+        predict_file(
+            model,
+            data_path,
+            save_path,
+            progress,
+            cache,
+            explain_top_k,
+            reference_sketch,
+            save_results,
+        )
+        logger.info(f"Prediction cache statistics: {cache.stats()}")
+
+
+def predict_file(
+    model: xgb.XGBClassifier,
+    data_path: Path,
+    save_path: Path,
+    progress: ProgressCallback | None = None,
+    cache: PredictionCache | None = None,
+    explain_top_k: int = 0,
+    reference_sketch: DataSketch | None = None,
+    save_results: bool = False,
+) -> np.ndarray:
+    """
+    Predict the raw data with the loaded model and save the predictions
+    (and the results for the viewer if `save_results`) as
+    `predict_from_csv` does. If the cache is given, only the rows
+    missing from it are predicted by the model. The cache is not used
+    if the contributions are computed (`explain_top_k` > 0), they are
+    not cached. If the sketch of the training data is given, the data
+    are checked for drift before the prediction.
+
+    Returns:
+        np.ndarray
+            Predicted classes
+    """
+    report_progress(progress, "Reading data", 0.1)
+    data = read_data(data_path)
+
+    report_progress(progress, "Preprocessing data", 0.3)
+    logger.info("Preprocessing data")
+    sketch = DataSketch() if reference_sketch is not None else None
+    data, ids = prepare_features(data, sketch=sketch)
+    logger.info("Data preprocessed successfully")
+
+    if reference_sketch is not None:
+        assert sketch is not None
+        report_drift(reference_sketch, sketch, save_path)
+
+    report_progress(progress, "Predicting data", 0.6)
+    logger.info("Predicting data")
+    contributions = None
+    if explain_top_k > 0:
+        probabilities, contributions = predict_proba_with_contributions(
+            model, data, explain_top_k
+        )
+    elif cache is not None:
+        probabilities = cache.predict_proba(model, data)
+    else:
+        probabilities = predict_proba(model, data)
+    predictions = (probabilities > PREDICTION_THRESHOLD).astype(int)
+    logger.info("Data predicted successfully")
+
+    report_progress(progress, "Saving predictions", 0.8)
+    logger.info(f"Saving predictions to: {save_path}")
+    predictions_df = pd.DataFrame(predictions, columns=["prediction"])
+    if contributions is not None:
+        predictions_df = pd.concat([predictions_df, contributions], axis=1)
+
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_stage("write_csv", rows=len(predictions_df)):
+        predictions_df.to_csv(save_path, index=False)
+
+    if save_results:
+        # Save the predictions joined with the IDs for the results viewer
+        write_results(
+            get_results_dir(save_path),
+            ids,
+            data,
+            probabilities,
+            PREDICTION_THRESHOLD,
+        )
+
+    logger.info("Predictions saved successfully")
+
+    return predictions
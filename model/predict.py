@@ -0,0 +1,107 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from data_preparation import drop_id_from_data, preprocess_data
+from data_preparation.drift import DataSketch
+from lib import DATA_COLUMNS as DC
+from lib.timing import log_stage
+from model.hyperparams import get_xgbc_hyperparams
+
+logger = logging.getLogger(__name__)
+
+# Probability above which a record is predicted as positive,
+# the same as in `xgb.XGBClassifier.predict`
+PREDICTION_THRESHOLD = 0.5
+
+
+def load_model(model_path: Path) -> xgb.XGBClassifier:
+    """
+    Load the model saved at the given path.
+
+    Parameters:
+        model_path: Path
+            Path to the model saved as a JSON file
+
+    Returns:
+        xgb.XGBClassifier
+            Loaded model
+    """
+    with log_stage("load_model"):
+        model = xgb.XGBClassifier(**get_xgbc_hyperparams())
+        model.load_model(model_path)
+    return model
+
+
+def prepare_features(
+    data: pd.DataFrame,
+    fill_year: int | None = None,
+    sketch: DataSketch | None = None,
+) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Preprocess raw data to the features the model is predicting from.
+
+    Parameters:
+        data: pd.DataFrame
+            Raw data to predict
+        fill_year: int | None
+            Year of the missing dates, see `preprocess_data`
+        sketch: DataSketch | None
+            Updated with the counts of the data, see `preprocess_data`
+
+    Returns:
+        tuple[pd.DataFrame, pd.Series]
+            Features without the ID and target columns, and the ID column
+    """
+    with log_stage("preprocess", rows=len(data)):
+        data = preprocess_data(data, fill_year=fill_year, sketch=sketch)
+        data, ids = drop_id_from_data(data)
+
+    assert hasattr(DC, "target")
+    if DC.target in data.columns:
+        logger.warning(
+            f"Data contains target column '{DC.target}', dropping it"
+        )
+        data = data.drop(DC.target, axis=1)
+
+    return data, ids
+
+
+def predict(model: xgb.XGBClassifier, data: pd.DataFrame) -> np.ndarray:
+    """
+    Predict the preprocessed data.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        data: pd.DataFrame
+            Features returned by `prepare_features`
+
+    Returns:
+        np.ndarray
+            Predicted classes
+    """
+    with log_stage("predict", rows=len(data)):
+        return np.asarray(model.predict(data))
+
+
+def predict_proba(model: xgb.XGBClassifier, data: pd.DataFrame) -> np.ndarray:
+    """
+    Predict the probability of the positive class of the preprocessed data.
+    Classes are `probabilities > PREDICTION_THRESHOLD`.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        data: pd.DataFrame
+            Features returned by `prepare_features`
+
+    Returns:
+        np.ndarray
+            Probability of the positive class of each row
+    """
+    with log_stage("predict_proba", rows=len(data)):
+        return np.asarray(model.predict_proba(data)[:, 1])
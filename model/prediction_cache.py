@@ -0,0 +1,263 @@
+"""
+Persistent cache of the predictions of the preprocessed rows.
+
+Successive extracts repeat most of the rows, so the probabilities are
+cached by a hash of the preprocessed feature row. Only the rows missing
+from the cache are predicted by the model. The cache belongs to one model,
+it is cleared when it is opened with another model or when the hashing of
+the rows changes (`FINGERPRINT_VERSION`). The least recently used rows
+are evicted when the cache is larger than its limit.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from lib.record_store import insert_chunk_rows
+from lib.timing import log_stage
+from model.predict import PREDICTION_THRESHOLD, predict_proba
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = "prediction_cache.sqlite"
+# Maximum number of cached rows
+MAX_ROWS = 5_000_000
+# Increase when `row_fingerprints` changes, the cache is cleared
+FINGERPRINT_VERSION = 2
+# Dtype the features are hashed as, independent of the compacted dtypes
+FINGERPRINT_DTYPE = np.dtype(np.float64)
+
+
+def model_fingerprint(model: xgb.XGBClassifier) -> str:
+    """Return the SHA-256 hash of the trees and the parameters of the model"""
+    raw = model.get_booster().save_raw(raw_format="json")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def row_fingerprints(features: pd.DataFrame) -> np.ndarray:
+    """
+    Return a 64-bit hash of each row of the features. The values are hashed
+    as `FINGERPRINT_DTYPE`, so the hash does not depend on the dtypes of the
+    columns, and the hash includes the names and the order of the columns.
+    """
+    hashes = np.asarray(
+        pd.util.hash_pandas_object(
+            features.astype(FINGERPRINT_DTYPE), index=False
+        ),
+        dtype=np.uint64,
+    )
+    columns_hash = hashlib.sha256(
+        "\0".join(map(str, features.columns)).encode("utf-8")
+    ).digest()
+    hashes ^= np.frombuffer(columns_hash[:8], dtype=np.uint64)[0]
+    # SQLite integers are signed
+    return hashes.view(np.int64)
+
+
+class PredictionCache:
+    """
+    Cache of the probabilities of one model in a SQLite database.
+
+    Parameters:
+        db_path: Path
+            Path to the database, created if it does not exist
+        model_hash: str
+            Fingerprint of the model, see `model_fingerprint`
+        max_rows: int
+            Maximum number of cached rows
+    """
+
+    def __init__(
+        self, db_path: Path, model_hash: str, max_rows: int = MAX_ROWS
+    ):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta"
+                " (key TEXT PRIMARY KEY, value) WITHOUT ROWID"
+            )
+            # `last_used` is the number of the call that used the row last
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " row_hash INTEGER PRIMARY KEY, probability REAL NOT NULL,"
+                " prediction INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_predictions_last_used"
+                " ON predictions (last_used)"
+            )
+
+        if (
+            self._get_meta("model_hash") != model_hash
+            or self._get_meta("fingerprint_version") != FINGERPRINT_VERSION
+        ):
+            if self._get_meta("model_hash") is not None:
+                logger.info(
+                    "Model or row hashing changed, clearing the prediction"
+                    f" cache {db_path}"
+                )
+            with self.connection:
+                self.connection.execute("DELETE FROM predictions")
+                self.connection.execute("DELETE FROM meta")
+                self._set_meta("model_hash", model_hash)
+                self._set_meta("fingerprint_version", FINGERPRINT_VERSION)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "PredictionCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _get_meta(self, key: str, default=None):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+        )
+
+    def __len__(self) -> int:
+        return int(
+            self.connection.execute(
+                "SELECT COUNT(*) FROM predictions"
+            ).fetchone()[0]
+        )
+
+    def stats(self) -> dict:
+        """Return the number of cached rows, hits, misses and the hit rate"""
+        hits = self._get_meta("hits", 0)
+        misses = self._get_meta("misses", 0)
+        return {
+            "rows": len(self),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def _lookup(self, hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the cached probabilities of the sorted unique hashes,
+        and the mask of the found hashes.
+        """
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS lookup"
+            " (row_hash INTEGER PRIMARY KEY)"
+        )
+        self.connection.execute("DELETE FROM lookup")
+        chunk_rows = insert_chunk_rows()
+        for start in range(0, len(hashes), chunk_rows):
+            self.connection.executemany(
+                "INSERT INTO lookup VALUES (?)",
+                ((h,) for h in hashes[start : start + chunk_rows].tolist()),
+            )
+        found_rows = self.connection.execute(
+            "SELECT p.row_hash, p.probability FROM predictions AS p"
+            " JOIN lookup AS l ON p.row_hash = l.row_hash"
+        ).fetchall()
+
+        probabilities = np.full(len(hashes), np.nan)
+        found = np.zeros(len(hashes), dtype=bool)
+        if found_rows:
+            found_hashes, found_probabilities = zip(*found_rows)
+            positions = np.searchsorted(hashes, found_hashes)
+            probabilities[positions] = found_probabilities
+            found[positions] = True
+        return probabilities, found
+
+    def predict_proba(
+        self, model: xgb.XGBClassifier, features: pd.DataFrame
+    ) -> np.ndarray:
+        """
+        Predict the probability of the positive class as
+        `model.predict.predict_proba`, predicting only the rows that are
+        not cached (each distinct row once) and caching them.
+
+        Parameters:
+            model: xgb.XGBClassifier
+                Model the cache belongs to
+            features: pd.DataFrame
+                Features returned by `prepare_features`
+
+        Returns:
+            np.ndarray
+                Probability of the positive class of each row
+        """
+        with log_stage("prediction_cache_lookup", rows=len(features)):
+            hashes, first_rows, inverse = np.unique(
+                row_fingerprints(features),
+                return_index=True,
+                return_inverse=True,
+            )
+            with self.connection:
+                probabilities, found = self._lookup(hashes)
+
+        missing = np.flatnonzero(~found)
+        if len(missing) > 0:
+            probabilities[missing] = predict_proba(
+                model, features.iloc[first_rows[missing]]
+            )
+
+        hits = int(found[inverse].sum())
+        misses = len(features) - hits
+        with log_stage("prediction_cache_update", rows=len(missing)):
+            with self.connection:
+                call = self._get_meta("calls", 0) + 1
+                self.connection.execute(
+                    "UPDATE predictions SET last_used = ? WHERE row_hash IN"
+                    " (SELECT row_hash FROM lookup)",
+                    (call,),
+                )
+                chunk_rows = insert_chunk_rows()
+                for start in range(0, len(missing), chunk_rows):
+                    chunk = missing[start : start + chunk_rows]
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO predictions VALUES"
+                        " (?, ?, ?, ?)",
+                        zip(
+                            hashes[chunk].tolist(),
+                            probabilities[chunk].tolist(),
+                            (
+                                probabilities[chunk] > PREDICTION_THRESHOLD
+                            ).astype(int).tolist(),
+                            [call] * len(chunk),
+                        ),
+                    )
+                self._set_meta("calls", call)
+                for key, count in (("hits", hits), ("misses", misses)):
+                    self._set_meta(key, self._get_meta(key, 0) + count)
+                self._evict()
+
+        logger.info(
+            f"Prediction cache: {hits} hits, {misses} misses"
+            f" ({hits / max(len(features), 1):.1%} hit rate),"
+            f" predicted {len(missing)} distinct rows"
+        )
+        return probabilities[inverse]
+
+    def _evict(self) -> None:
+        """Delete the least recently used rows over the limit"""
+        n_over = len(self) - self.max_rows
+        if n_over > 0:
+            self.connection.execute(
+                "DELETE FROM predictions WHERE row_hash IN"
+                " (SELECT row_hash FROM predictions"
+                " ORDER BY last_used LIMIT ?)",
+                (n_over,),
+            )
+            logger.info(f"Evicted {n_over} rows from the prediction cache")
@@ -0,0 +1,182 @@
+"""
+On-disk store of prediction results.
+
+Each column of the results is saved as a `.npy` file in the results
+directory, with `meta.json` describing the columns. The columns are opened
+memory-mapped, so viewing, filtering and sorting the results reads only
+the needed pages instead of loading the whole file.
+"""
+
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_preparation.preprocess_data import number_to_diagnosis
+from lib import DATA_COLUMNS as DC
+from lib.timing import log_stage
+
+META_FILE_NAME = "meta.json"
+PREDICTION_COL = "prediction"
+PROBABILITY_COL = "probability"
+
+assert hasattr(DC, "patient_id")
+assert hasattr(DC, "lpz_diagnosis")
+assert hasattr(DC, "nor_diagnosis")
+assert hasattr(DC, "year")
+
+# Columns of the results in the order they are shown
+RESULT_COLUMNS = [
+    DC.patient_id,
+    DC.lpz_diagnosis,
+    DC.nor_diagnosis,
+    DC.year,
+    PREDICTION_COL,
+    PROBABILITY_COL,
+]
+# Columns stored as numbers created by `diagnosis_to_number`
+DIAGNOSIS_COLUMNS = [DC.lpz_diagnosis, DC.nor_diagnosis]
+
+
+def get_results_dir(save_path: Path) -> Path:
+    """Return the results directory stored next to the predictions CSV"""
+    return save_path.with_suffix(".results")
+
+
+def _to_storable(values: pd.Series) -> np.ndarray:
+    """Convert the column to an array that can be memory-mapped"""
+    array = np.asarray(values.to_numpy())
+    if array.dtype == object:
+        # Fixed-width strings instead of Python objects
+        return array.astype(str)
+    if np.issubdtype(array.dtype, np.floating) and np.all(
+        np.mod(array, 1) == 0
+    ):
+        # IDs read with missing values are floats
+        return array.astype(np.int64)
+    return array
+
+
+def write_results(
+    results_dir: Path,
+    ids: pd.Series,
+    features: pd.DataFrame,
+    probabilities: np.ndarray,
+    threshold: float,
+) -> None:
+    """
+    Save the predictions joined with the patient IDs and the diagnoses.
+
+    Parameters:
+        results_dir: Path
+            Directory to save the results to
+        ids: pd.Series
+            Patient IDs of the predicted rows
+        features: pd.DataFrame
+            Preprocessed features of the predicted rows
+        probabilities: np.ndarray
+            Predicted probabilities of the positive class
+        threshold: float
+            Probability above which a row is predicted as positive
+    """
+    assert hasattr(DC, "patient_id")
+    assert hasattr(DC, "lpz_diagnosis")
+    assert hasattr(DC, "nor_diagnosis")
+    assert hasattr(DC, "year")
+
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    columns = {
+        DC.patient_id: _to_storable(ids),
+        DC.lpz_diagnosis: features[DC.lpz_diagnosis].to_numpy(np.int16),
+        DC.nor_diagnosis: features[DC.nor_diagnosis].to_numpy(np.int16),
+        DC.year: features[DC.year].to_numpy(np.int16),
+        PREDICTION_COL: (probabilities > threshold).astype(np.int8),
+        PROBABILITY_COL: probabilities.astype(np.float32),
+    }
+
+    with log_stage("write_results", rows=len(ids)):
+        files = {}
+        for i, (name, values) in enumerate(columns.items()):
+            files[name] = f"{i}.npy"
+            np.save(Path(results_dir, files[name]), values)
+
+        with open(Path(results_dir, META_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "rows": len(ids),
+                    "threshold": threshold,
+                    "files": files,
+                },
+                f,
+                indent=2,
+            )
+
+
+class ResultsStore:
+    """
+    Read-only view of the results saved by `write_results`.
+    Columns are memory-mapped and only the requested rows are read.
+
+    Parameters:
+        results_dir: Path
+            Directory with the results
+    """
+
+    def __init__(self, results_dir: Path):
+        with open(Path(results_dir, META_FILE_NAME), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.columns: dict[str, np.ndarray] = {
+            name: np.load(Path(results_dir, file_name), mmap_mode="r")
+            for name, file_name in self.meta["files"].items()
+        }
+
+    def __len__(self) -> int:
+        return int(self.meta["rows"])
+
+    def select(
+        self, positive_only: bool = False, sort_by_probability: bool = False
+    ) -> np.ndarray:
+        """
+        Return the indices of the rows to show.
+
+        Parameters:
+            positive_only: bool
+                Only the rows predicted as positive
+            sort_by_probability: bool
+                Sort the rows by the probability, the highest first
+
+        Returns:
+            np.ndarray
+                Row indices in the order to show
+        """
+        if positive_only:
+            indices = np.flatnonzero(self.columns[PREDICTION_COL])
+        else:
+            indices = np.arange(len(self))
+
+        if sort_by_probability:
+            probabilities = self.columns[PROBABILITY_COL][indices]
+            indices = indices[np.argsort(-probabilities, kind="stable")]
+
+        return indices
+
+    def rows(self, indices: np.ndarray) -> list[tuple]:
+        """
+        Return the rows at the indices formatted for showing.
+        Diagnoses are transformed back to the ICD-10 codes.
+        """
+        formatted: dict[str, list] = {}
+        for name in RESULT_COLUMNS:
+            values = self.columns[name][indices].tolist()
+            if name in DIAGNOSIS_COLUMNS:
+                values = [number_to_diagnosis(value) or "" for value in values]
+            elif name == PROBABILITY_COL:
+                values = [f"{value:.4f}" for value in values]
+            formatted[name] = values
+
+        return list(zip(*formatted.values()))
@@ -0,0 +1,179 @@
+"""
+Shadow scoring of one extract with several models.
+
+The extract is read and preprocessed once and converted to one feature
+array. The models score the array in parallel threads with
+`Booster.inplace_predict` (XGBoost releases the GIL while predicting), so
+shadowing a candidate model against the production model costs only the
+extra prediction. The latency of each model is measured while the other
+models are predicting, it is the latency under concurrent load.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from lib import DATA_COLUMNS as DC
+from lib.runtime_config import get_runtime_config
+from model.pipeline import ProgressCallback, read_data, report_progress
+from model.predict import PREDICTION_THRESHOLD, load_model, prepare_features
+
+logger = logging.getLogger(__name__)
+
+PREDICTIONS_FILE_NAME = "predictions.csv"
+SUMMARY_FILE_NAME = "summary.csv"
+
+
+def get_model_names(model_paths: list[Path]) -> list[str]:
+    """
+    Return the names of the models used in the output columns,
+    the file names without the suffix, numbered if not unique.
+    """
+    stems = [path.stem for path in model_paths]
+    if len(set(stems)) == len(stems):
+        return stems
+    return [f"{i}_{stem}" for i, stem in enumerate(stems)]
+
+
+def _check_feature_names(
+    model: xgb.XGBClassifier, path: Path, features: pd.DataFrame
+) -> None:
+    """
+    Check the model was trained on the features, the array passed to
+    `inplace_predict` has no column names to validate.
+    """
+    feature_names = model.get_booster().feature_names
+    if feature_names is not None and feature_names != list(features.columns):
+        raise ValueError(
+            f"Model {path} was trained on other features: {feature_names}"
+        )
+
+
+def _score(
+    model: xgb.XGBClassifier, matrix: np.ndarray
+) -> tuple[np.ndarray, float]:
+    """
+    Predict the probabilities of the positive class of the feature array
+    and measure the latency
+    """
+    start = time.perf_counter()
+    probabilities = np.asarray(
+        model.get_booster().inplace_predict(matrix, missing=model.missing)
+    )
+    return probabilities, time.perf_counter() - start
+
+
+def shadow_score(
+    model_paths: list[Path],
+    data_path: Path,
+    output_dir: Path,
+    progress: ProgressCallback | None = None,
+) -> pd.DataFrame:
+    """
+    Score the raw data with all the models and save the side-by-side
+    predictions and the summary to the output directory.
+    The first model is the reference (e.g., the production model)
+    the others are compared with.
+
+    Parameters:
+        model_paths: list[Path]
+            Paths to the models saved as JSON files, the reference first
+        data_path: Path
+            Path to the raw data to predict
+        output_dir: Path
+            Directory to save the predictions and the summary to
+        progress: ProgressCallback | None
+            Called with the progress before each stage
+
+    Returns:
+        pd.DataFrame
+            Summary with the latency under concurrent load, the positive
+            predictions and the agreement with the reference model of each
+            model
+    """
+    if not model_paths:
+        raise ValueError("No models to score with")
+
+    names = get_model_names(model_paths)
+
+    report_progress(progress, f"Loading {len(model_paths)} models", 0)
+    models = [load_model(path) for path in model_paths]
+    # The models predict in parallel, split the threads between them
+    n_threads = get_runtime_config().threads_per_worker(len(models))
+    for model in models:
+        model.set_params(n_jobs=n_threads)
+
+    report_progress(progress, "Reading data", 0.1)
+    data = read_data(data_path)
+
+    report_progress(progress, "Preprocessing data", 0.3)
+    features, ids = prepare_features(data)
+    for model, path in zip(models, model_paths):
+        _check_feature_names(model, path, features)
+    # Converted once, all the models score the same array
+    matrix = np.ascontiguousarray(features.to_numpy(dtype=np.float32))
+
+    report_progress(progress, f"Scoring with {len(models)} models", 0.5)
+    logger.info(
+        f"Scoring {len(features)} rows with {len(models)} models:"
+        f" {', '.join(names)}"
+    )
+    # All the threads read the same array, none of them modifies it
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        results = list(
+            executor.map(lambda model: _score(model, matrix), models)
+        )
+
+    report_progress(progress, "Saving predictions", 0.9)
+    assert hasattr(DC, "patient_id")
+    predictions_df = pd.DataFrame({DC.patient_id: ids.to_numpy()})
+    summaries = []
+    reference_probabilities = results[0][0]
+    reference = reference_probabilities > PREDICTION_THRESHOLD
+    for name, path, (probabilities, seconds) in zip(
+        names, model_paths, results
+    ):
+        predictions = probabilities > PREDICTION_THRESHOLD
+        predictions_df[f"{name}_probability"] = probabilities
+        predictions_df[f"{name}_prediction"] = predictions.astype(int)
+        summaries.append(
+            {
+                "model": name,
+                "path": str(path),
+                "rows": len(predictions),
+                # Measured while all the models are predicting
+                "concurrent_seconds": seconds,
+                "concurrent_rows_per_s": (
+                    len(predictions) / seconds if seconds else 0
+                ),
+                "positive": int(predictions.sum()),
+                "agree": int((predictions == reference).sum()),
+                "disagree": int((predictions != reference).sum()),
+                # Positive only by this model, or only by the reference
+                "only_positive": int((predictions & ~reference).sum()),
+                "only_reference_positive": int(
+                    (~predictions & reference).sum()
+                ),
+                "mean_abs_probability_diff": float(
+                    np.abs(probabilities - reference_probabilities).mean()
+                ),
+            }
+        )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    predictions_df.to_csv(Path(output_dir, PREDICTIONS_FILE_NAME), index=False)
+    summary_df = pd.DataFrame(summaries)
+    summary_df.to_csv(Path(output_dir, SUMMARY_FILE_NAME), index=False)
+
+    logger.info(
+        f"Shadow scoring of {data_path} (reference: {names[0]}):\n"
+        + summary_df.drop(columns="path").to_string(index=False)
+    )
+    report_progress(progress, "Done", 1)
+
+    return summary_df
@@ -0,0 +1,356 @@
+"""
+Pipelined streaming prediction of large CSV files.
+
+The steps run at the same time on consecutive chunks of the file:
+  1. a reader thread parses the chunks of the CSV file,
+  2. worker processes preprocess the chunks,
+  3. the main thread scores the preprocessed chunks with the booster,
+  4. a writer thread appends the predictions to the output file.
+The steps are connected by bounded queues, so a slow step blocks the steps
+before it (backpressure) and at most a fixed number of chunks is held in
+memory. The chunks are scored and written in the order they were read.
+
+The results are the same as of `predict_file`:
+  - Patient IDs and LPZ diagnoses are forward filled across the chunks.
+  - Missing dates are filled with the fill year of the whole file, found by
+    a scan of the date column before the prediction (see `scan_fill_year`).
+Only the predictions CSV is written, not the results for the viewer.
+The sketches of the chunks (see `data_preparation.drift`) are merged and
+compared with the sketch of the training data, if given.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import xgboost as xgb
+
+from data_preparation.drift import DataSketch
+from lib import DATA_COLUMNS as DC
+from lib.runtime_config import get_runtime_config
+from lib.timing import log_stage
+from lib.worker_logging import init_worker_logging, worker_log_queue
+from model.pipeline import load_sketch, report_drift
+from model.predict import (
+    PREDICTION_THRESHOLD,
+    load_model,
+    predict_proba,
+    prepare_features,
+)
+
+logger = logging.getLogger(__name__)
+
+# Chunks waiting between the reader and the workers, and between the
+# scoring and the writer
+QUEUE_CHUNKS = 2
+# Estimated memory of a row in the pipeline: the raw strings, the
+# preprocessed copies and the pickled copy sent to a worker
+ROW_BYTES = 1024
+# Read as text in every chunk, a chunk with only missing values would be
+# read as floats otherwise
+assert hasattr(DC, "lpz_diagnosis")
+assert hasattr(DC, "nor_diagnosis")
+assert hasattr(DC, "target")
+TEXT_COLUMNS = {DC.lpz_diagnosis: str, DC.nor_diagnosis: str, DC.target: str}
+# Interval of checking whether the pipeline was stopped
+_POLL_S = 0.1
+
+# Marks the end of the chunks in a queue
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Raised in a step of the pipeline when another step failed"""
+
+
+def _put(q: queue.Queue, item: object, stop: threading.Event) -> None:
+    """Put the item to the queue, wait while the queue is full"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_S)
+            return
+        except queue.Full:
+            continue
+    raise PipelineStopped()
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> object:
+    """Get an item from the queue, wait while the queue is empty"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_S)
+        except queue.Empty:
+            continue
+    raise PipelineStopped()
+
+
+def scan_fill_year(data_path: Path, chunk_rows: int) -> int:
+    """
+    Return the year of the missing dates of the whole file (10 years before
+    the minimum year), reading only the date column in chunks.
+    """
+    assert hasattr(DC, "date_of_diagnosis")
+
+    min_year = None
+    with log_stage("scan_fill_year") as stage:
+        stage.rows = 0
+        with pd.read_csv(
+            data_path, usecols=[DC.date_of_diagnosis], chunksize=chunk_rows
+        ) as reader:
+            for chunk in reader:
+                years = pd.to_datetime(
+                    chunk[DC.date_of_diagnosis], errors="coerce"
+                ).dt.year
+                if years.notna().any() and (
+                    min_year is None or years.min() < min_year
+                ):
+                    min_year = int(years.min())
+                stage.rows += len(chunk)
+
+    if min_year is None:
+        raise ValueError(f"No valid date of diagnosis in {data_path}")
+    return min_year - 10
+
+
+def _carry_forward(chunk: pd.DataFrame, carry: dict) -> pd.DataFrame:
+    """
+    Fill the leading missing IDs and LPZ diagnoses of the chunk with the
+    last values of the previous chunks, as `forward_fill_ids` would fill
+    them in the whole file. The carried values are updated.
+    """
+    assert hasattr(DC, "patient_id")
+    assert hasattr(DC, "lpz_diagnosis")
+
+    for col in (DC.patient_id, DC.lpz_diagnosis):
+        filled = chunk[col].ffill()
+        if col in carry:
+            chunk[col] = chunk[col].where(filled.notna(), carry[col])
+        if len(filled) > 0 and pd.notna(filled.iloc[-1]):
+            carry[col] = filled.iloc[-1]
+    return chunk
+
+
+def iter_chunks(data_path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the CSV file in chunks ready to be preprocessed one by one:
+    the IDs and LPZ diagnoses are forward filled across the chunks.
+    The chunks are the same for the same file and `chunk_rows`.
+    """
+    carry: dict = {}
+    with pd.read_csv(
+        data_path, dtype=TEXT_COLUMNS, chunksize=chunk_rows
+    ) as reader:
+        for chunk in reader:
+            yield _carry_forward(chunk, carry)
+
+
+def _read_chunks(
+    data_path: Path,
+    chunk_rows: int,
+    out: queue.Queue,
+    stop: threading.Event,
+) -> None:
+    """Read the chunks of the CSV file to the queue (reader thread)"""
+    try:
+        for chunk in iter_chunks(data_path, chunk_rows):
+            _put(out, chunk, stop)
+        _put(out, _DONE, stop)
+    except PipelineStopped:
+        pass
+    except BaseException as e:
+        # Re-raised by the main thread
+        try:
+            _put(out, e, stop)
+        except PipelineStopped:
+            pass
+
+
+def _write_predictions(
+    save_path: Path,
+    results: queue.Queue,
+    stop: threading.Event,
+    errors: list,
+) -> None:
+    """Append the predicted chunks to the CSV file (writer thread)"""
+    try:
+        header = True
+        # The same line endings as `DataFrame.to_csv` to a path
+        with open(save_path, "w", encoding="utf-8", newline="") as f:
+            while (predictions := _get(results, stop)) is not _DONE:
+                assert isinstance(predictions, pd.DataFrame)
+                predictions.to_csv(f, header=header, index=False)
+                header = False
+    except PipelineStopped:
+        pass
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+
+
+def _prepare_chunk(
+    chunk: pd.DataFrame, fill_year: int
+) -> tuple[pd.DataFrame, DataSketch]:
+    """Preprocess the chunk to the features (worker process)"""
+    sketch = DataSketch()
+    features, _ = prepare_features(chunk, fill_year=fill_year, sketch=sketch)
+    return features, sketch
+
+
+def stream_predict(
+    model: xgb.XGBClassifier,
+    data_path: Path,
+    save_path: Path,
+    chunk_rows: int | None = None,
+    workers: int | None = None,
+    fill_year: int | None = None,
+    reference_sketch: DataSketch | None = None,
+) -> int:
+    """
+    Predict the raw data in a pipeline of chunks and save the predictions
+    as CSV, the same file as `predict_file` saves. The file is written to
+    a temporary file first and renamed when all the chunks are written.
+
+    Parameters:
+        model: xgb.XGBClassifier
+            Trained model
+        data_path: Path
+            Path to the raw data to predict
+        save_path: Path
+            Path to save the predictions to
+        chunk_rows: int | None
+            Number of rows of a chunk. If None, the chunks are sized so that
+            all the chunks in the pipeline fit the memory budget of
+            `lib.runtime_config`.
+        workers: int | None
+            Number of preprocessing processes, from `lib.runtime_config`
+            if None
+        fill_year: int | None
+            Year of the missing dates, scanned from the file if None
+        reference_sketch: DataSketch | None
+            Sketch of the training data, the data are checked for drift
+            when all the chunks are predicted
+
+    Returns:
+        int
+            Number of predicted rows
+    """
+    config = get_runtime_config()
+    workers = workers or config.workers
+    # Chunks held at once: in the queues, in the workers, being read,
+    # scored and written
+    max_chunks = 2 * QUEUE_CHUNKS + workers + 3
+    if chunk_rows is None:
+        chunk_rows = config.chunk_rows(ROW_BYTES, max_chunks)
+    if fill_year is None:
+        fill_year = scan_fill_year(data_path, chunk_rows)
+
+    logger.info(
+        f"Streaming prediction of {data_path} in chunks of {chunk_rows} rows"
+        f" with {workers} workers (at most {max_chunks} chunks in memory)"
+    )
+
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = save_path.with_name(save_path.name + ".tmp")
+
+    stop = threading.Event()
+    raw_chunks: queue.Queue = queue.Queue(QUEUE_CHUNKS)
+    results: queue.Queue = queue.Queue(QUEUE_CHUNKS)
+    errors: list = []
+    reader = threading.Thread(
+        target=_read_chunks,
+        args=(data_path, chunk_rows, raw_chunks, stop),
+        name="stream-reader",
+        daemon=True,
+    )
+    writer = threading.Thread(
+        target=_write_predictions,
+        args=(tmp_path, results, stop, errors),
+        name="stream-writer",
+        daemon=True,
+    )
+
+    rows = 0
+    sketch = DataSketch()
+    start = time.perf_counter()
+    with worker_log_queue() as (log_queue, log_level):
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker_logging,
+            initargs=(log_queue, log_level),
+        )
+        try:
+            reader.start()
+            writer.start()
+            in_flight: deque = deque()
+            reading = True
+            while reading or in_flight:
+                if reading and len(in_flight) < workers:
+                    chunk = _get(raw_chunks, stop)
+                    if isinstance(chunk, BaseException):
+                        raise chunk
+                    if chunk is _DONE:
+                        reading = False
+                    else:
+                        in_flight.append(
+                            executor.submit(_prepare_chunk, chunk, fill_year)
+                        )
+                    continue
+
+                # The oldest chunk first, to keep the order of the rows
+                features, chunk_sketch = in_flight.popleft().result()
+                sketch.merge(chunk_sketch)
+                probabilities = predict_proba(model, features)
+                predictions = pd.DataFrame(
+                    (probabilities > PREDICTION_THRESHOLD).astype(int),
+                    columns=["prediction"],
+                )
+                _put(results, predictions, stop)
+                rows += len(predictions)
+
+            _put(results, _DONE, stop)
+            writer.join()
+            if errors:
+                raise errors[0]
+        except BaseException as e:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            tmp_path.unlink(missing_ok=True)
+            if isinstance(e, PipelineStopped) and errors:
+                raise errors[0] from None
+            raise
+        executor.shutdown()
+
+    os.replace(tmp_path, save_path)
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"Streamed {rows} rows to {save_path} in {seconds:.1f} s"
+        f" ({rows / max(seconds, 1e-9):,.0f} rows/s)"
+    )
+    if reference_sketch is not None:
+        report_drift(reference_sketch, sketch, save_path)
+    return rows
+
+
+def stream_predict_from_csv(
+    model_path: Path,
+    data_path: Path,
+    save_path: Path,
+    chunk_rows: int | None = None,
+) -> int:
+    """Load the model and run `stream_predict`"""
+    logger.info(f"Predicting data using model: {model_path}")
+    model = load_model(model_path)
+    return stream_predict(
+        model,
+        data_path,
+        save_path,
+        chunk_rows,
+        reference_sketch=load_sketch(model_path),
+    )
@@ -4,6 +4,7 @@ import pandas as pd
 import xgboost as xgb
 
 from lib import DATA_COLUMNS as DC
+from lib.timing import log_stage
 from model.hyperparams import get_xgbc_hyperparams
 
 
@@ -23,6 +24,24 @@ def train(data: pd.DataFrame) -> xgb.XGBClassifier:
     assert hasattr(DC, "target")
 
     X, y = data.drop(DC.target, axis=1), data[DC.target]
+    return fit_model(X, y)
+
+
+def fit_model(X: pd.DataFrame, y: pd.Series) -> xgb.XGBClassifier:
+    """
+    Train the model with the features and the target.
+
+    Parameters:
+        X: pd.DataFrame
+            Features of the preprocessed data
+        y: pd.Series
+            Target of the preprocessed data
+
+    Returns:
+        xgb.XGBClassifier
+            Trained model
+    """
     model = xgb.XGBClassifier(**get_xgbc_hyperparams())
-    model.fit(X, y)
+    with log_stage("fit", rows=len(X)):
+        model.fit(X, y)
     return model
@@ -0,0 +1,145 @@
+"""
+Memoization of the trained models.
+
+A trained model is stored under the fingerprint of everything it depends
+on: the preprocessed training data, the hyperparameters, the version of
+XGBoost and the training code. Training again with the same fingerprint
+copies the stored model to the save path instead of fitting. The least
+recently used models are removed above the size limit of the cache.
+"""
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import xgboost as xgb
+
+from model.hyperparams import get_xgbc_hyperparams
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path("data", "cache", "models")
+DEFAULT_MAX_CACHE_MB = 500
+MODEL_SUFFIX = ".json"
+# Modules of the training code, a change retrains the models
+TRAINING_MODULES = ("model.train", "model.hyperparams")
+
+
+def code_version() -> str:
+    """Return the hash of the source files of the training code"""
+    digest = hashlib.sha256()
+    # By name, `model.train` is the function exported by `model`
+    for name in TRAINING_MODULES:
+        module = importlib.import_module(name)
+        assert module.__file__ is not None
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def training_fingerprint(X: pd.DataFrame, y: pd.Series) -> str:
+    """
+    Return the fingerprint of training a model on the data.
+
+    Parameters:
+        X: pd.DataFrame
+            Features of the preprocessed data
+        y: pd.Series
+            Target of the preprocessed data
+
+    Returns:
+        str
+            SHA-256 of the data, the hyperparameters (without the number
+            of threads), the XGBoost version and the training code
+    """
+    hyperparams = get_xgbc_hyperparams()
+    # The number of threads (from the runtime config) does not change the
+    # trained model
+    hyperparams.pop("n_jobs", None)
+    header = {
+        "features": list(X.columns),
+        "dtypes": [str(dtype) for dtype in X.dtypes],
+        "hyperparams": hyperparams,
+        "xgboost": xgb.__version__,
+        "code": code_version(),
+    }
+    digest = hashlib.sha256(
+        json.dumps(header, sort_keys=True, default=str).encode()
+    )
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy())
+    return digest.hexdigest()
+
+
+class TrainCache:
+    """
+    Directory of the trained models named by their fingerprint.
+
+    Parameters:
+        cache_dir: Path
+            Directory of the models, created if it does not exist
+        max_mb: float
+            Size limit of the stored models in MB
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        max_mb: float = DEFAULT_MAX_CACHE_MB,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 2**20)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, fingerprint: str) -> Path:
+        return Path(self.cache_dir, fingerprint + MODEL_SUFFIX)
+
+    def get(self, fingerprint: str, save_path: Path) -> bool:
+        """
+        Copy the model stored under the fingerprint to the save path.
+
+        Returns:
+            bool
+                True if the model was found, False otherwise
+        """
+        path = self._path(fingerprint)
+        if not path.exists():
+            logger.info("Trained model not found in the cache")
+            return False
+
+        logger.info(f"Copying cached trained model {path} to {save_path}")
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        # Copied, not linked, so saving to the path later cannot
+        # overwrite the cached model
+        shutil.copyfile(path, save_path)
+        # Mark as recently used
+        os.utime(path)
+        return True
+
+    def put(self, fingerprint: str, model_path: Path) -> None:
+        """Store the saved model under the fingerprint"""
+        path = self._path(fingerprint)
+        tmp_path = path.with_suffix(".tmp")
+        shutil.copyfile(model_path, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Trained model stored in the cache as {path}")
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used models above the size limit"""
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry)
+            for entry in self.cache_dir.glob("*" + MODEL_SUFFIX)
+        )
+        total = sum(size for _, size, _ in entries)
+        # The most recent model is kept even if it is over the limit
+        for _, size, entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            logger.info(f"Removing {entry} from the trained model cache")
+            entry.unlink(missing_ok=True)
+            total -= size
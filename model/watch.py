@@ -0,0 +1,210 @@
+"""
+Scoring of new data files arriving to an inbox directory.
+
+The model is loaded once and kept in memory. The inbox is scanned
+periodically and every new or changed CSV file is predicted as soon as it
+is completely written. The hashes of the processed files are recorded, so
+no file is scored twice, even after a restart.
+"""
+
+import json
+import logging
+import os
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from lib.utils import file_hash
+from model.batch import get_output_path
+from model.pipeline import predict_file
+from model.predict import load_model
+
+logger = logging.getLogger(__name__)
+
+INBOX_DIR = Path("data", "predict", "inbox")
+OUTBOX_DIR = Path("data", "predict", "outbox")
+FAILED_DIR = Path("data", "predict", "failed")
+STATE_FILE_NAME = ".processed.json"
+# Interval of scanning the inbox in seconds
+SCAN_INTERVAL = 5.0
+
+
+class ProcessedFiles:
+    """
+    Record of the processed files by their content hash, saved as JSON.
+
+    Parameters:
+        state_path: Path
+            Path to the JSON file with the record
+    """
+
+    def __init__(self, state_path: Path):
+        self.state_path = state_path
+        self._files: dict[str, dict] = {}
+        if state_path.exists():
+            with open(state_path, encoding="utf-8") as f:
+                self._files = json.load(f)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._files
+
+    def add(self, digest: str, path: Path, status: str) -> None:
+        """Record the processed file and save the record"""
+        self._files[digest] = {
+            "file": str(path),
+            "status": status,
+            "processed": datetime.now().isoformat(timespec="seconds"),
+        }
+        # Write to a temporary file first, so the record is never corrupted
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._files, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+
+class InboxWatcher:
+    """
+    Predict new or changed CSV files in the inbox with the resident model.
+    Predictions are saved to the outbox, errors of the failed files to the
+    failed directory.
+
+    Parameters:
+        model_path: Path
+            Path to the model saved as a JSON file
+        inbox: Path
+            Directory to watch for new data files
+        outbox: Path
+            Directory to save the predictions to
+        failed_dir: Path
+            Directory to save the errors of the failed files to
+    """
+
+    def __init__(
+        self,
+        model_path: Path,
+        inbox: Path = INBOX_DIR,
+        outbox: Path = OUTBOX_DIR,
+        failed_dir: Path = FAILED_DIR,
+    ):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.failed_dir = failed_dir
+        for directory in (inbox, outbox, failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self.model = load_model(model_path)
+        self.processed = ProcessedFiles(Path(outbox, STATE_FILE_NAME))
+        # Size and modification time of the files in the previous scan
+        self._last_seen: dict[Path, tuple[int, int]] = {}
+        # Hashes of the files by their size and modification time, so the
+        # processed files left in the inbox are not read again every scan
+        self._digests: dict[Path, tuple[tuple[int, int], str]] = {}
+
+    def _stable_files(self, wait_for_writes: bool) -> list[Path]:
+        """
+        Return the CSV files in the inbox that are not being written,
+        i.e., their size and modification time did not change since the
+        previous scan. Files that cannot be accessed are skipped.
+        """
+        seen = {}
+        for path in sorted(self.inbox.glob("*.csv")):
+            try:
+                stat = path.stat()
+            except OSError as e:
+                # E.g., removed since the listing of the inbox
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+
+        if wait_for_writes:
+            stable = [
+                path
+                for path, signature in seen.items()
+                if self._last_seen.get(path) == signature
+            ]
+        else:
+            stable = list(seen)
+
+        self._last_seen = seen
+        self._digests = {
+            path: cached
+            for path, cached in self._digests.items()
+            if path in seen
+        }
+        return stable
+
+    def _file_hash(self, path: Path) -> str:
+        """Return the hash of the file, read only if it changed"""
+        signature = self._last_seen[path]
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = file_hash(path)
+        self._digests[path] = (signature, digest)
+        return digest
+
+    def scan(self, wait_for_writes: bool = True) -> int:
+        """
+        Predict the new files in the inbox.
+
+        Parameters:
+            wait_for_writes: bool
+                Process only files unchanged since the previous scan
+
+        Returns:
+            int
+                Number of processed files
+        """
+        n_processed = 0
+        for path in self._stable_files(wait_for_writes):
+            try:
+                digest = self._file_hash(path)
+            except OSError as e:
+                # E.g., locked or removed, tried again in the next scan
+                logger.warning(f"Cannot read {path}, skipping it: {e}")
+                continue
+            if digest in self.processed:
+                continue
+
+            output_path = get_output_path(path, self.outbox)
+            logger.info(f"Predicting new file {path}")
+            try:
+                predict_file(self.model, path, output_path)
+            except Exception as e:
+                logger.exception(f"Failed to predict {path}: {e}")
+                error_path = Path(self.failed_dir, f"{path.name}.error.txt")
+                error_path.write_text(traceback.format_exc(), encoding="utf-8")
+                self.processed.add(digest, path, "failed")
+            else:
+                logger.info(f"Predictions of {path} saved to {output_path}")
+                self.processed.add(digest, path, "ok")
+            n_processed += 1
+
+        return n_processed
+
+    def run(
+        self,
+        interval: float = SCAN_INTERVAL,
+        stop_event: threading.Event | None = None,
+    ) -> None:
+        """
+        Scan the inbox every `interval` seconds until the stop event is set
+        or the process is interrupted. A scan that fails on a file system
+        error is logged and the watching continues.
+        """
+        stop_event = stop_event or threading.Event()
+        logger.info(
+            f"Watching {self.inbox} every {interval} s,"
+            f" predictions are saved to {self.outbox}"
+        )
+        try:
+            while not stop_event.is_set():
+                try:
+                    self.scan()
+                except OSError as e:
+                    logger.exception(f"Scan of {self.inbox} failed: {e}")
+                stop_event.wait(interval)
+        except KeyboardInterrupt:
+            pass
+        logger.info("Stopped watching")